@@ -0,0 +1,159 @@
+import copy
+import multiprocessing
+import pickle
+import numpy as np
+from StemCellABM import BMP4 , NOG
+
+
+#Model state shared with forked workers. Under the "fork" start method every worker inherits
+#this object copy-on-write, so the equilibrated colony is never pickled or rebuilt per branch.
+_forkParent = None
+_forkCollect = None
+
+#Parameters a branch can change after the fork. The others ABM takes (num_stem_cells, max_x/max_y, the field grid and
+#solver, precision, the stop criteria, diff_timer, ...) are only read while the model is built, so they are rejected
+BRANCH_ATTRIBUTES = ("sauce" , "spawn_freq" , "endo_min" , "ecto_max" , "retire_inactive_bmp4")
+BRANCH_DOSES = {"num_BMP4" : BMP4 , "num_NOG" : NOG}
+BRANCH_PARAMS = BRANCH_ATTRIBUTES + tuple(BRANCH_DOSES) + ("binding_rate" ,)
+
+#spawn_key element under which forkRuns derives branch seeds, clear of the children ABM.reseed and DecomposedABM spawn
+BRANCH_KEY = 0xB4A2C4
+
+
+def summarize(model):
+    '''Default collection function for forkRuns
+
+        Returns the model-level statistics of one branch as a plain dict so it can be sent back from a worker process.'''
+    counts = {"virgin": 0, "endo": 0, "meso": 0, "ecto": 0}
+    if hasattr(model , "cells"):
+        #ABM.differentiated_counts is counted at the start of a tick, so count the final states here
+        for cell in model.cells:
+            counts[cell.differentiated] = counts.get(cell.differentiated , 0) + 1
+    else:
+        #Decomposition.DecomposedABM gathers these from its tiles
+        counts.update(model.differentiated_counts)
+    summary = {
+        "ticks" : model.schedule.steps,
+        "running" : model.running,
+        "stop_reason" : model.stop_reason,
+        "num_stem_cells" : model.num_stem_cells,
+        "avg_x" : model.avg_x,
+        "avg_y" : model.avg_y,
+        "avg_radius" : model.avg_radius
+    }
+    summary.update(counts)
+    return summary
+
+
+
+def checkBranchParams(params):
+    '''Raises ValueError for a post-fork parameter that is not in BRANCH_PARAMS'''
+    for name in params:
+        if name not in BRANCH_PARAMS:
+            raise ValueError("{} cannot change after a fork (branch parameters: {})".format(name , ", ".join(BRANCH_PARAMS)))
+
+
+def applyBranchParams(model, params):
+    '''Applies post-fork parameters to a grown model
+
+        num_BMP4/num_NOG release or retire molecules until the model holds that many (ABM.setMoleculeCount),
+        binding_rate is set on the morphogen fields and the other BRANCH_ATTRIBUTES are set on the model.'''
+    checkBranchParams(params)
+    for name , value in params.items():
+        if name in BRANCH_DOSES:
+            model.setMoleculeCount(BRANCH_DOSES[name] , value)
+        elif name == "binding_rate":
+            if value and "NOG" not in model.morphogens.names:
+                raise ValueError("binding_rate needs the NOG field, which is only solved when the model is built with binding_rate above 0")
+            model.morphogens.binding_rate = value
+        else:
+            setattr(model , name , value)
+
+
+
+def runBranch(model, params, seed, ticks, collect=summarize):
+    '''Continues one branch of a forked run in place
+
+        Reseeds every random stream of the model from seed (an int or a SeedSequence), applies the post-fork
+        parameters (applyBranchParams) and steps it for at most ticks steps (or until running is False).'''
+    if not isinstance(seed , np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    model.reseed(seed)
+    applyBranchParams(model , params)
+    for i in range(ticks):
+        if not model.running:
+            break
+        model.step()
+    return collect(model)
+
+
+
+def _runForkedBranch(params, seed, ticks):
+    return runBranch(_forkParent , params , seed , ticks , _forkCollect)
+
+
+def _runPickledBranch(snapshot, params, seed, ticks, collect):
+    return runBranch(pickle.loads(snapshot) , params , seed , ticks , collect)
+
+
+
+def branchSeeds(seedSequence, count):
+    '''The default forkRuns seeds: count children of seedSequence, derived without spawning from it
+
+        SeedSequence.spawn() advances the parent's child counter, so spawning would give every call different branches.
+        These children depend only on the parent's entropy and spawn_key, so forking the same model twice repeats them.'''
+    return [np.random.SeedSequence(seedSequence.entropy , spawn_key=seedSequence.spawn_key + (BRANCH_KEY , i) , pool_size=seedSequence.pool_size)
+            for i in range(count)]
+
+
+
+def forkRuns(model, paramSets, ticks, seeds=None, collect=summarize, processes=None):
+    '''Branches many runs from one in-memory model state
+
+        The expensive shared prefix (growing the colony from ABM.setup()) is computed once by the caller, e.g.
+
+            model = ABM(...)
+            for i in range(200):
+                model.step()
+            results = forkRuns(model , [{"endo_min": 0.6} , {"endo_min": 0.8}] , 100)
+
+        model : ABM : Equilibrated model to branch from. It is never modified.
+        paramSets : List[Dict] : One dict of post-fork parameter values per branch (names from BRANCH_PARAMS)
+        ticks : Int : Maximum number of steps each branch runs after the fork
+        seeds : List[SeedSequence or Int] : RNG seed per branch; branchSeeds(model.seedSequence , ...) when omitted
+        collect : Function : Called with the finished branch model, its return value is the branch result
+        processes : Int : Number of worker processes (None uses every core, 1 runs all branches in this process)
+
+        When the platform supports the "fork" start method each branch runs in a freshly forked worker that
+        shares the parent's memory copy-on-write. Otherwise the model is pickled once and shipped to spawned workers,
+        in which case collect must be picklable (a module-level function).
+
+        Branch i only depends on the parent state, paramSets[i] and seeds[i], so results are reproducible
+        for any number of processes.
+
+        Returns a list with one collect(...) result per branch, in the order of paramSets.'''
+    global _forkParent , _forkCollect
+    if seeds is None:
+        seeds = branchSeeds(model.seedSequence , len(paramSets))
+    if len(seeds) != len(paramSets):
+        raise ValueError("forkRuns needs one seed per parameter set")
+    for params in paramSets:
+        checkBranchParams(params)
+
+    if processes == 1 or len(paramSets) <= 1:
+        return [runBranch(copy.deepcopy(model) , params , seed , ticks , collect) for params , seed in zip(paramSets , seeds)]
+
+    if "fork" in multiprocessing.get_all_start_methods():
+        _forkParent = model
+        _forkCollect = collect
+        try:
+            #maxtasksperchild=1 gives every branch a fresh fork of the untouched parent state
+            with multiprocessing.get_context("fork").Pool(processes , maxtasksperchild=1) as pool:
+                return pool.starmap(_runForkedBranch , [(params , seed , ticks) for params , seed in zip(paramSets , seeds)] , chunksize=1)
+        finally:
+            _forkParent = None
+            _forkCollect = None
+
+    snapshot = pickle.dumps(model , protocol=pickle.HIGHEST_PROTOCOL)
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        return pool.starmap(_runPickledBranch , [(snapshot , params , seed , ticks , collect) for params , seed in zip(paramSets , seeds)] , chunksize=1)
@@ -1,84 +1,405 @@
+import warnings
 import numpy as np
-from numpy import linalg as LA
-import math
-from scipy.sparse import spdiags
 
 
-# generating mesh grid
-# [a,b] x [a,b] square
-a = 0 
+# default mesh grid
+# [a,b] x [a,b] square, the default 20 x 20 space
+a = 0
 b = 20
 
-# grid points in both x and y direction
+# grid points in both x and y direction of the default square
 points = 100
 
-dx = (b-a)/(points-1) 
+# default node spacing: a space of any size gets nodes this far apart unless nx/ny are given
+dx = (b-a)/(points-1)
 
-# Our grid
-x = np.linspace(a, b, points)
-y = np.linspace(b, a, points) #flipping y values so we read points topleft ->topright 
-X,Y = np.meshgrid(x,y)
-xy_grid = np.array([X.flatten(),Y.flatten()]).T
-print(len(xy_grid))
-
-# the initial condition 
-def initialize(x,y):
-    #f = math.exp(-(x-1)**2 -(y-1)**2)
-    #f = math.exp(-(y-1)**2) 
-    f = math.exp(-(x-10)**2 -(y-10)**2)
+# the initial condition, a bump at center (the colony's starting point)
+# x and y are arrays of node coordinates, so use numpy functions
+def initialize(x,y,center=(10,10)):
+    #f = np.exp(-(x-1)**2 -(y-1)**2)
+    #f = np.exp(-(y-1)**2)
+    f = np.exp(-(x-center[0])**2 -(y-center[1])**2)
     #f = 2*(b-x/2-y/2)
     #f = 2 + y
     return f
 
 # the reaction equation
+# u is the whole field vector, so use numpy functions
 def apply_reaction(u):
     g = 0  #just the heat eq.
     #g = u*(1-u)
-    #g = math.log(abs(u) + 2) 
+    #g = np.log(abs(u) + 2)
     return g
 
-unot = np.zeros(len(xy_grid))
-for n in range(len(xy_grid)):
-    unot[n] = initialize(xy_grid[n][0],xy_grid[n][1])   
+# coupled kinetics of several species on the same grid
+# values has one row per species (in the order of names), returns the reaction rate of every species
+# NOG binds BMP4 at binding_rate * BMP4 * NOG, using up both (and producing BMP4_NOG if that species exists)
+def apply_kinetics(values,names,binding_rate):
+    rates = np.zeros_like(values)
+    for i in range(len(names)):
+        rates[i] += apply_reaction(values[i])
+    if binding_rate and "BMP4" in names and "NOG" in names:
+        bound = binding_rate*values[names.index("BMP4")]*values[names.index("NOG")]
+        rates[names.index("BMP4")] -= bound
+        rates[names.index("NOG")] -= bound
+        if "BMP4_NOG" in names:
+            rates[names.index("BMP4_NOG")] += bound
+    return rates
+
 # we also need to discretize our time
+# one reaction step (one model tick) advances the field by dt, whatever the grid resolution
 dt = 0.01*dx
 Tfinal = dt*400
 Tpoints = round(Tfinal/dt)
 t_grid = np.linspace(0,Tfinal,num = Tpoints)
 #heat eq diffusion coeff.
-kappa = 1 
-# constructing our diff.operator L
-eye = np.ones(len(xy_grid))
-data1 = np.array([-4*eye/dx**2, eye/dx**2, eye/dx**2, eye/dx**2, eye/dx**2])
-diags = np.array([0, -1, -points, 1, points]) #position of diagonals
-L = spdiags(data1, diags, len(xy_grid), len(xy_grid)).toarray()
-
-Left = np.identity(len(xy_grid))/dt - kappa*L/2
-Right = np.identity(len(xy_grid))/dt + kappa*L/2
-
-#this makes the BCs have 0 flux (see how the boundary values won't change)
-for k in range(points):
-    Left[k,:] = 0
-    Left[k,k] = 1
-    Left[-(k+1),:] = 0
-    Left[-(k+1),-(k+1)] = 1
-    Right[k,:] = 0
-    Right[k,k] = 1
-    Right[-(k+1),:] = 0
-    Right[-(k+1),-(k+1)] = 1
-
-inv = LA.inv(Left)
-
-
-#Start
-heat = unot
-
-def reaction(heat):
-    reaction = np.array([apply_reaction(i) for i in heat])
-    #below two line accounts for 0 flux BC's
-    reaction[0:points], reaction[-points:] = 0,0
-    reaction[points::points], reaction[points+1::points] = 0,0
-    place = np.matmul(Right, heat) + reaction
-    return np.matmul(inv, place)
-    
+kappa = 1
+
+#ways DiffusionGrid can solve the Crank-Nicolson system (see DiffusionGrid); "auto" picks one of them by grid size
+SOLVERS = ("direct" , "cg" , "multigrid")
+
+#"auto" solves grids of at least this many nodes by "multigrid" rather than "direct": the sparse LU fills in
+#superlinearly on a 2-D grid (500 x 500 nodes take ~7 s to factorize, 1000 x 1000 ~50 s)
+AUTO_MULTIGRID_NODES = 250000
+
+#multigrid stops coarsening once a level has at most this many nodes, and solves it directly
+COARSEST_NODES = 400
+
+#lowest relative residual the iterative solvers are asked for on a float32 grid
+FLOAT32_TOL = 1e-5
+
+
+
+class DiffusionGrid:
+    '''Creation of a Crank-Nicolson Diffusion Grid over a Rectangle
+
+        nx x ny nodes span [x_min, x_max] x [y_min, y_max]. A field is a flat vector in row-major order with row 0 at
+        y_max (the top) and column 0 at x_min, so node (row, col) is vector[row * nx + col] (reshape(ny, nx) gives the
+        picture). The nodes on all four edges keep their initial values.
+
+        The operators are scipy.sparse matrices built the first time step() is called. solver picks how Left is solved:
+            "direct" : Left is factorized once (sparse LU); each step is one back-substitution. Fill-in grows faster
+                       than nx * ny (~75 factor entries per node at 125 x 125, ~150 at 500 x 500), and the
+                       factorization time faster still, so memory and cost are superlinear in the node count.
+            "cg" : Conjugate gradient (Jacobi preconditioned) on the interior nodes, whose Crank-Nicolson matrix is
+                   symmetric positive definite once the fixed boundary nodes are moved to the right-hand side.
+                   Warm-started from the previous field, so a step takes a few iterations; memory is O(nx * ny).
+            "multigrid" : The same conjugate gradient, preconditioned by one geometric multigrid V-cycle (Galerkin
+                          coarse grids, weighted Jacobi smoothing), which keeps the iteration count low on fine grids.
+            "auto" : "multigrid" for grids of AUTO_MULTIGRID_NODES nodes or more, otherwise "direct".
+
+        Attributes:
+            nx , ny : Int : Nodes along x and along y
+            dx , dy : Float : Node spacing along x and along y
+            x , y : ndarray : Node coordinates of the columns (increasing) and of the rows (decreasing)
+            dt : Float : Time advanced by one step()
+            kappa : Float : Diffusion coefficient
+            solver : String : "direct", "cg" or "multigrid" (what "auto" picked)
+            tol : Float : Relative residual at which the iterative solvers stop
+            maxiter : Int : Iteration limit of the iterative solvers (None: scipy's default)
+            iterations : Int : Iterations taken by the last step() (0 for the direct solver)
+            dtype : dtype : Precision of the fields and of every operator (float64, or float32 for half the memory
+                traffic; tol is then raised to at least FLOAT32_TOL, which single precision can still reach). The
+                "direct" LU factors stay float64 either way: far from the source the substitution sweeps underflow
+                float32 into subnormals, which are several times slower than a float64 back-substitution. Field values
+                below the smallest normal float32 are flushed to zero for the same reason.
+
+        step() also advances several fields at once: given a (nodes, k) array it solves all k columns against the same
+        operator (one multi-column back-substitution for "direct").'''
+
+    def __init__(self, x_min, x_max, y_min, y_max, nx, ny, kappa=kappa, dt=dt, solver="direct", tol=1e-8, maxiter=None, dtype=np.float64):
+        if nx < 3 or ny < 3:
+            raise ValueError("DiffusionGrid needs at least 3 nodes along each axis")
+        if solver == "auto":
+            solver = "multigrid" if int(nx) * int(ny) >= AUTO_MULTIGRID_NODES else "direct"
+        if solver not in SOLVERS:
+            raise ValueError("Unknown field solver {!r} (choose from {})".format(solver , ", ".join(SOLVERS + ("auto" ,))))
+        self.x_min = x_min
+        self.x_max = x_max
+        self.y_min = y_min
+        self.y_max = y_max
+        self.nx = int(nx)
+        self.ny = int(ny)
+        self.dx = (x_max - x_min) / (self.nx - 1)
+        self.dy = (y_max - y_min) / (self.ny - 1)
+        self.x = np.linspace(x_min , x_max , self.nx)
+        self.y = np.linspace(y_max , y_min , self.ny) #flipping y values so we read points topleft ->topright
+        self.kappa = kappa
+        self.dt = dt
+        self.solver = solver
+        self.dtype = np.dtype(dtype)
+        self.tol = max(tol , FLOAT32_TOL) if self.dtype == np.float32 else tol
+        self.maxiter = maxiter
+        self.iterations = 0
+        self._operators = {}
+
+
+    @classmethod
+    def fromSpace(cls, space, nx=None, ny=None, solver="auto", **kwargs):
+        '''Grid covering a ContinuousSpace; nx/ny default to the node spacing of Brandon's default grid (dx)'''
+        if nx is None:
+            nx = int(round((space.x_max - space.x_min) / dx)) + 1
+        if ny is None:
+            ny = int(round((space.y_max - space.y_min) / dx)) + 1
+        return cls(space.x_min , space.x_max , space.y_min , space.y_max , nx , ny , solver=solver , **kwargs)
+
+
+    @property
+    def size(self):
+        return self.nx * self.ny
+
+
+    @property
+    def extent(self):
+        return (self.x_min , self.x_max , self.y_min , self.y_max)
+
+
+    def nodes(self):
+        '''x and y of every node, in field vector order'''
+        X , Y = np.meshgrid(self.x , self.y)
+        return X.ravel() , Y.ravel()
+
+
+    def boundary(self):
+        '''Boolean vector marking the nodes on the four edges'''
+        mask = np.zeros((self.ny , self.nx) , dtype=bool)
+        mask[0 , :] = mask[-1 , :] = True
+        mask[: , 0] = mask[: , -1] = True
+        return mask.ravel()
+
+
+    def withKappa(self, kappa):
+        '''A grid with the same nodes and solver settings but diffusion coefficient kappa (this grid if kappa matches)'''
+        if kappa == self.kappa:
+            return self
+        return DiffusionGrid(self.x_min , self.x_max , self.y_min , self.y_max , self.nx , self.ny , kappa=kappa , dt=self.dt,
+                             solver=self.solver , tol=self.tol , maxiter=self.maxiter , dtype=self.dtype)
+
+
+    def initial(self):
+        '''Initial condition (initialize) centered on the middle of the domain'''
+        X , Y = self.nodes()
+        center = ((self.x_min + self.x_max) / 2 , (self.y_min + self.y_max) / 2)
+        return self.flushed(initialize(X , Y , center).astype(self.dtype))
+
+
+    def flushed(self, field):
+        '''field with its subnormal values set to zero (float32 only; they make every later step slow)'''
+        if self.dtype == np.float32:
+            field[np.abs(field) < np.finfo(self.dtype).tiny] = 0
+        return field
+
+
+    def operators(self):
+        if not self._operators:
+            from scipy import sparse
+            from scipy.sparse.linalg import splu , LinearOperator
+
+            # constructing our diff.operator L (5-point Laplacian, separate spacing along x and y)
+            def secondDifference(n, h):
+                return sparse.diags([np.ones(n - 1) , -2 * np.ones(n) , np.ones(n - 1)] , [-1 , 0 , 1]) / h**2
+            L = sparse.kron(sparse.identity(self.ny) , secondDifference(self.nx , self.dx)) + sparse.kron(secondDifference(self.ny , self.dy) , sparse.identity(self.nx))
+
+            #boundary rows become identity rows, so the edge values never change
+            boundary = self.boundary()
+            interior = sparse.diags((~boundary).astype(float))
+            fixed = sparse.diags(boundary.astype(float))
+            identity = sparse.identity(self.size)
+            Left = (interior @ (identity/self.dt - self.kappa*L/2) + fixed).astype(self.dtype).tocsc()
+            Right = (interior @ (identity/self.dt + self.kappa*L/2) + fixed).astype(self.dtype).tocsr()
+
+            self._operators.update(L=L.tocsr(), Left=Left, Right=Right, boundary=boundary)
+
+            if self.solver == "direct":
+                self._operators.update(lu=splu(Left.astype(np.float64)))
+            else:
+                #interior block A (symmetric positive definite) and its coupling to the fixed boundary nodes
+                inside = np.flatnonzero(~boundary)
+                edge = np.flatnonzero(boundary)
+                rows = Left.tocsr()[inside]
+                A = rows[: , inside].tocsr()
+                if self.solver == "multigrid":
+                    hierarchy = multigridHierarchy(A , self.nx - 2 , self.ny - 2)
+                    M = LinearOperator(A.shape , matvec=lambda r: vCycle(hierarchy , 0 , r))
+                else:
+                    inverseDiagonal = 1 / A.diagonal()
+                    M = LinearOperator(A.shape , matvec=lambda r: inverseDiagonal * r)
+                self._operators.update(inside=inside, edge=edge, A=A, coupling=rows[: , edge].tocsr(), M=M)
+        return self._operators
+
+
+    def step(self, heat, reaction=None):
+        '''The field one time step (dt) after heat
+
+            heat is one field (nodes,) or several (nodes, k). reaction is their reaction rate, same shape; by default
+            apply_reaction(heat).'''
+        ops = self.operators()
+        if reaction is None:
+            reaction = np.zeros(np.shape(heat) , dtype=self.dtype) + apply_reaction(heat)
+        else:
+            reaction = np.array(reaction , dtype=self.dtype)
+        #boundary nodes get no reaction term
+        reaction[ops["boundary"]] = 0
+        place = ops["Right"] @ heat + reaction
+        if self.solver == "direct":
+            return self.flushed(ops["lu"].solve(place.astype(np.float64 , copy=False)).astype(self.dtype , copy=False))
+
+        from scipy.sparse.linalg import cg
+        inside = ops["inside"]
+        #boundary rows are identity rows, so the boundary values are already known
+        rhs = place[inside] - ops["coupling"] @ place[ops["edge"]]
+        guess = np.asarray(heat)[inside]
+        result = place.copy()
+        self.iterations = 0
+        for column in range(1 if place.ndim == 1 else place.shape[1]):
+            which = slice(None) if place.ndim == 1 else (slice(None) , column)
+            counter = [0]
+            def count(xk):
+                counter[0] += 1
+            solution , info = cg(ops["A"] , rhs[which] , x0=guess[which] , rtol=self.tol , maxiter=self.maxiter , M=ops["M"] , callback=count)
+            self.iterations += counter[0]
+            if info > 0:
+                warnings.warn("{} field solver did not reach tol={} in {} iterations".format(self.solver , self.tol , info))
+            result[(inside ,) + (() if place.ndim == 1 else (column ,))] = solution
+        return self.flushed(result)
+
+
+    def index(self, x, y):
+        '''Field vector index of the node nearest to (x, y), clamped to the grid'''
+        col = min(max(int(round((x - self.x_min) / self.dx)) , 0) , self.nx - 1)
+        row = min(max(int(round((self.y_max - y) / self.dy)) , 0) , self.ny - 1)
+        return row * self.nx + col
+
+
+    def indices(self, x, y):
+        '''index() for arrays of x and y'''
+        col = np.clip(np.rint((np.asarray(x) - self.x_min) / self.dx).astype(int) , 0 , self.nx - 1)
+        row = np.clip(np.rint((self.y_max - np.asarray(y)) / self.dy).astype(int) , 0 , self.ny - 1)
+        return row * self.nx + col
+
+
+    def concentrationAt(self, field, pos):
+        return field[self.index(pos[0] , pos[1])]
+
+
+    def grid(self, field):
+        '''field as a (ny, nx) array whose row 0 is the top of the domain'''
+        return np.asarray(field).reshape(self.ny , self.nx)
+
+
+    def __getstate__(self):
+        #The sparse LU factorization and the preconditioners cannot be pickled; they are rebuilt on first use
+        state = dict(vars(self))
+        state["_operators"] = {}
+        return state
+
+
+    def __deepcopy__(self, memo):
+        #A grid never changes once built, so copies of a model share it (and its factorization)
+        return self
+
+
+
+
+class MorphogenFields:
+    '''Creation of Several Morphogen Species Sharing One Grid
+
+        Every species is a row of values on the nodes of grid. Species with the same diffusion coefficient share one
+        DiffusionGrid (so one factorization / preconditioner) and are advanced together as a multi-column right-hand
+        side. The coupled reaction rates of all species come from one vectorized apply_kinetics call per step.
+        With replicates=R every species holds R independent fields (the columns of values[row]), solved in the same call.
+
+        Attributes:
+            names : List[str] : Species in row order
+            values : ndarray : (species, nodes) concentrations, or (species, nodes, replicates)
+            grids : Dict[Float, DiffusionGrid] : One grid per diffusion coefficient
+            groups : Dict[Float, List[Int]] : Rows advanced by each grid
+            binding_rate : Float : NOG-BMP4 binding rate used by apply_kinetics
+            iterations : Int : Iterative solver iterations of the last step(), summed over every species'''
+
+    def __init__(self, grid, species, binding_rate=0.0, replicates=None):
+        self.grid = grid
+        self.names = list(species)
+        self.binding_rate = binding_rate
+        self.grids = {}
+        self.groups = {}
+        for row , name in enumerate(self.names):
+            kappa = species[name].get("kappa" , grid.kappa)
+            if kappa not in self.grids:
+                self.grids[kappa] = grid.withKappa(kappa)
+                self.groups[kappa] = []
+            self.groups[kappa].append(row)
+        bump = grid.initial()
+        self.values = np.array([species[name].get("amplitude" , 1) * bump for name in self.names])
+        if replicates is not None:
+            self.values = np.repeat(self.values[: , : , None] , replicates , axis=2)
+        self.iterations = 0
+
+
+    def field(self, name):
+        return self.values[self.names.index(name)]
+
+
+    def step(self):
+        '''Advances every species one time step'''
+        rates = apply_kinetics(self.values , self.names , self.binding_rate)
+        values = np.empty_like(self.values)
+        self.iterations = 0
+        for kappa , rows in self.groups.items():
+            grid = self.grids[kappa]
+            #(rows, nodes, ...) -> (nodes, rows x replicates) columns and back
+            block = self.values[rows]
+            columns = lambda a: np.moveaxis(a , 1 , 0).reshape(grid.size , -1)
+            solved = grid.step(columns(block) , columns(rates[rows]))
+            values[rows] = np.moveaxis(solved.reshape((grid.size , len(rows)) + block.shape[2:]) , 0 , 1)
+            self.iterations += grid.iterations
+        self.values = values
+
+
+
+def prolongation1D(n):
+    '''Linear interpolation from (n - 1) // 2 coarse nodes to n fine nodes (coarse node i sits on fine node 2i + 1)'''
+    from scipy import sparse
+    coarse = (n - 1) // 2
+    i = np.arange(coarse)
+    rows = np.concatenate([2*i + 1 , 2*i , 2*i + 2])
+    cols = np.concatenate([i , i , i])
+    values = np.concatenate([np.ones(coarse) , 0.5*np.ones(coarse) , 0.5*np.ones(coarse)])
+    return sparse.csr_matrix((values , (rows , cols)) , shape=(n , coarse))
+
+
+def multigridHierarchy(A, nx, ny):
+    '''Levels of a geometric multigrid for A on an nx x ny (row-major) grid
+
+        Every level holds its matrix, the inverse of its diagonal and the prolongation P to it from the next coarser
+        level, whose matrix is the Galerkin product P^T A P. The coarsest level keeps a sparse LU factorization.'''
+    from scipy import sparse
+    from scipy.sparse.linalg import splu
+    levels = []
+    while nx * ny > COARSEST_NODES and nx >= 5 and ny >= 5:
+        P = sparse.kron(prolongation1D(ny) , prolongation1D(nx)).tocsr().astype(A.dtype)
+        levels.append({"A" : A , "inverseDiagonal" : 1 / A.diagonal() , "P" : P})
+        A = (P.T @ A @ P).tocsr()
+        nx , ny = (nx - 1) // 2 , (ny - 1) // 2
+    levels.append({"A" : A , "lu" : splu(A.tocsc())})
+    return levels
+
+
+def vCycle(levels, level, b, smoothing=2, omega=2/3):
+    '''Approximate solution of levels[level]["A"] x = b from one V-cycle started at x = 0
 
+        Pre- and post-smoothing are the same weighted Jacobi sweeps, so the cycle is a symmetric preconditioner for
+        conjugate gradient.'''
+    current = levels[level]
+    if "lu" in current:
+        return current["lu"].solve(b)
+    A = current["A"]
+    D = current["inverseDiagonal"]
+    x = omega * D * b
+    for sweep in range(smoothing - 1):
+        x += omega * D * (b - A @ x)
+    P = current["P"]
+    x += P @ vCycle(levels , level + 1 , P.T @ (b - A @ x) , smoothing , omega)
+    for sweep in range(smoothing):
+        x += omega * D * (b - A @ x)
+    return x
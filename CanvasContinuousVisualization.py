@@ -1,4 +1,7 @@
 from collections import defaultdict
+import base64
+import weakref
+import numpy as np
 from mesa.visualization.ModularVisualization import VisualizationElement
 
 
@@ -34,3 +37,181 @@ class CanvasContinuous(VisualizationElement):
             space_state[portrayal["Layer"]].append(portrayal)
         return space_state
 
+
+
+class BinaryCanvasContinuous(CanvasContinuous):
+    """Creation of a Delta-Encoded Binary Frame Mode for CanvasContinuous
+
+        Instead of one portrayal dict per agent, every frame is sent as typed arrays: uint32 unique_ids, float32 x/y and
+        a uint8 type/state code per agent. Only agents that moved, changed code or appeared since the previous frame are
+        included, together with the ids of agents that disappeared. ContinuousCanvasModule keeps the decoded agents
+        between frames and draws each code with one batched path.
+
+        mesa's websocket only carries JSON, so the arrays travel as base64 strings (little-endian) inside the usual
+        viz_state message.
+
+        code_method(agent) returns the agent's code, palette[code] is a dict with the "Color", "r", "Filled" and "Layer"
+        used to draw it (sent with every keyframe).
+
+        The delta baseline is kept per viewer (a websocket connection, see ThreadedServer.ViewerModularServer), so
+        every browser tab gets deltas against the frames it was actually sent. A viewer's first frame is a keyframe
+        holding every agent, and so are its first frame of each new model and every keyframe_every-th frame after
+        it. capture(model) takes what a frame draws and encodeFrame(captured, viewer) encodes it for one viewer;
+        render(model) does both for the default viewer None, as mesa's ModularServer calls it.
+        """
+
+    def __init__(self, code_method, palette, space_width, space_height, canvas_width=500, canvas_height=500, keyframe_every=100):
+        super().__init__(None , space_width , space_height , canvas_width , canvas_height)
+        self.code_method = code_method
+        self.palette = palette
+        self.keyframe_every = keyframe_every
+        self.viewers = {}
+
+
+    def gather(self, model):
+        '''Every agent in the space as (ids, xs, ys, codes) arrays sorted by unique_id'''
+        agents = model.space._index_to_agent
+        n = len(agents)
+        ids = np.fromiter((agents[i].unique_id for i in range(n)) , dtype="<u4" , count=n)
+        codes = np.fromiter((self.code_method(agents[i]) for i in range(n)) , dtype=np.uint8 , count=n)
+        if n > 0:
+            xs = model.space._agent_points[:n , 0].astype("<f4")
+            ys = model.space._agent_points[:n , 1].astype("<f4")
+        else:
+            xs = np.zeros(0 , dtype="<f4")
+            ys = np.zeros(0 , dtype="<f4")
+        order = np.argsort(ids , kind="stable")
+        return ids[order] , xs[order] , ys[order] , codes[order]
+
+
+    def capture(self, model):
+        '''What a frame of model draws, as a dict that encodeFrame can encode later for any viewer'''
+        return {"model" : model , "agents" : self.gather(model)}
+
+
+    def render(self, model, viewer=None):
+        return self.encodeFrame(self.capture(model) , viewer)
+
+
+    def forget(self, viewer):
+        '''Drops the delta baseline of a viewer that has gone (its next frame would be a keyframe)'''
+        self.viewers.pop(viewer , None)
+
+
+    def encodeFrame(self, captured, viewer=None):
+        '''Delta-encodes captured agents against the last frame sent to viewer'''
+        model = captured["model"]
+        ids , xs , ys , codes = captured["agents"]
+        n = len(ids)
+        last = self.viewers.get(viewer)
+        keyframe = last is None or last["model"]() is not model or last["frames"] >= self.keyframe_every
+        if keyframe:
+            changed = np.ones(n , dtype=bool)
+            removed = np.zeros(0 , dtype="<u4")
+            frames = 0
+        else:
+            last_ids , last_xs , last_ys , last_codes = last["agents"]
+            where = np.searchsorted(last_ids , ids)
+            where = np.minimum(where , max(len(last_ids) - 1 , 0))
+            if len(last_ids) > 0:
+                found = last_ids[where] == ids
+                changed = ~found | (last_xs[where] != xs) | (last_ys[where] != ys) | (last_codes[where] != codes)
+            else:
+                changed = np.ones(n , dtype=bool)
+            removed = np.setdiff1d(last_ids , ids , assume_unique=True).astype("<u4")
+            frames = last["frames"] + 1
+
+        self.viewers[viewer] = {"model" : weakref.ref(model) , "agents" : (ids , xs , ys , codes) , "frames" : frames}
+        frame = {
+            "binary" : 1,
+            "keyframe" : keyframe,
+            "ids" : encode(ids[changed]),
+            "x" : encode(xs[changed]),
+            "y" : encode(ys[changed]),
+            "code" : encode(codes[changed]),
+            "removed" : encode(removed)
+        }
+        if keyframe:
+            frame["palette"] = self.palette
+        return frame
+
+
+
+def encode(array):
+    '''Base64 text of a typed array's raw bytes, decoded by ContinuousCanvasModule with atob and a typed-array view'''
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode("ascii")
+
+
+
+class DensityCanvasContinuous(BinaryCanvasContinuous):
+    """Creation of a Level-of-Detail Mode for BinaryCanvasContinuous
+
+        Draws a continuum field (e.g. the solved BMP4vector) as a background heatmap, and, once there are more than
+        molecule_threshold molecules, replaces the individual molecule circles by per-code density heatmaps of their
+        binned counts. Below the threshold molecules are sent and drawn as circles as usual. (This canvas has no zoom,
+        so the molecule count alone decides the level of detail.)
+
+        field_method(model) returns (values, extent): a 2D array whose row 0 is the top (largest y) of the field, and
+        the (x_min, x_max, y_min, y_max) space extent it covers, or None when there is no field to draw. It is sent as uint8 in [min, max] every frame.
+        molecule_codes are the codes (see code_method) that count as molecules; they are binned on a
+        density_bins x density_bins grid over the space and drawn in their palette color.
+        """
+
+    def __init__(self, code_method, palette, space_width, space_height, canvas_width=500, canvas_height=500, keyframe_every=100,
+                 field_method=None, field_color="orange", molecule_codes=(), molecule_threshold=500, density_bins=100):
+        super().__init__(code_method , palette , space_width , space_height , canvas_width , canvas_height , keyframe_every)
+        self.field_method = field_method
+        self.field_color = field_color
+        self.molecule_codes = np.array(molecule_codes , dtype=np.uint8)
+        self.molecule_threshold = molecule_threshold
+        self.density_bins = density_bins
+
+
+    def capture(self, model):
+        ids , xs , ys , codes = self.gather(model)
+        captured = {"model" : model}
+        molecules = np.isin(codes , self.molecule_codes)
+        if np.count_nonzero(molecules) > self.molecule_threshold:
+            captured["density"] = self.binMolecules(model , xs[molecules] , ys[molecules] , codes[molecules])
+            keep = ~molecules
+            ids , xs , ys , codes = ids[keep] , xs[keep] , ys[keep] , codes[keep]
+        captured["agents"] = (ids , xs , ys , codes)
+        field = self.field_method(model) if self.field_method is not None else None
+        if field is not None:
+            values , extent = field
+            captured["field"] = quantize(values , extent)
+            captured["field"]["color"] = self.field_color
+        return captured
+
+
+    def encodeFrame(self, captured, viewer=None):
+        #The field and the density heatmaps are sent whole with every frame
+        frame = super().encodeFrame(captured , viewer)
+        for name in ("density" , "field"):
+            if name in captured:
+                frame[name] = captured[name]
+        return frame
+
+
+    def binMolecules(self, model, xs, ys, codes):
+        '''Per-code molecule counts on a density_bins grid (row 0 at the top), as uint8 heatmaps'''
+        space = model.space
+        extent = [float(space.x_min) , float(space.x_max) , float(space.y_min) , float(space.y_max)]
+        grids = {}
+        for code in np.unique(codes):
+            mask = codes == code
+            counts , _ , _ = np.histogram2d(xs[mask] , ys[mask] , bins=self.density_bins , range=[extent[0:2] , extent[2:4]])
+            #Scaled so the densest bin of each code is fully opaque
+            grids[int(code)] = encode((counts.T[::-1] * (255 / counts.max())).astype(np.uint8))
+        return {"w" : self.density_bins , "h" : self.density_bins , "extent" : extent , "grids" : grids}
+
+
+
+def quantize(values, extent):
+    '''2D float array as uint8 levels between its min and max, with what the browser needs to draw it'''
+    values = np.asarray(values , dtype=float)
+    low = float(values.min()) if values.size else 0.0
+    high = float(values.max()) if values.size else 0.0
+    scale = 255 / (high - low) if high > low else 0.0
+    levels = np.clip((values - low) * scale , 0 , 255).astype(np.uint8)
+    return {"w" : values.shape[1] , "h" : values.shape[0] , "extent" : [float(v) for v in extent] , "min" : low , "max" : high , "data" : encode(levels)}
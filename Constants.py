@@ -3,6 +3,32 @@
 #Constant Values that determine size of Continuous Space and Agents
 MAX_X = 20
 MAX_Y = 20
+#BMP4 field grid nodes along x and y (None follows MAX_X/MAX_Y at Brandon's default spacing: 100 x 100 for a 20 x 20 space)
+FIELD_NX = None
+FIELD_NY = None
+#How the BMP4 field is solved each tick: "direct" (sparse LU), "cg" or "multigrid" (iterative, to relative residual FIELD_TOL),
+#or "auto": multigrid from Brandon.AUTO_MULTIGRID_NODES nodes up, direct below
+FIELD_SOLVER = "auto"
+FIELD_TOL = 1e-8
+#Morphogen species solved on the field grid: diffusion coefficient and amplitude of the initial bump at the center.
+#Species with the same kappa share one factorized operator (see Brandon.MorphogenFields)
+SPECIES = {"BMP4" : {"kappa" : 1 , "amplitude" : 1}}
+#Species added to SPECIES only when BINDING_RATE (or binding_rate) is above 0. Without binding nothing reads them
+BINDING_SPECIES = {"NOG" : {"kappa" : 1 , "amplitude" : 1}}
+#NOG-BMP4 binding rate (0 leaves BMP4 the plain heat equation of earlier versions)
+BINDING_RATE = 0.0
+#Steady-state detection (Convergence.py): end a run once a criterion holds for STOP_WINDOW ticks. None turns a criterion off
+STOP_FIELD_CHANGE = None
+STOP_DRIFT = None
+STOP_PLATEAU = None
+MAX_AGENTS = None
+STOP_WINDOW = 20
+#"float32" stores positions, fields and field operators in single precision (half the memory traffic); check the
+#effect on a parameter set with python -m stemcellabm precision
+PRECISION = "float64"
+#True retires a BMP4 deactivated with no timer left (it would otherwise wait for a NOG to touch it again). This drops
+#molecules the model could still reactivate, so it changes the dynamics
+RETIRE_INACTIVE_BMP4 = False
 STEMCELL_R = 0.1
 BMP4_R = 0.01
 NOG_R = 0.01
@@ -15,4 +41,12 @@ SPAWN_FREQ = 7
 DIFF_TIMER = 10
 ENDO_MIN = 0.8
 ECTO_MAX = 0.2
-TIME_FOR_DIFF_UPPER = 20
\ No newline at end of file
+TIME_FOR_DIFF_UPPER = 20
+
+#Visualization: send delta-encoded typed-array frames (BinaryCanvasContinuous) instead of one dict per agent
+BINARY_FRAMES = True
+#Above this many BMP4/NOG molecules they are drawn as density heatmaps instead of individual circles
+MOLECULE_THRESHOLD = 500
+#Step the model in a background thread and send the browser at most TARGET_FPS snapshots per second
+THREADED_SERVER = True
+TARGET_FPS = 10
@@ -0,0 +1,81 @@
+from collections import deque
+import numpy as np
+
+
+class ConvergenceMonitor:
+    '''Creation of a Steady-State Monitor that Ends Runs Early
+
+        ABM.step() checks it once per tick (only when the model is built with one of the stop_* / max_agents
+        parameters), from aggregates the tick has already computed: BMP4vector, avg_x/avg_y/avg_radius,
+        differentiated_counts and the agent count. A criterion left as None is never checked.
+
+        Criteria:
+            field_change : Float : Relative change of the BMP4 field per tick, ||u_t - u_t-1|| / ||u_t-1||, has stayed below this for window ticks
+            drift : Float : Centroid and average radius have each moved less than this (space units) over the last window ticks
+            plateau : Float : Fraction of differentiated StemCells has changed by less than this over the last window ticks
+                (only once some StemCell has differentiated, so an undifferentiated colony is left to the other criteria)
+            max_agents : Int : The model holds more agents than this
+            window : Int : Ticks the field_change, drift and plateau criteria must hold
+
+        Attributes:
+            reason : Str : Criterion that stopped the run ("field_change", "drift", "plateau" or "max_agents"), None before
+            last : Dict[str, Float] : Value of every enabled criterion at the last check'''
+
+    def __init__(self, field_change=None, drift=None, plateau=None, max_agents=None, window=20):
+        self.field_change = field_change
+        self.drift = drift
+        self.plateau = plateau
+        self.max_agents = max_agents
+        self.window = window
+        self.reason = None
+        self.last = {}
+        self.lastField = None
+        self.calmTicks = 0
+        self.shape = deque(maxlen=window + 1)
+        self.fractions = deque(maxlen=window + 1)
+
+
+    def check(self, model):
+        '''The criterion met by model this tick, or None'''
+        if self.max_agents is not None:
+            agents = model.schedule.get_agent_count()
+            self.last["max_agents"] = agents
+            if agents > self.max_agents:
+                return self.stop("max_agents")
+
+        if self.field_change is not None:
+            #A copy: DecomposedABM overwrites its field buffers in place
+            field = np.array(model.BMP4vector)
+            if self.lastField is not None:
+                scale = np.linalg.norm(self.lastField)
+                change = np.linalg.norm(field - self.lastField) / scale if scale > 0 else 0.0
+                self.last["field_change"] = change
+                self.calmTicks = self.calmTicks + 1 if change < self.field_change else 0
+            self.lastField = field
+            if self.calmTicks >= self.window:
+                return self.stop("field_change")
+
+        if self.drift is not None:
+            self.shape.append((model.avg_x , model.avg_y , model.avg_radius))
+            if len(self.shape) == self.shape.maxlen:
+                spans = np.ptp(np.array(self.shape) , axis=0)
+                self.last["drift"] = max(float(np.hypot(spans[0] , spans[1])) , float(spans[2]))
+                if self.last["drift"] < self.drift:
+                    return self.stop("drift")
+
+        if self.plateau is not None:
+            counts = model.differentiated_counts
+            total = sum(counts.values())
+            fraction = 1 - counts.get("virgin" , 0) / total if total else 0.0
+            if fraction > 0:
+                self.fractions.append(fraction)
+            if len(self.fractions) == self.fractions.maxlen:
+                self.last["plateau"] = max(self.fractions) - min(self.fractions)
+                if self.last["plateau"] < self.plateau:
+                    return self.stop("plateau")
+        return None
+
+
+    def stop(self, reason):
+        self.reason = reason
+        return reason
@@ -0,0 +1,466 @@
+"""Spatial domain decomposition of ABM across worker processes
+
+    DecomposedABM builds the usual initial colony, cuts the space into vertical strips (tiles) holding equal numbers
+    of agents and hands every strip to a TileABM in its own process. Each tick:
+
+        1. The coordinator broadcasts the colony centroid, start_diff and which BMP4 field buffer to read, then solves
+           the next tick's field into the other buffer (shared memory) while the tiles step.
+        2. Every tile steps the agents it owns, reading the agents of the other tiles near its strip as ghosts.
+        3. Tiles exchange agents directly over Pipes: agents that left a strip are handed to their new owner, and every
+           agent within HALO_WIDTH of another strip is sent to it as a ghost.
+        4. The tiles report partial sums, which the coordinator gathers into the usual model-level statistics
+           (MODEL_REPORTERS, recorded by its DataCollector).
+
+    Within a tick each tile sees the other tiles' agents as they were at the end of the previous tick, and every tile
+    draws from its own random streams, so a decomposed run is statistically equivalent to ABM but not identical to it.
+"""
+import concurrent.futures
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from StemCellABM import ABM, StemCell, BMP4, NOG, MODEL_REPORTERS
+from Lifecycle import removeAgents
+
+
+#Width of the band around a strip whose agents a tile keeps as ghosts. It covers one BMP4 step (1/3) plus the
+#BMP4-StemCell touching distance (0.11); cell contacts (0.1) and cell steps (0.2) fit inside it
+HALO_WIDTH = 0.5
+
+#Block of unique_ids reserved for the agents created by each tile
+ID_BLOCK = 2 ** 24
+
+AGENT_TYPES = {"StemCell" : StemCell , "BMP4" : BMP4 , "NOG" : NOG}
+
+#Attributes that are not sent with an agent (absorbedNOG holds agent references and is always emptied by spawnBMP4)
+_UNSENT = ("model" , "pos" , "unique_id" , "absorbedNOG")
+
+
+def packAgent(agent):
+    '''Plain-data copy of an agent (type name, unique_id, position and its other attributes) to send to another tile'''
+    state = {name : value for name , value in vars(agent).items() if name not in _UNSENT}
+    return (type(agent).__name__ , agent.unique_id , agent.pos , state)
+
+
+def tileEdges(xs, tiles, x_min, x_max):
+    '''Strip boundaries along x, at the quantiles of the agents' x so every strip starts with as many agents'''
+    if len(xs) == 0:
+        return np.linspace(x_min , x_max , tiles + 1)
+    inner = np.quantile(xs , np.arange(1 , tiles) / tiles)
+    return np.concatenate([[x_min] , inner , [x_max]])
+
+
+
+class TileABM(ABM):
+    '''Creation of the Part of an ABM Owned by One Tile
+
+        Schedules and steps the agents whose x lies in its strip [edges[tile], edges[tile + 1]). Agents of the other
+        tiles within HALO_WIDTH of the strip sit in its space as ghosts: neighbour searches and touching checks see
+        them, but they are not stepped and are refreshed at every exchange. The centroid (avg_x, avg_y), start_diff
+        and the BMP4 field are set by the DecomposedABM coordinator, so a tile builds no morphogen fields and no
+        DataCollector of its own.
+
+        Attributes:
+            tile : Int : Index of this tile's strip
+            edges : ndarray : x boundaries of every strip
+            ghosts : Dict[Int, Agent] : Ghost agents by unique_id
+            fields : ndarray : The coordinator's two BMP4 field buffers (shared memory)
+            fieldIndex : Int : Buffer holding this tick's field
+            radiusSum : Float : Summed distance of the owned StemCells to the centroid at the start of the tick'''
+
+    def __init__(self, tile, edges, params, agents, seedSequence, fieldName, fieldSize, idStart, exampleID):
+        super().__init__(**params)
+        self.tile = tile
+        self.edges = edges
+        self.reseed(seedSequence)
+        self.currentIDNum = idStart
+        self.exampleID = exampleID
+        self.num_stem_cells = 0
+        self.cellTouchingDict = {}
+        self.ghosts = {}
+        self.radiusSum = 0.0
+        self.fieldMemory = shared_memory.SharedMemory(name=fieldName)
+        self.fields = np.ndarray((2 , fieldSize) , dtype=self.grid.dtype , buffer=self.fieldMemory.buf)
+        self.fieldIndex = 0
+        self.adoptAgents(agents)
+
+
+    def buildFields(self, binding_rate):
+        #The coordinator solves the fields; this tile reads BMP4 from shared memory (updateBMP4)
+        self.morphogens = None
+        self.BMP4vector = None
+        self.NOGvector = None
+
+
+    def buildCollector(self, reporters):
+        #The coordinator gathers the reporters from every tile
+        return None
+
+
+    def setup(self):
+        #Agents are handed over by the coordinator
+        return
+
+
+    def calcAvgs(self):
+        #avg_x/avg_y are the global centroid set by the coordinator; only this tile's part of the radius is summed
+        centroid = (self.avg_x , self.avg_y)
+        self.radiusSum = sum(self.space.get_distance(centroid , cell.pos) for cell in self.cells)
+
+
+    def updateParams(self):
+        if self.cells:
+            c = self.cells[int(self.rngs["params"].integers(0 , len(self.cells)))]
+            self.one_cells_contact = c.chemical_contact
+
+
+    def updateTouchingDict(self):
+        #Ghost StemCells are keys too, since owned cells record them as neighbours
+        self.cellTouchingDict = {agent.unique_id : [] for agent in self.space._agent_to_index if type(agent) == StemCell}
+        super().updateTouchingDict()
+
+
+    def updateBMP4(self):
+        self.BMP4vector = self.fields[self.fieldIndex]
+
+
+    def ownersOf(self, xs):
+        return np.searchsorted(self.edges[1:-1] , xs , side="right")
+
+
+    def unpack(self, name, uniqueID, pos, state, agent=None):
+        '''Places a packed agent in this tile's space, reusing agent (an existing ghost) when given'''
+        if agent is None:
+            agent = AGENT_TYPES[name].__new__(AGENT_TYPES[name])
+            agent.unique_id = uniqueID
+            agent.model = self
+            agent.pos = None
+            if name == "StemCell":
+                agent.absorbedNOG = []
+            vars(agent).update(state)
+            self.space.place_agent(agent , pos)
+        else:
+            vars(agent).update(state)
+            self.space.move_agent(agent , pos)
+        return agent
+
+
+    def adoptAgents(self, packed):
+        '''Makes the packed agents owned (and stepped) by this tile'''
+        for name , uniqueID , pos , state in packed:
+            agent = self.unpack(name , uniqueID , pos , state , self.ghosts.pop(uniqueID , None))
+            self.schedule.add(agent)
+            if name == "StemCell":
+                self.cells.append(agent)
+                self.num_stem_cells += 1
+            elif name == "BMP4":
+                self.BMP4.append(agent)
+            else:
+                self.NOG.append(agent)
+
+
+    def releaseAgents(self, agents):
+        '''Removes agents that moved to another tile'''
+        if not agents:
+            return
+        for agent in agents:
+            self.schedule.remove(agent)
+        removeAgents(self.space , agents)
+        leaving = set(agents)
+        self.cells = [agent for agent in self.cells if agent not in leaving]
+        self.BMP4 = [agent for agent in self.BMP4 if agent not in leaving]
+        self.NOG = [agent for agent in self.NOG if agent not in leaving]
+        self.num_stem_cells = len(self.cells)
+
+
+    def refreshGhosts(self, packed):
+        '''Moves, adds and removes ghosts so they match the packed agents sent by the other tiles'''
+        current = {}
+        for name , uniqueID , pos , state in packed:
+            current[uniqueID] = self.unpack(name , uniqueID , pos , state , self.ghosts.get(uniqueID))
+        removeAgents(self.space , [agent for uniqueID , agent in self.ghosts.items() if uniqueID not in current])
+        self.ghosts = current
+
+
+    def outgoing(self, peers):
+        '''Packs the migrants and ghosts this tile sends to each peer tile, and releases the migrants'''
+        messages = {peer : {"migrants" : [] , "ghosts" : []} for peer in peers}
+        agents = self.schedule.agents
+        if not agents:
+            return messages
+        xs = np.fromiter((agent.pos[0] for agent in agents) , dtype=float , count=len(agents))
+        owners = self.ownersOf(xs)
+        leaving = []
+        for i in np.flatnonzero(owners != self.tile):
+            messages[int(owners[i])]["migrants"].append(packAgent(agents[i]))
+            leaving.append(agents[i])
+        staying = owners == self.tile
+        for peer in peers:
+            near = staying & (xs >= self.edges[peer] - HALO_WIDTH) & (xs < self.edges[peer + 1] + HALO_WIDTH)
+            messages[peer]["ghosts"] = [packAgent(agents[i]) for i in np.flatnonzero(near)]
+        self.releaseAgents(leaving)
+        return messages
+
+
+    def exchange(self, peers, senders):
+        '''Swaps migrants and ghosts with every other tile
+
+            peers maps each other tile to its Pipe. Sends run on the senders thread pool, so no tile can block another
+            while both are sending.'''
+        messages = self.outgoing(peers)
+        pending = [senders.submit(peers[peer].send , messages[peer]) for peer in peers]
+        migrants = []
+        ghosts = []
+        for peer in peers:
+            message = peers[peer].recv()
+            migrants.extend(message["migrants"])
+            ghosts.extend(message["ghosts"])
+        for sent in pending:
+            sent.result()
+        self.adoptAgents(migrants)
+        self.refreshGhosts(ghosts)
+
+
+    def report(self):
+        '''Partial sums the coordinator gathers into the model-level statistics'''
+        counts = {}
+        sumX = 0.0
+        sumY = 0.0
+        for cell in self.cells:
+            sumX += cell.pos[0]
+            sumY += cell.pos[1]
+            counts[cell.differentiated] = counts.get(cell.differentiated , 0) + 1
+        example = self.schedule._agents.get(self.exampleID)
+        return {
+            "cells" : len(self.cells),
+            "agents" : self.schedule.get_agent_count(),
+            "molecules" : len(self.BMP4) + len(self.NOG),
+            "pooled" : self.lifecycle.pooled,
+            "sumX" : sumX,
+            "sumY" : sumY,
+            "radiusSum" : self.radiusSum,
+            "counts" : counts,
+            "start_diff" : self.start_diff,
+            "one_cells_contact" : self.one_cells_contact if self.cells else None,
+            "example" : example.differentiated if example is not None else None
+        }
+
+
+    def agentArrays(self):
+        agents = self.schedule.agents
+        return {
+            "ids" : np.array([agent.unique_id for agent in agents] , dtype=np.int64),
+            "x" : np.array([agent.pos[0] for agent in agents] , dtype=float),
+            "y" : np.array([agent.pos[1] for agent in agents] , dtype=float),
+            "type" : np.array([type(agent).__name__ for agent in agents]),
+            "differentiated" : np.array([getattr(agent , "differentiated" , "") for agent in agents])
+        }
+
+
+
+def _runTile(tile, edges, params, agents, seedSequence, fieldName, fieldSize, idStart, exampleID, conn, peers):
+    '''Worker process of one tile: steps and exchanges on the coordinator's command until told to stop'''
+    model = TileABM(tile , edges , params , agents , seedSequence , fieldName , fieldSize , idStart , exampleID)
+    senders = concurrent.futures.ThreadPoolExecutor(max(len(peers) , 1))
+    try:
+        model.exchange(peers , senders)
+        conn.send("ready")
+        while True:
+            message = conn.recv()
+            if message[0] == "step":
+                _ , model.avg_x , model.avg_y , model.start_diff , model.fieldIndex = message
+                model.step()
+                model.exchange(peers , senders)
+                conn.send(model.report())
+            elif message[0] == "gather":
+                conn.send(model.agentArrays())
+            else:
+                break
+    finally:
+        senders.shutdown()
+        del model.fields
+        model.BMP4vector = None
+        model.fieldMemory.close()
+
+
+
+class GatheredSchedule:
+    '''The parts of BaseScheduler read by Headless and the data collector, summed over the tiles'''
+
+    def __init__(self):
+        self.steps = 0
+        self.time = 0
+        self.agentCount = 0
+
+    def get_agent_count(self):
+        return self.agentCount
+
+
+
+class DecomposedABM:
+    '''Creation of an ABM Split into Strips Stepped by Separate Processes
+
+        Takes ABM's parameters plus tiles, the number of worker processes (strips). Strips are fixed when the model
+        is built, at the quantiles of the initial agents' x. The model-level attributes of ABM (num_stem_cells,
+        avg_x, avg_y, avg_radius, start_diff, running, one_cells_contact, stem_cell_ex_diff, BMP4vector, field_iterations,
+        live_molecules, pooled_molecules) are gathered from the tiles after every tick, differentiated_counts holds the
+        StemCell count per differentiation state, and gather() returns every agent's position and state.
+
+        Call close() (or use it as a context manager) to stop the workers and free the shared field.'''
+
+    def __init__(self, num_stem_cells: int , sauce: bool , num_BMP4: int , num_NOG: int , spawn_freq: int , diff_timer: int , endo_min: int , ecto_max: int , max_x:int=20 , max_y:int=20 , seed:int=None , field_nx:int=None , field_ny:int=None , field_solver:str="auto" , field_tol:float=1e-8 , binding_rate:float=0.0 , stop_field_change:float=None , stop_drift:float=None , stop_plateau:float=None , max_agents:int=None , stop_window:int=20 , precision:str="float64" , retire_inactive_bmp4:bool=False , tiles:int=2) -> None:
+        params = {"num_stem_cells" : num_stem_cells , "sauce" : sauce , "num_BMP4" : num_BMP4 , "num_NOG" : num_NOG , "spawn_freq" : spawn_freq,
+                  "diff_timer" : diff_timer , "endo_min" : endo_min , "ecto_max" : ecto_max , "max_x" : max_x , "max_y" : max_y,
+                  "field_nx" : field_nx , "field_ny" : field_ny , "field_solver" : field_solver , "field_tol" : field_tol,
+                  "binding_rate" : binding_rate , "precision" : precision , "retire_inactive_bmp4" : retire_inactive_bmp4}
+        model = ABM(seed=seed , stop_field_change=stop_field_change , stop_drift=stop_drift , stop_plateau=stop_plateau , max_agents=max_agents,
+                    stop_window=stop_window , **params)
+        #Only the coordinator checks for a steady state, from the gathered aggregates
+        self.monitor = model.monitor
+        self.stop_reason = None
+        self.tiles = tiles
+        self.sauce = sauce
+        self.spawn_freq = spawn_freq
+        self.diff_timer = diff_timer
+        self.endo_min = endo_min
+        self.ecto_max = ecto_max
+        self.num_stem_cells = model.num_stem_cells
+        self.num_BMP4 = num_BMP4
+        self.num_NOG = num_NOG
+        self.avg_x = model.avg_x
+        self.avg_y = model.avg_y
+        self.avg_radius = model.avg_radius
+        self.start_diff = model.start_diff
+        self.end_time = model.end_time
+        self.running = True
+        self.one_cells_contact = model.one_cells_contact
+        self.stem_cell_ex_diff = model.stem_cell_ex_diff
+        self.differentiated_counts = {"virgin" : model.num_stem_cells}
+        self.live_molecules = model.live_molecules
+        self.pooled_molecules = 0
+        self.schedule = GatheredSchedule()
+        self.schedule.agentCount = model.schedule.get_agent_count()
+
+        agents = model.schedule.agents
+        xs = np.array([agent.pos[0] for agent in agents])
+        self.edges = tileEdges(xs , tiles , model.space.x_min , model.space.x_max)
+        owners = np.searchsorted(self.edges[1:-1] , xs , side="right")
+
+        self.grid = model.grid
+        self.morphogens = model.morphogens
+        fieldSize = self.grid.size
+        self.fieldMemory = shared_memory.SharedMemory(create=True , size=2 * fieldSize * self.grid.dtype.itemsize)
+        self.fields = np.ndarray((2 , fieldSize) , dtype=self.grid.dtype , buffer=self.fieldMemory.buf)
+        self.fieldIndex = 0
+
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        peers = [{} for tile in range(tiles)]
+        for i in range(tiles):
+            for j in range(i + 1 , tiles):
+                peers[i][j] , peers[j][i] = context.Pipe()
+        seeds = model.seedSequence.spawn(tiles)
+        self.conns = []
+        self.processes = []
+        for tile in range(tiles):
+            conn , childConn = context.Pipe()
+            packed = [packAgent(agents[i]) for i in np.flatnonzero(owners == tile)]
+            process = context.Process(target=_runTile , args=(tile , self.edges , params , packed , seeds[tile] , self.fieldMemory.name , fieldSize,
+                                                             model.currentIDNum + tile * ID_BLOCK , model.stem_cell_ex.unique_id , childConn , peers[tile]) , daemon=True)
+            process.start()
+            childConn.close()
+            self.conns.append(conn)
+            self.processes.append(process)
+        for tilePeers in peers:
+            for pipe in tilePeers.values():
+                pipe.close()
+        for conn in self.conns:
+            conn.recv()
+
+        #The field read by the first tick
+        self.morphogens.step()
+        self.fields[0] = self.morphogens.field("BMP4")
+        self.field_iterations = self.morphogens.iterations
+        self.BMP4vector = self.fields[0]
+        self.nextX = model.avg_x
+        self.nextY = model.avg_y
+        del model
+
+        from mesa.datacollection import DataCollector
+        self.datacollector = DataCollector(model_reporters=dict(MODEL_REPORTERS))
+
+
+    def step(self):
+        if self.start_diff == True:
+            if self.end_time == -2:
+                self.end_time = 3
+            self.end_time -= 1
+        startCells = self.num_stem_cells
+        for conn in self.conns:
+            conn.send(("step" , self.nextX , self.nextY , self.start_diff , self.fieldIndex))
+
+        #Solve the next tick's fields while the tiles step, BMP4 going into the other buffer (they only read fields[fieldIndex])
+        current = self.fieldIndex
+        self.morphogens.step()
+        self.fields[1 - current] = self.morphogens.field("BMP4")
+        self.field_iterations = self.morphogens.iterations
+
+        reports = [conn.recv() for conn in self.conns]
+        self.BMP4vector = self.fields[current]
+        self.fieldIndex = 1 - current
+        self.avg_x = self.nextX
+        self.avg_y = self.nextY
+        self.avg_radius = sum(report["radiusSum"] for report in reports) / startCells
+        self.num_stem_cells = sum(report["cells"] for report in reports)
+        self.nextX = sum(report["sumX"] for report in reports) / self.num_stem_cells
+        self.nextY = sum(report["sumY"] for report in reports) / self.num_stem_cells
+        self.start_diff = any(report["start_diff"] for report in reports)
+        counts = {}
+        for report in reports:
+            for state , count in report["counts"].items():
+                counts[state] = counts.get(state , 0) + count
+            if report["one_cells_contact"] is not None:
+                self.one_cells_contact = report["one_cells_contact"]
+            if report["example"] is not None:
+                self.stem_cell_ex_diff = report["example"]
+        self.differentiated_counts = counts
+        self.schedule.agentCount = sum(report["agents"] for report in reports)
+        self.live_molecules = sum(report["molecules"] for report in reports)
+        self.pooled_molecules = sum(report["pooled"] for report in reports)
+        self.schedule.steps += 1
+        self.schedule.time += 1
+        if self.end_time == -1 and self.start_diff == True:
+            self.running = False
+            self.stop_reason = "differentiation"
+        elif self.monitor is not None and self.monitor.check(self) is not None:
+            self.running = False
+            self.stop_reason = self.monitor.reason
+        self.datacollector.collect(self)
+
+
+    def gather(self):
+        '''Every agent of every tile as arrays: ids, x, y, type (class name) and differentiated ("" for molecules)'''
+        for conn in self.conns:
+            conn.send(("gather" ,))
+        parts = [conn.recv() for conn in self.conns]
+        return {name : np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+    def close(self):
+        if self.processes is None:
+            return
+        for conn in self.conns:
+            conn.send(("stop" ,))
+        for process in self.processes:
+            process.join()
+        for conn in self.conns:
+            conn.close()
+        self.processes = None
+        del self.fields , self.BMP4vector
+        self.fieldMemory.close()
+        self.fieldMemory.unlink()
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,503 @@
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+import Brandon
+import Constants
+from StemCellABM import RNG_STAGES , morphogenSpecies
+from Decomposition import GatheredSchedule
+from Precision import PRECISIONS
+
+
+#Differentiation states of the ensemble's StemCells, in the order of their codes in EnsembleABM.cells["state"]
+STATES = ("virgin" , "endo" , "meso" , "ecto")
+
+#Space between the replicates' copies of the space in the shared KD-trees (wider than any contact distance)
+REPLICATE_GAP = 1.0
+
+#Per-replicate values recorded by the data collector every tick
+REPLICATE_COLUMNS = ["replicate" , "tick" , "num_stem_cells" , "avg_x" , "avg_y" , "avg_radius" , "start_diff"]
+
+
+def drift(hx, hy, shift, u):
+    '''Vectorized step rule of BMP4.movement and NOG.movement: the step toward heading (hx, hy) before normalization,
+        shifted vertically (shift < 1) or horizontally by a uniform draw u'''
+    quadrants = [(hx > 0) & (hy > 0) , (hx < 0) & (hy < 0) , (hx < 0) & (hy > 0) , (hx > 0) & (hy < 0)]
+    #Bounds of the vertical (y) and horizontal (x) uniform shift in each quadrant
+    yLow = np.select(quadrants , [-hx , hy , hx , hy])
+    yHigh = np.select(quadrants , [hy , -hx , hy , hx])
+    xLow = np.select(quadrants , [-hy , hx , hx , hy])
+    xHigh = np.select(quadrants , [hx , -hy , hy , hx])
+    vertical = shift < 1
+    x = np.where(vertical , hx , xLow + (xHigh - xLow) * u)
+    y = np.where(vertical , yLow + (yHigh - yLow) * u , hy)
+    #On an axis (or at the center) the molecule steps along (1, 1)
+    onAxis = ~np.logical_or.reduce(quadrants)
+    return np.where(onAxis , 1.0 , x) , np.where(onAxis , 1.0 , y)
+
+
+def segmentMaximum(values, group):
+    '''Running maximum of values within each run of equal group (group sorted)'''
+    out = values.copy()
+    shift = 1
+    while shift < len(out):
+        same = group[shift:] == group[:-shift]
+        out[shift:] = np.where(same , np.maximum(out[shift:] , out[:-shift]) , out[shift:])
+        shift *= 2
+    return out
+
+
+def firstMinimum(values, group, groups):
+    '''Index of the first smallest value of each group (-1 for empty groups)'''
+    order = np.lexsort((np.arange(len(values)) , values , group))
+    first = np.r_[True , group[order][1:] != group[order][:-1]] if len(order) else np.zeros(0 , dtype=bool)
+    out = np.full(groups , -1)
+    out[group[order][first]] = order[first]
+    return out
+
+
+def determineAngle(px, py, cx, cy, radius):
+    '''Vectorized StemCell.determineAngle of the points (px, py) on the circle of radius around (cx, cy)
+
+        Like the original, the angle comes from atan(py / px) of the absolute coordinates, placed by the point's quadrant
+        around the center. A point level with the center on one axis (which the original cannot place) keeps atan(py / px).'''
+    with np.errstate(divide="ignore" , invalid="ignore"):
+        theta = np.arctan(py / px)
+    return np.select([(px == cx) & (py == cy + radius) , (px == cx + radius) & (py == cy) , (px == cx - radius) & (py == cy) , (px == cx) & (py == cy - radius),
+                      (px > cx) & (py > cy) , (px < cx) & (py > cy) , (px > cx) & (py < cy) , (px < cx) & (py < cy)],
+                     [math.pi / 2 , 0.0 , math.pi , math.pi * 3 / 2 , theta , math.pi - theta , (2 * math.pi) - theta , theta + math.pi] , theta)
+
+
+def neighborSets(x, y, i, j, radius):
+    '''Vectorized StemCell.intersectingPoints and convertIntersectingPointsPolar for the pairs i -> j
+
+        Returns (keep, lower, upper): the bounds of the SetRange cell i builds for neighbor j, and keep False where the
+        original returns no intersection (the cells are more than 2 radius apart).'''
+    a , b , c , d = x[i] , y[i] , x[j] , y[j]
+    D = np.sqrt((a - c)**2 + (b - d)**2)
+    level = d == b
+    with np.errstate(divide="ignore" , invalid="ignore"):
+        E = np.sqrt(radius**2 - (D / 2)**2)
+        M = (c - a) / (b - d)
+        B = np.where(c == a , (b + d) / 2 , (b**2 - d**2) / (c**2 - a**2))
+    theta = np.arctan2(c - a , b - d)
+    midX = (a + c) / 2
+    dist = E * np.cos(theta)
+    x2 = midX + dist
+    y2 = M * x2 + B
+    x1 = midX - dist
+    y1 = M * x1 + B
+    #Cells level with each other: the original places both points radius * sqrt(2) / 2 right of the leftmost cell, around y = 0
+    side = radius * ((2)**0.5 / 2)
+    x1 = np.where(level , np.minimum(a , c) + side , x1)
+    x2 = np.where(level , x1 , x2)
+    y1 = np.where(level , ((radius)**2 - side**2)**0.5 , y1)
+    y2 = np.where(level , -y1 , y2)
+    keep = level | ~(D > 2 * radius)
+    angle1 = determineAngle(x1 , y1 , a , b , radius)
+    angle2 = determineAngle(x2 , y2 , a , b , radius)
+    return keep , np.minimum(angle1 , angle2) , np.maximum(angle1 , angle2)
+
+
+def cellSteps(x, y, centerX, centerY, jitter, moving, i, j, radius):
+    '''Vectorized StemCell.movement2 for every cell at once
+
+        Every neighbor j of cell i (touching pairs, both directions, in neighbor order) gives cell i a SetRange between
+        two angles. movement2 passes a polar point (a non-empty tuple) as the SetRange's lapped flag, so each set counts
+        as lapped, the outside of its two angles, in numInRange and getRange, while SetRangeUnion (which checks
+        lapped == True) sorts and merges the sets by their plain bounds. Each cell heads for its colony's centroid, turned
+        by its jitter draw. When an endpoint of the merged sets lies in the half-turn around that heading and the heading
+        lies in one of the sets, it turns to the endpoint nearest in angle (first one on ties). The step is scaled by
+        (2 pi - range) / 2 pi, which reverses it once the ranges add up to more than a full turn, and normalized to 1/5;
+        a scale of 0 leaves the cell in place. Neighbors are read at their tick-start positions. Returns the (dx, dy) of
+        every cell in moving (0 for the others).'''
+    x = np.asarray(x , dtype=float)
+    y = np.asarray(y , dtype=float)
+    n = len(x)
+    order = np.argsort(i , kind="stable")
+    i , j = i[order] , j[order]
+    keep , lower , upper = neighborSets(x , y , i , j , radius)
+
+    #SetRangeUnion: sets sorted by lower and merged while the next one starts strictly before the current one ends
+    low , high , owner = lower[keep] , upper[keep] , i[keep]
+    order = np.lexsort((np.arange(len(low)) , low , owner))
+    low , high , owner = low[order] , high[order] , owner[order]
+    reach = segmentMaximum(high , owner)
+    starts = np.flatnonzero(np.r_[True , (owner[1:] != owner[:-1]) | ~(reach[:-1] > low[1:])]) if len(low) else np.zeros(0 , dtype=int)
+    setLower = low[starts]
+    setUpper = np.maximum.reduceat(high , starts) if len(starts) else np.zeros(0)
+    setOwner = owner[starts]
+    covered = np.bincount(setOwner , weights=(2 * math.pi) - (setUpper - setLower) , minlength=n)
+
+    #Heading toward the centroid, placed by quadrant as movement2 does, then turned by the jitter draw
+    cx = centerX - x
+    cy = centerY - y
+    magnitude = (cx**2 + cy**2)**0.5
+    with np.errstate(divide="ignore" , invalid="ignore"):
+        zp = np.arctan(cy / cx)
+        zp = zp + np.select([(cx < 0) & (cy > 0) , (cx < 0) & (cy < 0) , (cx > 0) & (cy < 0)] , [math.pi , math.pi , 2 * math.pi] , 0.0)
+        zp = zp + np.where(magnitude > 0 , jitter * (math.pi) / magnitude , 0.0)
+    zp = np.where(zp > math.pi * 2 , zp - math.pi * 2 * (np.ceil(zp / (math.pi * 2)) - 1) , zp)
+
+    #Endpoints (upper, lower of every merged set, in order) within the half-turn around the heading (that SetRange is
+    #lapped below pi / 2 and above 3 pi / 2), and whether the heading lies in a (lapped) merged set
+    thetas = np.column_stack([setUpper , setLower]).ravel()
+    thetaOwner = np.repeat(setOwner , 2)
+    zpLower = (zp - math.pi / 2)[thetaOwner]
+    zpUpper = (zp + math.pi / 2)[thetaOwner]
+    zpLapped = ((zp < (math.pi / 2)) | (zp > (3 * math.pi / 2)))[thetaOwner]
+    nearby = np.where(zpLapped , (thetas <= zpLower) | (thetas >= zpUpper) , (thetas >= zpLower) & (thetas <= zpUpper))
+    inside = (zp[setOwner] <= setLower) | (zp[setOwner] >= setUpper)
+    turn = (np.bincount(thetaOwner , weights=nearby , minlength=n) > 0) & (np.bincount(setOwner , weights=inside , minlength=n) > 0)
+    nearest = firstMinimum(np.abs(thetas - zp[thetaOwner]) , thetaOwner , n)
+    zp = np.where(turn , thetas[np.maximum(nearest , 0)] if len(thetas) else zp , zp)
+
+    share = ((2 * math.pi) - covered) / (2 * math.pi)
+    h = ((x + radius * np.cos(zp)) - x) * share
+    v = ((y + radius * np.sin(zp)) - y) * share
+    norm = 5 * (h**2 + v**2)**0.5
+    norm = np.where((h == 0) & (v == 0) , 1.0 , norm)
+    return np.where(moving , h / norm , 0.0) , np.where(moving , v / norm , 0.0)
+
+
+
+class EnsembleABM:
+    '''Creation of an Ensemble of Independent ABM Replicates Stepped in the Same Vectorized Calls
+
+        Holds the agents of every replicate as flat arrays with a replicate column (cells, bmp4, nog) and the morphogen
+        fields as MorphogenFields(replicates=R), so a tick runs one KD-tree query per interaction, one multi-column
+        field solve and one numpy expression per rule for all R replicates. The trees are built over the replicates
+        laid side by side along x, REPLICATE_GAP apart, so replicates never touch.
+
+        Replicate r starts from the same state as ABM(..., seed=replicateSeeds[r]) and draws its random numbers from
+        the same per-stage streams in the same slot order. StemCells follow movement2 (cellSteps) in the schedule's
+        order (moveCells). Molecules, which no StemCell reads, move simultaneously after all of them. Sums are taken in
+        a different order than ABM's loops, and each rounding difference is amplified by the jitter turn, so a
+        replicate matches a separate ABM run in distribution rather than draw for draw. Each replicate stops on its own
+        (its diff_timer countdown) and is then frozen while the others continue.
+
+        Attributes:
+            replicates : Int : Number of replicates R
+            replicateSeeds : List[int] : Seed of every replicate, drawn from seed
+            dtype : dtype : Precision of the positions and fields (precision "float64" or "float32")
+            retire_inactive_bmp4 : Boolean : Drop BMP4 deactivated with no timer left, as ABM(..., retire_inactive_bmp4=True) retires them
+            cells : Dict[str, ndarray] : x, y, replicate, energy, time_for_diff and state (index into STATES) of every StemCell
+            bmp4 : Dict[str, ndarray] : x, y, replicate, immobilized, immobilized_timer, active and active_timer of every BMP4
+            nog : Dict[str, ndarray] : x, y and replicate of every NOG
+            counts , avg_x , avg_y , avg_radius , start_diff , end_time , replicateRunning , steps : ndarray : Per-replicate
+                model values, as in ABM (counts is the stem cell count, replicateRunning its running)
+            running : Boolean : True while any replicate runs
+            stop_reasons : List : Why each replicate stopped (None while it runs)
+            morphogens : MorphogenFields : Every species of every replicate on grid
+            schedule : GatheredSchedule : Ticks stepped and agents held, over all replicates
+            datacollector : DataCollector : Table "replicates" gets one row (REPLICATE_COLUMNS) per running replicate per tick'''
+
+    def __init__(self, num_stem_cells: int , sauce: bool , num_BMP4: int , num_NOG: int , spawn_freq: int , diff_timer: int , endo_min: int , ecto_max: int , max_x:int=20 , max_y:int=20 , seed:int=None , field_nx:int=None , field_ny:int=None , field_solver:str="auto" , field_tol:float=1e-8 , binding_rate:float=0.0 , precision:str="float64" , retire_inactive_bmp4:bool=False , replicates:int=8) -> None:
+        from mesa.space import ContinuousSpace
+        self.sauce = sauce
+        self.spawn_freq = spawn_freq
+        self.diff_timer = diff_timer
+        self.endo_min = endo_min
+        self.ecto_max = ecto_max
+        self.replicates = replicates
+        self.retire_inactive_bmp4 = retire_inactive_bmp4
+        self.dtype = np.dtype(PRECISIONS[precision])
+        self.space = ContinuousSpace(max_x , max_y , False , 0 , 0)
+        self.center_pos = self.space.center
+        self.stride = self.space.x_max - self.space.x_min + REPLICATE_GAP
+
+        self.seedSequence = np.random.SeedSequence(seed)
+        self.replicateSeeds = [int(s) for s in self.seedSequence.generate_state(replicates)]
+        children = [np.random.SeedSequence(s) for s in self.replicateSeeds]
+        self.rngs = [dict(zip(RNG_STAGES , [np.random.default_rng(s) for s in child.spawn(len(RNG_STAGES))])) for child in children]
+        self.setup(num_stem_cells , num_BMP4 , num_NOG)
+
+        self.counts = np.full(replicates , num_stem_cells)
+        self.avg_x = np.zeros(replicates)
+        self.avg_y = np.zeros(replicates)
+        self.avg_radius = np.zeros(replicates)
+        self.start_diff = np.zeros(replicates , dtype=bool)
+        self.end_time = np.zeros(replicates , dtype=int)
+        self.replicateRunning = np.ones(replicates , dtype=bool)
+        self.steps = np.zeros(replicates , dtype=int)
+        self.stop_reasons = [None] * replicates
+        self.calcAvgs(self.replicateRunning)
+
+        self.grid = Brandon.DiffusionGrid.fromSpace(self.space , field_nx , field_ny , solver=field_solver , tol=field_tol , dtype=self.dtype)
+        self.morphogens = Brandon.MorphogenFields(self.grid , morphogenSpecies(binding_rate) , binding_rate , replicates=replicates)
+        self.field_iterations = 0
+        self.schedule = GatheredSchedule()
+        self.schedule.agentCount = self.agentCount()
+        from mesa.datacollection import DataCollector
+        self.datacollector = DataCollector(tables={"replicates" : REPLICATE_COLUMNS})
+
+
+    def setup(self, num_stem_cells, num_BMP4, num_NOG):
+        '''Places every replicate's agents with the same draws, in the same order, as ABM.setup'''
+        disc = lambda rng , n: (rng.random(n) , rng.random(n) * 2 * math.pi)
+        cells , bmp4 , nog = [] , [] , []
+        for r , child in enumerate(self.replicateSeeds):
+            rng = np.random.default_rng(np.random.SeedSequence(child))
+            radius , theta = disc(rng , num_stem_cells)
+            timers = rng.integers(Constants.TIME_FOR_DIFF_UPPER - 10 , Constants.TIME_FOR_DIFF_UPPER + 1 , num_stem_cells)
+            rng.integers(0 , num_stem_cells)    #ABM's stem_cell_ex
+            cells.append((radius , theta , timers))
+            bmp4.append(disc(rng , num_BMP4))
+            nog.append(disc(rng , num_NOG))
+
+        def place(parts, n):
+            radius = np.concatenate([part[0] for part in parts])
+            theta = np.concatenate([part[1] for part in parts])
+            return {"x" : self.typed(radius * np.cos(theta) + self.center_pos[0]) , "y" : self.typed(radius * np.sin(theta) + self.center_pos[1]),
+                    "replicate" : np.repeat(np.arange(self.replicates) , n)}
+
+        self.cells = place(cells , num_stem_cells)
+        self.cells.update({"energy" : np.zeros(len(self.cells["x"]) , dtype=int) , "time_for_diff" : np.concatenate([part[2] for part in cells]),
+                           "state" : np.zeros(len(self.cells["x"]) , dtype=np.int8)})
+        self.bmp4 = place(bmp4 , num_BMP4)
+        m = len(self.bmp4["x"])
+        self.bmp4.update({"immobilized" : np.zeros(m , dtype=bool) , "immobilized_timer" : np.zeros(m , dtype=int),
+                          "active" : np.ones(m , dtype=bool) , "active_timer" : np.zeros(m , dtype=int)})
+        self.nog = place(nog , num_NOG)
+
+
+    def typed(self, values):
+        return np.asarray(values , dtype=self.dtype)
+
+
+    def agentCount(self):
+        return len(self.cells["x"]) + len(self.bmp4["x"]) + len(self.nog["x"])
+
+
+    @property
+    def num_stem_cells(self):
+        return int(self.counts.sum())
+
+
+    def tree(self, agents):
+        '''KD-tree over agents of every replicate, replicate r shifted r * stride along x'''
+        return cKDTree(np.column_stack([agents["x"] + agents["replicate"] * self.stride , agents["y"]]))
+
+
+    def calcAvgs(self, live):
+        rep = self.cells["replicate"]
+        counts = np.bincount(rep , minlength=self.replicates)
+        x = np.bincount(rep , weights=self.cells["x"] , minlength=self.replicates) / counts
+        y = np.bincount(rep , weights=self.cells["y"] , minlength=self.replicates) / counts
+        r = np.bincount(rep , weights=np.hypot(self.cells["x"] - x[rep] , self.cells["y"] - y[rep]) , minlength=self.replicates) / counts
+        self.avg_x = np.where(live , x , self.avg_x)
+        self.avg_y = np.where(live , y , self.avg_y)
+        self.avg_radius = np.where(live , r , self.avg_radius)
+
+
+    def touchingPairs(self, tree, radius, live):
+        '''Directed pairs (i, j) of distinct-position cells of live replicates within radius, both directions'''
+        pairs = tree.query_pairs(radius , output_type="ndarray")
+        i , j = pairs[: , 0] , pairs[: , 1]
+        keep = live[self.cells["replicate"][i]] & ((self.cells["x"][i] != self.cells["x"][j]) | (self.cells["y"][i] != self.cells["y"][j]))
+        i , j = i[keep] , j[keep]
+        return np.concatenate([i , j]) , np.concatenate([j , i])
+
+
+    def updateFields(self, live):
+        frozen = self.morphogens.values[... , ~live].copy()
+        self.morphogens.step()
+        self.morphogens.values[... , ~live] = frozen
+        self.field_iterations = self.morphogens.iterations
+
+
+    def cascade(self, tree, live):
+        '''ABM.cascade: a cell within reach of a virgin cell (itself included) of a live, differentiating replicate
+            becomes virgin with no time left before differentiation'''
+        rep = self.cells["replicate"]
+        virgin = self.cells["state"] == 0
+        pairs = tree.query_pairs(Constants.STEMCELL_R , output_type="ndarray")
+        i , j = np.concatenate([pairs[: , 0] , pairs[: , 1]]) , np.concatenate([pairs[: , 1] , pairs[: , 0]])
+        reached = virgin | (np.bincount(i , weights=virgin[j] , minlength=len(virgin)) > 0)
+        reset = reached & (live & self.start_diff)[rep]
+        self.cells["state"][reset] = 0
+        self.cells["time_for_diff"][reset] = 0
+
+
+    def draw(self, agents, stage, draws, live):
+        '''This tick's draws for the agents of every live replicate, each replicate from its own stage stream in slot
+            (creation) order, as ABM.drawTickRandoms draws them'''
+        rep = agents["replicate"]
+        order = np.argsort(rep , kind="stable")
+        bounds = np.r_[0 , np.cumsum(np.bincount(rep , minlength=self.replicates))]
+        out = {name : np.zeros(len(rep) , dtype=dtype) for name , dtype , method in draws}
+        for r in np.flatnonzero(live):
+            slots = order[bounds[r]:bounds[r + 1]]
+            for name , dtype , method in draws:
+                out[name][slots] = method(self.rngs[r][stage] , len(slots))
+        return out
+
+
+    def stepCells(self, pairs, live):
+        cells = self.cells
+        rep = cells["replicate"]
+        alive = live[rep]
+        draws = self.draw(cells , "cells" , [("energy" , int , lambda g , n: g.integers(0 , 3 , n)) , ("jitter" , float , lambda g , n: g.random(n)),
+                                             ("birth_timer" , int , lambda g , n: g.integers(Constants.TIME_FOR_DIFF_UPPER - 10 , Constants.TIME_FOR_DIFF_UPPER + 1 , n))] , live)
+
+        #StemCell.spawnCells: the newborn sits on its parent and is first stepped next tick
+        parents = np.flatnonzero(alive & (cells["energy"] >= self.spawn_freq))
+        cells["energy"][parents] //= 2
+        newborn = {"x" : cells["x"][parents] , "y" : cells["y"][parents] , "replicate" : rep[parents] , "energy" : np.zeros(len(parents) , dtype=int),
+                   "time_for_diff" : draws["birth_timer"][parents] , "state" : np.zeros(len(parents) , dtype=np.int8)}
+
+        #StemCell.movement2
+        cells["energy"][alive] += draws["energy"][alive]
+        self.moveCells(pairs , alive & (cells["state"] == 0) , draws["jitter"])
+
+        #StemCell.differentiation_tick
+        if self.sauce:
+            waiting = alive & (cells["time_for_diff"] > 0)
+            cells["time_for_diff"][waiting] -= 1
+            ready = alive & ~waiting & (cells["state"] == 0)
+            self.start_diff[np.unique(rep[ready])] = True
+            conc = self.morphogens.field("BMP4")[self.grid.indices(cells["x"][ready] , cells["y"][ready]) , rep[ready]]
+            #chemical_contact is never raised above 0 by the agents
+            state = np.zeros(len(conc) , dtype=np.int8)
+            state[conc >= self.endo_min] = 1
+            state[(conc < self.endo_min) & (0 >= self.ecto_max)] = 2
+            state[conc < self.ecto_max] = 3
+            cells["state"][ready] = state
+
+        self.cells = {name : np.concatenate([cells[name] , newborn[name]]) for name in cells}
+        self.counts += np.bincount(rep[parents] , minlength=self.replicates)
+
+
+    def moveCells(self, pairs, moving, jitter):
+        '''cellSteps for the moving cells, in the order the schedule steps them
+
+            A StemCell sees the neighbors stepped before it (created earlier) at their new positions. Each cell gets a
+            wave one after the latest wave of its moving, earlier neighbors; the cells of a wave do not depend on each
+            other, so each wave is one cellSteps call over every replicate.'''
+        cells = self.cells
+        rep = cells["replicate"]
+        i , j = pairs
+        earlier = moving[j] & (j < i)
+        wave = np.zeros(len(moving) , dtype=int)
+        while True:
+            later = wave.copy()
+            np.maximum.at(later , i[earlier] , wave[j[earlier]] + 1)
+            if (later == wave).all():
+                break
+            wave = later
+        for w in range(wave.max() + 1 if len(wave) else 0):
+            now = moving & (wave == w)
+            mine = now[i]
+            dx , dy = cellSteps(cells["x"] , cells["y"] , self.avg_x[rep] , self.avg_y[rep] , jitter , now , i[mine] , j[mine] , Constants.STEMCELL_R)
+            cells["x"] = self.typed(cells["x"] + dx)
+            cells["y"] = self.typed(cells["y"] + dy)
+
+
+    def stepMolecules(self, live):
+        center = self.center_pos
+        bmp4 , nog = self.bmp4 , self.nog
+        alive = live[bmp4["replicate"]]
+        draws = self.draw(bmp4 , "molecules" , [("shift" , int , lambda g , n: g.integers(0 , 2 , n)) , ("uniform" , float , lambda g , n: g.random(n)),
+                                                ("immobilize" , int , lambda g , n: g.integers(0 , 100 , n)),
+                                                ("immobilized_timer" , int , lambda g , n: g.integers(0 , 11 , n)),
+                                                ("active_timer" , int , lambda g , n: g.integers(0 , 11 , n))] , live)
+        nogDraws = self.draw(nog , "molecules" , [("shift" , int , lambda g , n: g.integers(0 , 2 , n)) , ("uniform" , float , lambda g , n: g.random(n))] , live)
+
+        #BMP4.movement: step toward the center, bounced back by every StemCell it then touches
+        mobile = alive & ~bmp4["immobilized"]
+        x , y = drift(center[0] - bmp4["x"] , center[1] - bmp4["y"] , draws["shift"] , draws["uniform"])
+        norm = np.hypot(x , y) * 3
+        dx , dy = np.where(mobile , x / norm , 0.0) , np.where(mobile , y / norm , 0.0)
+        bmp4["x"] = self.typed(bmp4["x"] + dx)
+        bmp4["y"] = self.typed(bmp4["y"] + dy)
+        touching = self.tree(self.cells).query_ball_point(np.column_stack([bmp4["x"] + bmp4["replicate"] * self.stride , bmp4["y"]]),
+                                                          Constants.BMP4_R + Constants.STEMCELL_R , return_length=True)
+        bounce = (-0.5) ** touching
+        bmp4["x"] = self.typed(bmp4["x"] + dx * bounce)
+        bmp4["y"] = self.typed(bmp4["y"] + dy * bounce)
+        settle = mobile & (draws["immobilize"] < 49)
+        held = alive & bmp4["immobilized"]
+        bmp4["immobilized"][settle] = True
+        bmp4["immobilized_timer"][settle] = draws["immobilized_timer"][settle]
+        bmp4["immobilized_timer"][held] -= 1
+        bmp4["immobilized"][held & (bmp4["immobilized_timer"] == 0)] = False
+
+        #BMP4.reaction_regulation, against the NOG before they move
+        idle = alive & (bmp4["active_timer"] == 0)
+        bound = idle & (self.tree(nog).query_ball_point(np.column_stack([bmp4["x"] + bmp4["replicate"] * self.stride , bmp4["y"]]),
+                                                        Constants.BMP4_R + Constants.NOG_R , return_length=True) > 0)
+        counting = alive & ~idle
+        bmp4["active"][bound] = False
+        bmp4["active_timer"][bound] = draws["active_timer"][bound]
+        bmp4["active_timer"][counting] -= 1
+        bmp4["active"][counting & (bmp4["active_timer"] == 0)] = True
+
+        #NOG.movement
+        moving = live[nog["replicate"]]
+        x , y = drift(center[0] - nog["x"] , center[1] - nog["y"] , nogDraws["shift"] , nogDraws["uniform"])
+        norm = np.hypot(x , y) * 0.5
+        nog["x"] = self.typed(np.where(moving , nog["x"] + x / norm , nog["x"]))
+        nog["y"] = self.typed(np.where(moving , nog["y"] + y / norm , nog["y"]))
+
+        #Only when opted in, as in ABM: a BMP4 deactivated with no timer left can still be reactivated by a later NOG
+        if self.retire_inactive_bmp4:
+            dead = ~bmp4["active"] & (bmp4["active_timer"] == 0)
+            if dead.any():
+                self.bmp4 = {name : values[~dead] for name , values in bmp4.items()}
+
+
+    def step(self):
+        live = self.replicateRunning.copy()
+        if not live.any():
+            return
+        self.calcAvgs(live)
+        tree = self.tree(self.cells)
+        pairs = self.touchingPairs(tree , Constants.STEMCELL_R - .01 , live)
+        self.updateFields(live)
+        if self.start_diff.any():
+            self.cascade(tree , live)
+        counting = live & self.start_diff
+        self.end_time[counting & (self.end_time == -2)] = 3
+        self.end_time[counting] -= 1
+        self.stepCells(pairs , live)
+        self.stepMolecules(live)
+
+        self.steps[live] += 1
+        self.schedule.steps += 1
+        self.schedule.time += 1
+        self.schedule.agentCount = self.agentCount()
+        for r in np.flatnonzero(live):
+            self.datacollector.add_table_row("replicates" , {"replicate" : int(r) , "tick" : int(self.steps[r]) , "num_stem_cells" : int(self.counts[r]),
+                                                            "avg_x" : self.avg_x[r] , "avg_y" : self.avg_y[r] , "avg_radius" : self.avg_radius[r],
+                                                            "start_diff" : bool(self.start_diff[r])})
+            if self.end_time[r] == -1 and self.start_diff[r]:
+                self.replicateRunning[r] = False
+                self.stop_reasons[r] = "differentiation"
+
+
+    @property
+    def running(self):
+        return bool(self.replicateRunning.any())
+
+
+    @property
+    def stop_reason(self):
+        return None if self.running else "differentiation"
+
+
+    def summaries(self):
+        '''Batch.summarize of every replicate, as if each had been a separate ABM run'''
+        states = np.bincount(self.cells["replicate"] * len(STATES) + self.cells["state"] , minlength=self.replicates * len(STATES)).reshape(self.replicates , len(STATES))
+        results = []
+        for r in range(self.replicates):
+            summary = {
+                "ticks" : int(self.steps[r]),
+                "running" : bool(self.replicateRunning[r]),
+                "stop_reason" : self.stop_reasons[r],
+                "num_stem_cells" : int(self.counts[r]),
+                "avg_x" : self.avg_x[r],
+                "avg_y" : self.avg_y[r],
+                "avg_radius" : self.avg_radius[r]
+            }
+            summary.update(zip(STATES , (int(count) for count in states[r])))
+            results.append(summary)
+        return results
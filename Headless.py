@@ -0,0 +1,270 @@
+"""Headless runner for long unattended runs (batch nodes, no browser)
+
+    python -m stemcellabm run --ticks 500 --seed 1 --output runs/a
+    python -m stemcellabm run --config sweep.yaml --endo-min 0.7
+    python -m stemcellabm run --ticks 2000 --record runs/a/frames --record-every 5
+    python -m stemcellabm run --ticks 2000 --num-stem-cells 20000 --tiles 8
+    python -m stemcellabm run --ticks 500 --replicates 32 --output runs/ensemble
+    python -m stemcellabm replay runs/a/frames
+    python -m stemcellabm render runs/a/frames --output runs/a/movie.mp4
+    python -m stemcellabm precision --ticks 200 --config sweep.yaml
+
+Run these from the directory containing the model files (or with it on PYTHONPATH): stemcellabm only launches the
+modules beside it and is not an installable package.
+
+Parameters default to Constants.py, are overridden by a JSON/YAML config file and then by command-line flags.
+run only imports the model modules, never the mesa visualization or matplotlib. replay serves a recording in the
+browser and render rasterizes it to PNGs or a video; neither runs the model. precision runs the parameters at float64 and
+float32 side by side and reports how far they drift apart.
+"""
+import argparse
+import json
+import os
+import time
+import Constants
+
+
+#ABM keyword arguments and their defaults, in constructor order
+MODEL_PARAMS = {
+    "num_stem_cells" : Constants.NUM_STEM_CELLS,
+    "sauce" : Constants.SAUCE,
+    "num_BMP4" : Constants.NUM_BMP4,
+    "num_NOG" : Constants.NUM_NOG,
+    "spawn_freq" : Constants.SPAWN_FREQ,
+    "diff_timer" : Constants.DIFF_TIMER,
+    "endo_min" : Constants.ENDO_MIN,
+    "ecto_max" : Constants.ECTO_MAX,
+    "max_x" : Constants.MAX_X,
+    "max_y" : Constants.MAX_Y,
+    "seed" : None,
+    "profile" : False,
+    "field_nx" : Constants.FIELD_NX,
+    "field_ny" : Constants.FIELD_NY,
+    "field_solver" : Constants.FIELD_SOLVER,
+    "field_tol" : Constants.FIELD_TOL,
+    "binding_rate" : Constants.BINDING_RATE,
+    "stop_field_change" : Constants.STOP_FIELD_CHANGE,
+    "stop_drift" : Constants.STOP_DRIFT,
+    "stop_plateau" : Constants.STOP_PLATEAU,
+    "max_agents" : Constants.MAX_AGENTS,
+    "stop_window" : Constants.STOP_WINDOW,
+    "precision" : Constants.PRECISION,
+    "retire_inactive_bmp4" : Constants.RETIRE_INACTIVE_BMP4
+}
+
+#Options of the run itself (not passed to ABM)
+RUN_PARAMS = {
+    "ticks" : None,
+    "report_every" : 50,
+    "output" : None,
+    "trace" : None,
+    "tiles" : 1,
+    "replicates" : 1,
+    "record" : None,
+    "record_every" : 1,
+    "record_field" : True
+}
+
+
+#stemcellabm imports the flat modules of the repository, so it has to be started from there
+USAGE_NOTE = "Run from the directory containing the model files (or with it on PYTHONPATH); stemcellabm is not an installable package."
+
+
+def loadConfig(path):
+    '''Reads a flat JSON or YAML mapping of model/run parameters'''
+    with open(path) as f:
+        if path.endswith((".yaml" , ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("Reading {} needs PyYAML (pip install pyyaml), or use a JSON config".format(path))
+            config = yaml.safe_load(f) or {}
+        else:
+            config = json.load(f)
+    unknown = set(config) - set(MODEL_PARAMS) - set(RUN_PARAMS)
+    if unknown:
+        raise SystemExit("Unknown parameter(s) in {}: {}".format(path , ", ".join(sorted(unknown))))
+    return config
+
+
+def buildParser():
+    parser = argparse.ArgumentParser(prog="python -m stemcellabm" , description="Stem Cell ABM command-line runner" , epilog=USAGE_NOTE)
+    commands = parser.add_subparsers(dest="command" , required=True)
+    run = commands.add_parser("run" , help="Run ABM without visualization")
+    run.add_argument("--config" , help="JSON or YAML file of parameters (keys are the ABM/run parameter names)")
+    run.add_argument("--num-stem-cells" , dest="num_stem_cells" , type=int)
+    run.add_argument("--sauce" , dest="sauce" , action=argparse.BooleanOptionalAction , default=None)
+    run.add_argument("--num-bmp4" , dest="num_BMP4" , type=int)
+    run.add_argument("--num-nog" , dest="num_NOG" , type=int)
+    run.add_argument("--spawn-freq" , dest="spawn_freq" , type=int)
+    run.add_argument("--diff-timer" , dest="diff_timer" , type=int)
+    run.add_argument("--endo-min" , dest="endo_min" , type=float)
+    run.add_argument("--ecto-max" , dest="ecto_max" , type=float)
+    run.add_argument("--max-x" , dest="max_x" , type=float)
+    run.add_argument("--max-y" , dest="max_y" , type=float)
+    run.add_argument("--field-nx" , dest="field_nx" , type=int , help="BMP4 field grid nodes along x (default: follows --max-x)")
+    run.add_argument("--field-ny" , dest="field_ny" , type=int , help="BMP4 field grid nodes along y (default: follows --max-y)")
+    run.add_argument("--field-solver" , dest="field_solver" , choices=("auto" , "direct" , "cg" , "multigrid") , help="How the BMP4 field is solved each tick (default auto: multigrid from 250,000 nodes up, direct below)")
+    run.add_argument("--field-tol" , dest="field_tol" , type=float , help="Relative residual tolerance of the cg/multigrid field solvers (default 1e-8)")
+    run.add_argument("--binding-rate" , dest="binding_rate" , type=float , help="NOG-BMP4 binding rate of the morphogen fields (default 0)")
+    run.add_argument("--stop-field-change" , dest="stop_field_change" , type=float , help="Stop once the BMP4 field changes by less than this (relative) per tick for --stop-window ticks")
+    run.add_argument("--stop-drift" , dest="stop_drift" , type=float , help="Stop once the centroid and average radius move less than this over --stop-window ticks")
+    run.add_argument("--stop-plateau" , dest="stop_plateau" , type=float , help="Stop once the differentiated fraction changes by less than this over --stop-window ticks")
+    run.add_argument("--max-agents" , dest="max_agents" , type=int , help="Stop once the model holds more agents than this")
+    run.add_argument("--stop-window" , dest="stop_window" , type=int , help="Ticks a steady-state criterion must hold (default 20)")
+    run.add_argument("--seed" , type=int)
+    run.add_argument("--profile" , action=argparse.BooleanOptionalAction , default=None , help="Record per-stage tick timings")
+    run.add_argument("--profile-allocations" , dest="profile_allocations" , action="store_true",
+                     help="Also record the bytes each stage allocates, with tracemalloc (implies --profile, slows the run)")
+    run.add_argument("--ticks" , type=int , help="Stop after this many ticks (default: run until the model stops itself)")
+    run.add_argument("--report-every" , dest="report_every" , type=int , help="Print throughput every N ticks (default 50, 0 disables)")
+    run.add_argument("--output" , help="Directory for model_vars.csv, summary.json and params.json")
+    run.add_argument("--trace" , help="Write the profiler's Chrome trace to this file (implies --profile)")
+    run.add_argument("--tiles" , type=int , help="Split the space into this many strips, each stepped by its own process (default 1)")
+    run.add_argument("--precision" , choices=("float64" , "float32") , help="Precision of positions, fields and field operators (default float64)")
+    run.add_argument("--retire-inactive-bmp4" , dest="retire_inactive_bmp4" , action=argparse.BooleanOptionalAction , default=None,
+                     help="Retire BMP4 deactivated with no timer left instead of waiting for a NOG to touch them again (changes the dynamics, default off)")
+    run.add_argument("--replicates" , type=int , help="Step this many independent replicates together in one vectorized ensemble (default 1)")
+    run.add_argument("--record" , help="Directory receiving per-tick agent positions and states for replay/render")
+    run.add_argument("--record-every" , dest="record_every" , type=int , help="Record every Nth tick (default 1)")
+    run.add_argument("--record-field" , dest="record_field" , action=argparse.BooleanOptionalAction , default=None , help="Store the BMP4 field with each recorded frame (default on)")
+
+    replay = commands.add_parser("replay" , help="Serve a recorded run in the browser with seek and speed sliders")
+    replay.add_argument("path" , help="Directory written by run --record")
+    replay.add_argument("--port" , type=int , default=8521)
+
+    precision = commands.add_parser("precision" , help="Run the parameters at float64 and float32 from one seed and report how far they diverge")
+    precision.add_argument("--config" , help="JSON or YAML file of parameters, as for run")
+    precision.add_argument("--num-stem-cells" , dest="num_stem_cells" , type=int)
+    precision.add_argument("--ticks" , type=int , default=100)
+    precision.add_argument("--seed" , type=int , default=0)
+    precision.add_argument("--output" , help="Also write the full comparison (per-tick differences) to this JSON file")
+
+    render = commands.add_parser("render" , help="Rasterize a recorded run to PNGs or a video in parallel")
+    render.add_argument("path" , help="Directory written by run --record")
+    render.add_argument("--output" , required=True , help="Directory for frame_*.png, or a video file (.mp4, .webm, ...) encoded with ffmpeg")
+    render.add_argument("--width" , type=int , default=500)
+    render.add_argument("--height" , type=int , default=500)
+    render.add_argument("--fps" , type=int , default=30)
+    render.add_argument("--processes" , type=int , help="Worker processes (default: every core)")
+    return parser
+
+
+def resolveParams(args):
+    '''Merges Constants defaults, the config file and the command-line flags (in increasing priority)'''
+    params = dict(MODEL_PARAMS)
+    params.update(RUN_PARAMS)
+    if args.config:
+        params.update(loadConfig(args.config))
+    for name in params:
+        value = getattr(args , name , None)
+        if value is not None:
+            params[name] = value
+    if getattr(args , "profile_allocations" , False):
+        params["profile"] = "allocations"
+    if params["trace"] and not params["profile"]:
+        params["profile"] = True
+    modelParams = {name : params[name] for name in MODEL_PARAMS}
+    runParams = {name : params[name] for name in RUN_PARAMS}
+    return modelParams , runParams
+
+
+def run(modelParams, ticks=None, report_every=50, output=None, trace=None, tiles=1, replicates=1, record=None, record_every=1, record_field=True):
+    '''Runs ABM (or DecomposedABM when tiles > 1, EnsembleABM when replicates > 1) to the tick limit (or until running
+        is False) and writes its outputs'''
+    from StemCellABM import ABM
+    from Batch import summarize
+
+    start = time.perf_counter()
+    if tiles > 1 and replicates > 1:
+        raise SystemExit("--tiles and --replicates cannot be combined")
+    if tiles > 1:
+        if modelParams["profile"] or trace or record:
+            raise SystemExit("--profile, --trace and --record need a single process (--tiles 1)")
+        from Decomposition import DecomposedABM
+        model = DecomposedABM(tiles=tiles , **{name : value for name , value in modelParams.items() if name != "profile"})
+    elif replicates > 1:
+        stops = ("stop_field_change" , "stop_drift" , "stop_plateau" , "max_agents")
+        if modelParams["profile"] or trace or record or any(modelParams[name] is not None for name in stops):
+            raise SystemExit("--profile, --trace, --record, --stop-* and --max-agents need a single replicate (--replicates 1)")
+        from Ensemble import EnsembleABM
+        model = EnsembleABM(replicates=replicates , **{name : value for name , value in modelParams.items() if name not in stops + ("profile" , "stop_window")})
+    else:
+        model = ABM(**modelParams)
+    print("Model built in {:.2f}s with {} agents".format(time.perf_counter() - start , model.schedule.get_agent_count()) , flush=True)
+    recorder = None
+    if record:
+        from Replay import Recorder
+        recorder = Recorder(record , record_every , record_field)
+        recorder.capture(model)
+
+    start = time.perf_counter()
+    lastReport = start
+    lastTick = 0
+    while model.running and (ticks is None or model.schedule.steps < ticks):
+        model.step()
+        if recorder is not None:
+            recorder.capture(model)
+        tick = model.schedule.steps
+        if report_every and tick % report_every == 0:
+            now = time.perf_counter()
+            rate = (tick - lastTick) / (now - lastReport)
+            line = "tick {:>7} | {:8.2f} ticks/sec | {:>8} agents | {:>8} stem cells".format(tick , rate , model.schedule.get_agent_count() , model.num_stem_cells)
+            if model.grid.solver != "direct":
+                line += " | {:>4} field iterations".format(model.field_iterations)
+            print(line , flush=True)
+            lastReport = now
+            lastTick = tick
+    elapsed = time.perf_counter() - start
+    tick = model.schedule.steps
+    print("Finished {} ticks in {:.2f}s ({:.2f} ticks/sec), running={}, stop_reason={}".format(tick , elapsed , tick / elapsed if elapsed > 0 else 0.0 , model.running , model.stop_reason) , flush=True)
+
+    if output:
+        os.makedirs(output , exist_ok=True)
+        if replicates > 1:
+            #One row per replicate per tick, and a list with one summary per replicate
+            model.datacollector.get_table_dataframe("replicates").to_csv(os.path.join(output , "replicates.csv") , index=False)
+            summary = model.summaries()
+        else:
+            model.datacollector.get_model_vars_dataframe().to_csv(os.path.join(output , "model_vars.csv") , index_label="tick")
+            summary = summarize(model)
+        with open(os.path.join(output , "summary.json") , "w") as f:
+            json.dump(summary , f , indent=2 , default=float)
+        with open(os.path.join(output , "params.json") , "w") as f:
+            json.dump(modelParams , f , indent=2)
+    if trace:
+        model.profiler.dumpTrace(trace)
+    if tiles > 1:
+        model.close()
+    return model
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    if args.command == "run":
+        modelParams , runParams = resolveParams(args)
+        run(modelParams , **runParams)
+    elif args.command == "precision":
+        from Precision import validate , report
+        modelParams , runParams = resolveParams(args)
+        result = validate(modelParams , args.ticks , args.seed)
+        for line in report(result):
+            print(line)
+        if args.output:
+            with open(args.output , "w") as f:
+                json.dump(result , f , indent=2)
+    elif args.command == "replay":
+        from ReplayVisualize import serve
+        serve(args.path , args.port)
+    elif args.command == "render":
+        from Replay import renderFrames
+        start = time.perf_counter()
+        try:
+            frames = renderFrames(args.path , args.output , args.width , args.height , args.fps , args.processes)
+        except RuntimeError as error:
+            raise SystemExit(str(error))
+        print("Rendered {} frames to {} in {:.2f}s".format(frames , args.output , time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def removeAgents(space, agents):
+    '''Removes every agent in agents from a ContinuousSpace in one pass
+
+        ContinuousSpace.remove_agent deletes one row of _agent_points and shifts every later index, O(n) per agent.
+        Here the surviving rows are kept with one mask and the index maps rebuilt once, in the same order.'''
+    if not agents:
+        return
+    keep = np.ones(len(space._agent_points) , dtype=bool)
+    for agent in agents:
+        keep[space._agent_to_index[agent]] = False
+        agent.pos = None
+    survivors = [space._index_to_agent[i] for i in np.flatnonzero(keep)]
+    space._agent_points = space._agent_points[keep]
+    space._index_to_agent = dict(enumerate(survivors))
+    space._agent_to_index = {agent : i for i , agent in enumerate(survivors)}
+
+
+
+class MoleculePool:
+    '''Creation of the Molecule Lifecycle: Batched Removal and Recycled Agents
+
+        A molecule that can no longer affect the model calls retire() while it steps: an absorbed NOG, and, when
+        the model is built with retire_inactive_bmp4=True, a BMP4 deactivated with no timer left (an
+        approximation, since a later NOG could still reactivate it). At the end of the tick flush() takes every
+        retired molecule out of the space (one removeAgents pass), the schedule and the model's BMP4/NOG lists,
+        and keeps the objects on a free list per class. acquire() re-initializes a pooled object for the next
+        molecule released instead of building a new agent. The current model marks no NOG absorbed and releases
+        none (StemCell.spawnBMP4 has no caller), so retirement of NOG and acquire() only run when something does.
+        Space scans, the schedule and renders then only see live molecules.
+
+        Attributes:
+            model : ABM : Model whose space, schedule and molecule lists are managed
+            capacity : Int : Most pooled agents kept per class (further retired agents are left to the garbage collector)
+            free : Dict[type, List[Agent]] : Retired agents per class, ready for reuse
+            retiring : Dict[Agent, None] : Agents retired this tick, in retirement order
+            retired , reused : Int : Molecules retired and pooled agents reused since the model was built'''
+
+    def __init__(self, model, capacity=1024):
+        self.model = model
+        self.capacity = capacity
+        self.free = {}
+        self.retiring = {}
+        self.retired = 0
+        self.reused = 0
+
+
+    @property
+    def pooled(self):
+        return sum(len(agents) for agents in self.free.values())
+
+
+    def acquire(self, cls, pos):
+        '''A cls molecule with the next unique_id, scheduled and placed at pos (a pooled one when available)'''
+        model = self.model
+        model.currentIDNum += 1
+        free = self.free.get(cls)
+        if free:
+            agent = free.pop()
+            agent.__init__(model.currentIDNum , model)
+            self.reused += 1
+        else:
+            agent = cls(model.currentIDNum , model)
+        model.schedule.add(agent)
+        model.space.place_agent(agent , pos)
+        return agent
+
+
+    def retire(self, agent):
+        self.retiring[agent] = None
+
+
+    def flush(self):
+        '''Removes the molecules retired this tick and pools them'''
+        if not self.retiring:
+            return
+        model = self.model
+        dead = self.retiring
+        self.retiring = {}
+        removeAgents(model.space , list(dead))
+        for agent in dead:
+            model.schedule.remove(agent)
+            free = self.free.setdefault(type(agent) , [])
+            if len(free) < self.capacity:
+                free.append(agent)
+        model.BMP4 = [agent for agent in model.BMP4 if agent not in dead]
+        model.NOG = [agent for agent in model.NOG if agent not in dead]
+        self.retired += len(dead)
@@ -0,0 +1,105 @@
+import numpy as np
+from mesa.space import ContinuousSpace
+
+
+#Names accepted by ABM(..., precision=) and --precision
+PRECISIONS = {"float64" : np.float64 , "float32" : np.float32}
+
+#Colony statistics compared tick by tick by validate()
+STATISTICS = ("num_stem_cells" , "avg_x" , "avg_y" , "avg_radius")
+
+
+class TypedContinuousSpace(ContinuousSpace):
+    '''Creation of a ContinuousSpace Storing Positions in a Given Precision
+
+        _agent_points (and every neighbour search over it) uses dtype, and each agent.pos is rounded to a value that
+        dtype represents exactly, so agents and the point array always agree.'''
+
+    def __init__(self, x_max, y_max, torus, x_min=0, y_min=0, dtype=np.float32):
+        super().__init__(x_max , y_max , torus , x_min , y_min)
+        self.dtype = np.dtype(dtype)
+
+
+    def rounded(self, pos):
+        return tuple(float(value) for value in np.asarray(pos , dtype=self.dtype))
+
+
+    def place_agent(self, agent, pos):
+        pos = self.rounded(self.torus_adj(pos))
+        row = np.array([pos] , dtype=self.dtype)
+        if self._agent_points is None:
+            self._agent_points = row
+        else:
+            self._agent_points = np.append(self._agent_points , row , axis=0)
+        self._index_to_agent[self._agent_points.shape[0] - 1] = agent
+        self._agent_to_index[agent] = self._agent_points.shape[0] - 1
+        agent.pos = pos
+
+
+    def move_agent(self, agent, pos):
+        super().move_agent(agent , self.rounded(self.torus_adj(pos)))
+
+
+    def get_neighbors(self, pos, radius, include_center=True):
+        deltas = np.abs(self._agent_points - np.array(pos , dtype=self.dtype))
+        if self.torus:
+            deltas = np.minimum(deltas , np.array(self.size , dtype=self.dtype) - deltas)
+        dists = deltas[: , 0] ** 2 + deltas[: , 1] ** 2
+        (idxs ,) = np.where(dists <= self.dtype.type(radius) ** 2)
+        return [self._index_to_agent[x] for x in idxs if include_center or dists[x] > 0]
+
+
+
+def validate(params, ticks=100, seed=0):
+    '''Runs params at float64 and at float32 from the same seed, side by side, and measures how far they drift apart
+
+        Both runs draw the same random numbers, so every difference comes from rounding. Returns a dict with
+            history : List[Dict] : Per tick, the absolute difference of every STATISTICS value, the largest position
+                difference of the cells both runs hold (matched by unique_id) and the largest BMP4 field difference
+                relative to the float64 field's maximum
+            states : Dict[str, List[Int]] : Final StemCell count per differentiation state, [float64, float32]
+            mismatch : Float : Fraction of the shared cells whose final differentiation state differs
+            ticks : Int : Ticks both runs completed'''
+    from StemCellABM import ABM
+    params = {name : value for name , value in params.items() if name not in ("seed" , "precision")}
+    double = ABM(seed=seed , precision="float64" , **params)
+    single = ABM(seed=seed , precision="float32" , **params)
+    history = []
+    while double.running and single.running and double.schedule.steps < ticks:
+        double.step()
+        single.step()
+        row = {"tick" : double.schedule.steps}
+        for name in STATISTICS:
+            row[name] = abs(float(getattr(double , name)) - float(getattr(single , name)))
+        positions = {cell.unique_id : cell.pos for cell in single.cells}
+        shared = [(cell.pos , positions[cell.unique_id]) for cell in double.cells if cell.unique_id in positions]
+        row["position"] = max((max(abs(a[0] - b[0]) , abs(a[1] - b[1])) for a , b in shared) , default=0.0)
+        scale = float(np.abs(double.BMP4vector).max()) or 1.0
+        row["field"] = float(np.abs(double.BMP4vector - single.BMP4vector.astype(np.float64)).max()) / scale
+        history.append(row)
+
+    statesDouble = {cell.unique_id : cell.differentiated for cell in double.cells}
+    statesSingle = {cell.unique_id : cell.differentiated for cell in single.cells}
+    shared = statesDouble.keys() & statesSingle.keys()
+    states = {}
+    for label in ("virgin" , "endo" , "meso" , "ecto"):
+        states[label] = [sum(state == label for state in statesDouble.values()) , sum(state == label for state in statesSingle.values())]
+    return {
+        "ticks" : double.schedule.steps,
+        "history" : history,
+        "states" : states,
+        "mismatch" : sum(statesDouble[i] != statesSingle[i] for i in shared) / len(shared) if shared else 0.0
+    }
+
+
+def report(result):
+    '''Lines summarizing a validate() result'''
+    lines = ["{} ticks compared (float64 vs float32)".format(result["ticks"])]
+    if result["history"]:
+        worst = {name : max(row[name] for row in result["history"]) for name in STATISTICS + ("position" , "field")}
+        lines.append("largest difference: " + " | ".join("{} {:.3g}".format(name , value) for name , value in worst.items()))
+        diverged = [row["tick"] for row in result["history"] if row["num_stem_cells"] > 0 or row["position"] > 1e-3]
+        lines.append("first tick with a different cell count or a cell moved apart by > 1e-3: {}".format(diverged[0] if diverged else "none"))
+    lines.append("final states [float64, float32]: " + " | ".join("{} {}".format(label , counts) for label , counts in result["states"].items()))
+    lines.append("cells whose final state differs: {:.2%}".format(result["mismatch"]))
+    return lines
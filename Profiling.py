@@ -0,0 +1,165 @@
+from collections import deque
+from functools import partial
+import json
+import os
+import time
+import tracemalloc
+
+
+class TickProfiler:
+    '''Creation of Per-Stage Tick Profiler
+
+        Records wall time, call counts and (optionally) allocated bytes for every stage of ABM.step() and for each
+        agent type stepped by the scheduler. Only the most recent capacity ticks are kept.
+
+        ABM only calls into the profiler when ABM(..., profile=True) (profile="allocations" also turns on trackAllocations),
+        so a model built without it pays a single None check per stage.
+
+        Attributes:
+            capacity : Int : Number of ticks kept in the ring buffer
+            trackAllocations : Boolean : If True, tracemalloc measures the peak bytes allocated by each stage (slow)
+            ticks : deque : Ring buffer of tick records, oldest first. Each record is a dict
+                {"tick": Int, "start": Float, "seconds": Float, "stages": {name: {"seconds", "calls", "bytes", "start"}},
+                 "agents": {type name: {"seconds", "calls"}}}
+            last : Dict : The most recently finished tick record (None before the first tick)'''
+
+    def __init__(self, capacity: int=1000, trackAllocations: bool=False) -> None:
+        self.capacity = capacity
+        self.trackAllocations = trackAllocations
+        self.ticks = deque(maxlen=capacity)
+        self.last = None
+        self.current = None
+        self.origin = time.perf_counter()
+        if trackAllocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+    def beginTick(self, tick):
+        self.current = {"tick" : tick , "start" : time.perf_counter() , "seconds" : 0.0 , "stages" : {} , "agents" : {}}
+
+
+    def endTick(self):
+        record = self.current
+        record["seconds"] = time.perf_counter() - record["start"]
+        self.ticks.append(record)
+        self.last = record
+        self.current = None
+
+
+    def _entry(self, name, start):
+        stages = self.current["stages"]
+        if name not in stages:
+            stages[name] = {"seconds" : 0.0 , "calls" : 0 , "bytes" : 0 , "start" : start}
+        return stages[name]
+
+
+    def runStage(self, name, method):
+        '''Calls method() and adds its wall time (and allocations) to stage name of the current tick'''
+        if self.trackAllocations:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        method()
+        end = time.perf_counter()
+        entry = self._entry(name , start)
+        entry["seconds"] += end - start
+        entry["calls"] += 1
+        if self.trackAllocations:
+            entry["bytes"] += max(tracemalloc.get_traced_memory()[1] - before , 0)
+
+
+    def stepSchedule(self, schedule):
+        '''Runs schedule.step() like BaseScheduler does, timing every agent step by agent type'''
+        def step():
+            agents = self.current["agents"]
+            clock = time.perf_counter
+            for agent in schedule.agent_buffer(shuffled=False):
+                start = clock()
+                agent.step()
+                elapsed = clock() - start
+                name = type(agent).__name__
+                if name not in agents:
+                    agents[name] = {"seconds" : 0.0 , "calls" : 0}
+                agents[name]["seconds"] += elapsed
+                agents[name]["calls"] += 1
+            schedule.steps += 1
+            schedule.time += 1
+        self.runStage("schedule" , step)
+
+
+    def stageSeconds(self, name):
+        '''Wall time of stage name in the last finished tick (0 if it did not run)'''
+        if self.last is None or name not in self.last["stages"]:
+            return 0.0
+        return self.last["stages"][name]["seconds"]
+
+
+    def stageBytes(self, name):
+        '''Bytes allocated by stage name in the last finished tick (0 if it did not run or allocations are not tracked)'''
+        if self.last is None or name not in self.last["stages"]:
+            return 0
+        return self.last["stages"][name]["bytes"]
+
+
+    def reporters(self, stages):
+        '''Model reporters for a mesa DataCollector: total tick time plus one column per stage (and one per stage for
+            the allocated bytes when trackAllocations is on)'''
+        reporters = {"tick_seconds" : _tickSeconds}
+        for name in stages:
+            reporters[name + "_seconds"] = partial(_stageSeconds , name)
+        if self.trackAllocations:
+            for name in stages:
+                reporters[name + "_bytes"] = partial(_stageBytes , name)
+        return reporters
+
+
+    def summary(self):
+        '''Totals per stage and per agent type over every tick in the ring buffer'''
+        stages = {}
+        agents = {}
+        for record in self.ticks:
+            for name , entry in record["stages"].items():
+                total = stages.setdefault(name , {"seconds" : 0.0 , "calls" : 0 , "bytes" : 0})
+                total["seconds"] += entry["seconds"]
+                total["calls"] += entry["calls"]
+                total["bytes"] += entry["bytes"]
+            for name , entry in record["agents"].items():
+                total = agents.setdefault(name , {"seconds" : 0.0 , "calls" : 0})
+                total["seconds"] += entry["seconds"]
+                total["calls"] += entry["calls"]
+        return {"ticks" : len(self.ticks) , "stages" : stages , "agents" : agents}
+
+
+    def dumpTrace(self, path):
+        '''Writes the ring buffer as a Chrome trace (chrome://tracing, Perfetto and speedscope all open it)
+
+            Every tick and stage becomes a complete ("X") event. Agent steps are interleaved within the schedule
+            stage, so their per-type totals are attached to the schedule event as args.'''
+        pid = os.getpid()
+        events = []
+        for record in self.ticks:
+            events.append({"name" : "tick {}".format(record["tick"]) , "ph" : "X" , "pid" : pid , "tid" : 0,
+                           "ts" : (record["start"] - self.origin) * 1e6 , "dur" : record["seconds"] * 1e6})
+            for name , entry in record["stages"].items():
+                args = {"calls" : entry["calls"] , "bytes" : entry["bytes"]}
+                if name == "schedule":
+                    args.update({agent + " seconds" : value["seconds"] for agent , value in record["agents"].items()})
+                    args.update({agent + " calls" : value["calls"] for agent , value in record["agents"].items()})
+                events.append({"name" : name , "ph" : "X" , "pid" : pid , "tid" : 0,
+                               "ts" : (entry["start"] - self.origin) * 1e6 , "dur" : entry["seconds"] * 1e6 , "args" : args})
+        with open(path , "w") as f:
+            json.dump({"traceEvents" : events , "displayTimeUnit" : "ms"} , f)
+
+
+
+#Module-level reporters (rather than lambdas) keep a profiled model picklable for Batch.forkRuns
+def _tickSeconds(model):
+    return model.profiler.last["seconds"] if model.profiler.last else 0.0
+
+
+def _stageSeconds(name, model):
+    return model.profiler.stageSeconds(name)
+
+
+def _stageBytes(name, model):
+    return model.profiler.stageBytes(name)
@@ -0,0 +1,372 @@
+"""Recording and offline replay of model runs
+
+    Recorder writes one compressed .npz per recorded tick (uint32 unique_ids, float32 x/y, uint8 type/state codes and
+    optionally the solved BMP4 field) plus a meta.json describing the space and palette. A Recording reads them back,
+    ReplayModel steps through them like a model (see ReplayVisualize.py), and renderFrames rasterizes them to PNGs or a
+    video in worker processes. Nothing here runs the model.
+
+    python -m stemcellabm run --ticks 2000 --record runs/a/frames
+    python -m stemcellabm replay runs/a/frames
+    python -m stemcellabm render runs/a/frames --output runs/a/movie.mp4
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import zlib
+import numpy as np
+from mesa import Model
+from mesa.agent import Agent
+from StemCellABM import StemCell, BMP4 , NOG
+import Constants
+
+
+#Type/state codes shared by the live binary canvas and recordings. PALETTE[code] draws an agent the same way
+#agent_portrayal does
+PALETTE = [
+    {"Color" : "black" , "r" : Constants.STEMCELL_R , "Filled" : "true" , "Layer" : 1},   #0 StemCell virgin
+    {"Color" : "blue" , "r" : Constants.STEMCELL_R , "Filled" : "true" , "Layer" : 1},    #1 StemCell endo
+    {"Color" : "green" , "r" : Constants.STEMCELL_R , "Filled" : "true" , "Layer" : 1},   #2 StemCell meso
+    {"Color" : "red" , "r" : Constants.STEMCELL_R , "Filled" : "true" , "Layer" : 1},     #3 StemCell ecto
+    {"Color" : "white" , "r" : Constants.STEMCELL_R , "Filled" : "true" , "Layer" : 0},   #4 StemCell dumb
+    {"Color" : "blue" , "r" : Constants.BMP4_R , "Filled" : "true" , "Layer" : 2},        #5 BMP4
+    {"Color" : "purple" , "r" : Constants.NOG_R , "Filled" : "true" , "Layer" : 3},       #6 NOG
+    {"Color" : "white" , "r" : Constants.NOG_R , "Filled" : "true" , "Layer" : 0}         #7 NOG absorbed
+]
+
+STEM_CELL_CODES = {"virgin" : 0 , "endo" : 1 , "meso" : 2 , "ecto" : 3 , "dumb" : 4}
+MOLECULE_CODES = (5 , 6 , 7)
+
+#RGB of the color names used by PALETTE and the field heatmap, for the offline renderer
+COLORS = {"black" : (0 , 0 , 0) , "white" : (255 , 255 , 255) , "blue" : (0 , 0 , 255) , "green" : (0 , 128 , 0),
+          "red" : (255 , 0 , 0) , "purple" : (128 , 0 , 128) , "orange" : (255 , 165 , 0)}
+
+
+def agent_portrayal(agent : Agent):
+    """Definition of Agent Portrayals
+
+        Can be adjusted to make images of agents appear differently in the visualization. 
+        Currently, I am using small circles for all with different colors to distinguish between agents
+
+        Colors:
+            StemCell = Black* 
+            BMP4 = Blue
+            NOG = Purple
+            
+            *Differentiated StemCells have color dependent on their classification:
+                endo: Blue
+                meso: Green
+                ecto: Red 
+            """
+
+    if agent.__class__ == StemCell:
+        dumb = 1
+        if agent.differentiated == "virgin":
+            color = "black"
+        elif agent.differentiated == "endo":
+            color = "blue"
+        elif agent.differentiated == "meso":
+            color = "green"
+        elif agent.differentiated == "ecto":
+            color = "red"
+        elif agent.differentiated == "dumb":
+            dumb = 0
+            color = "white"
+        portrayal = {
+            "Shape" : "circle",
+            "Filled" : "true",
+            "r" : Constants.STEMCELL_R,
+            "Color" : color,
+            "Layer" : dumb
+        }
+        
+    elif agent.__class__ == BMP4:
+        portrayal = {
+            "Shape" : "circle",
+            "Filled" : "true",
+            "r" : Constants.BMP4_R,
+            "Color" : "blue",
+            "Layer" : 2
+        }
+    elif agent.__class__ == NOG:
+        if agent.absorbed:
+                portrayal = {
+                "Shape" : "circle",
+                "Filled" : "true",
+                "r" : Constants.NOG_R,
+                "Color" : "white",
+                "Layer" : 0
+            }
+        else:
+            portrayal = {
+                "Shape" : "circle",
+                "Filled" : "true",
+                "r" : Constants.NOG_R,
+                "Color" : "purple",
+                "Layer" : 3
+            }
+    return portrayal
+
+
+def agent_code(agent):
+    '''Index into PALETTE for an agent (the binary frame counterpart of agent_portrayal)'''
+    if agent.__class__ == StemCell:
+        return STEM_CELL_CODES[agent.differentiated]
+    elif agent.__class__ == BMP4:
+        return 5
+    elif agent.absorbed:
+        return 7
+    return 6
+
+
+def bmp4_field(model):
+    '''The solved BMP4vector as a grid whose row 0 is the top of the field, and the space it covers'''
+    return model.grid.grid(model.BMP4vector) , model.grid.extent
+
+
+
+class Recorder:
+    '''Creation of a Per-Tick Recorder of Agent Positions and States
+
+        Attributes:
+            path : String : Directory receiving meta.json and one tick_<tick>.npz per recorded tick
+            every : Int : Record every Nth tick (tick 0, the initial state, is always recorded when captured)
+            field : Boolean : If True, the solved BMP4 field is stored with each frame
+
+        Each frame is written to a temporary file and renamed into place, so a run can be replayed while it is
+        still being recorded.'''
+
+    def __init__(self, path, every=1, field=True):
+        self.path = path
+        self.every = every
+        self.field = field
+        self.frames = 0
+        os.makedirs(path , exist_ok=True)
+
+
+    def writeMeta(self, model):
+        space = model.space
+        meta = {
+            "space" : [float(space.x_min) , float(space.x_max) , float(space.y_min) , float(space.y_max)],
+            "palette" : PALETTE,
+            "molecule_codes" : list(MOLECULE_CODES),
+            "every" : self.every
+        }
+        with open(os.path.join(self.path , "meta.json") , "w") as f:
+            json.dump(meta , f , indent=2)
+
+
+    def capture(self, model):
+        '''Records the current state of model if its tick is due'''
+        tick = model.schedule.steps
+        if tick % self.every != 0:
+            return
+        if self.frames == 0:
+            self.writeMeta(model)
+        agents = model.space._index_to_agent
+        n = len(agents)
+        ids = np.fromiter((agents[i].unique_id for i in range(n)) , dtype="<u4" , count=n)
+        codes = np.fromiter((agent_code(agents[i]) for i in range(n)) , dtype=np.uint8 , count=n)
+        points = model.space._agent_points[:n] if n > 0 else np.zeros((0 , 2))
+        order = np.argsort(ids , kind="stable")
+        arrays = {"ids" : ids[order] , "x" : points[order , 0].astype("<f4") , "y" : points[order , 1].astype("<f4") , "code" : codes[order]}
+        if self.field:
+            values , extent = bmp4_field(model)
+            arrays["field"] = np.asarray(values , dtype="<f4")
+            arrays["extent"] = np.asarray(extent , dtype=float)
+
+        name = os.path.join(self.path , "tick_{:07d}.npz".format(tick))
+        with open(name + ".tmp" , "wb") as f:
+            np.savez_compressed(f , **arrays)
+        os.replace(name + ".tmp" , name)
+        self.frames += 1
+
+
+
+class Recording:
+    '''Creation of a Reader for a Recorder Directory
+
+        Attributes:
+            path : String : The recorded directory
+            ticks : ndarray : Sorted ticks that have a frame
+            space : List : x_min, x_max, y_min, y_max of the recorded space
+            palette : List[Dict] : Palette the codes index into'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path , "meta.json")) as f:
+            meta = json.load(f)
+        self.space = meta["space"]
+        self.palette = meta["palette"]
+        self.molecule_codes = tuple(meta["molecule_codes"])
+        self.every = meta["every"]
+        names = [name for name in os.listdir(path) if name.startswith("tick_") and name.endswith(".npz")]
+        self.ticks = np.array(sorted(int(name[5:-4]) for name in names) , dtype=int)
+        if len(self.ticks) == 0:
+            raise ValueError("{} has no recorded frames".format(path))
+
+
+    def __len__(self):
+        return len(self.ticks)
+
+
+    def fileOf(self, index):
+        return os.path.join(self.path , "tick_{:07d}.npz".format(self.ticks[index]))
+
+
+    def indexOf(self, tick):
+        '''Index of the first recorded frame at or after tick (the last frame if tick is past the end)'''
+        return min(int(np.searchsorted(self.ticks , tick)) , len(self.ticks) - 1)
+
+
+    def frame(self, index):
+        '''Dict of the arrays of frame index: ids, x, y, code and, when recorded, field and extent'''
+        with np.load(self.fileOf(index)) as data:
+            return {name : data[name] for name in data.files}
+
+
+
+class ReplayModel(Model):
+    '''Creation of a Model that Plays Back a Recording
+
+        Stepping advances stride recorded frames; running becomes False after the last one. start_tick seeks to the
+        first frame at or after it, so the viewer's sliders plus Reset give seek and scrub.
+
+        Attributes:
+            tick : Int : Recorded tick currently shown
+            num_agents, num_stem_cells, num_molecules : Int : Agent counts of the current frame
+            ids, xs, ys, codes : ndarray : The current frame, sorted by unique_id
+            field : Tuple : (values, extent) of the recorded BMP4 field, or None'''
+
+    def __init__(self, path, start_tick=0, stride=1):
+        super().__init__()
+        self.recording = Recording(path)
+        self.stride = max(int(stride) , 1)
+        self.index = self.recording.indexOf(start_tick)
+        self.running = True
+        self.load()
+
+
+    def load(self):
+        frame = self.recording.frame(self.index)
+        self.tick = int(self.recording.ticks[self.index])
+        self.ids , self.xs , self.ys , self.codes = frame["ids"] , frame["x"] , frame["y"] , frame["code"]
+        self.field = (frame["field"] , frame["extent"]) if "field" in frame else None
+        molecules = np.isin(self.codes , self.recording.molecule_codes)
+        self.num_agents = len(self.ids)
+        self.num_molecules = int(np.count_nonzero(molecules))
+        self.num_stem_cells = self.num_agents - self.num_molecules
+
+
+    def step(self):
+        if self.index + self.stride >= len(self.recording):
+            self.running = False
+            return
+        self.index += self.stride
+        self.load()
+
+
+
+def rasterize(frame, space, palette, width=500, height=500):
+    '''Draws one recorded frame as an RGB uint8 image the same way ContinuousCanvasModule does (field heatmap, then
+        agents by Layer); agents smaller than a pixel are drawn as one pixel'''
+    x_min , x_max , y_min , y_max = space
+    scaleX = width / x_max
+    scaleY = height / y_max
+    image = np.full((height , width , 3) , 255.0)
+
+    if "field" in frame:
+        values = frame["field"]
+        left , right , bottom , top = frame["extent"]
+        x0 , x1 = int(round(left * scaleX)) , int(round(right * scaleX))
+        y0 , y1 = int(round((y_max - top - 1) * scaleY)) , int(round((y_max - bottom - 1) * scaleY))
+        low , high = float(values.min()) , float(values.max())
+        levels = (values - low) / (high - low) if high > low else np.zeros_like(values)
+        rows = np.clip(((np.arange(max(y0 , 0) , min(y1 , height)) - y0) * values.shape[0]) // max(y1 - y0 , 1) , 0 , values.shape[0] - 1)
+        cols = np.clip(((np.arange(max(x0 , 0) , min(x1 , width)) - x0) * values.shape[1]) // max(x1 - x0 , 1) , 0 , values.shape[1] - 1)
+        alpha = 0.6 * levels[np.ix_(rows , cols)][... , None]
+        box = image[max(y0 , 0):min(y1 , height) , max(x0 , 0):min(x1 , width)]
+        box[:] = box * (1 - alpha) + np.array(COLORS["orange"]) * alpha
+
+    cx = frame["x"] * scaleX
+    cy = (y_max - frame["y"] - 1) * scaleY
+    for code in sorted(range(len(palette)) , key=lambda code: palette[code]["Layer"]):
+        mask = frame["code"] == code
+        if not mask.any():
+            continue
+        radius = max(int(round(palette[code]["r"] * scaleY)) , 0)
+        dy , dx = np.mgrid[-radius:radius + 1 , -radius:radius + 1]
+        disk = dx * dx + dy * dy <= radius * radius
+        px = (np.round(cx[mask])[: , None] + dx[disk][None , :]).astype(int).ravel()
+        py = (np.round(cy[mask])[: , None] + dy[disk][None , :]).astype(int).ravel()
+        inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+        image[py[inside] , px[inside]] = COLORS.get(palette[code]["Color"] , (0 , 0 , 0))
+    return image.astype(np.uint8)
+
+
+def writePNG(path, image):
+    '''Writes an RGB uint8 image as an 8-bit PNG (zlib only, no imaging library needed)'''
+    height , width , _ = image.shape
+    rows = np.concatenate([np.zeros((height , 1) , dtype=np.uint8) , image.reshape(height , width * 3)] , axis=1)
+
+    def chunk(tag, data):
+        return struct.pack(">I" , len(data)) + tag + data + struct.pack(">I" , zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(path , "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR" , struct.pack(">IIBBBBB" , width , height , 8 , 2 , 0 , 0 , 0)))
+        f.write(chunk(b"IDAT" , zlib.compress(rows.tobytes() , 6)))
+        f.write(chunk(b"IEND" , b""))
+
+
+
+#Recording and options shared with the renderer's worker processes (set by their initializer)
+_renderJob = None
+
+
+def _initRender(job):
+    global _renderJob
+    _renderJob = job
+
+
+def _renderFrame(index):
+    recording , directory , width , height = _renderJob
+    image = rasterize(recording.frame(index) , recording.space , recording.palette , width , height)
+    writePNG(os.path.join(directory , "frame_{:07d}.png".format(index)) , image)
+
+
+def renderFrames(path, output, width=500, height=500, fps=30, processes=None):
+    '''Rasterizes every frame of the recording in path without running the model
+
+        output : String : A directory (receives frame_0000000.png, ...) or a video file (.mp4, .webm, .mkv, .avi, .mov)
+        processes : Int : Number of worker processes (None uses every core, 1 renders in this process)
+
+        Videos are encoded with ffmpeg, which must be on the PATH. Returns the number of frames rendered.'''
+    recording = Recording(path)
+    video = os.path.splitext(output)[1].lower() in (".mp4" , ".webm" , ".mkv" , ".avi" , ".mov")
+    if video and shutil.which("ffmpeg") is None:
+        raise RuntimeError("Encoding {} needs ffmpeg on the PATH; render to a directory of PNGs instead".format(output))
+    directory = tempfile.mkdtemp(prefix="replay_") if video else output
+    os.makedirs(directory , exist_ok=True)
+
+    job = (recording , directory , width , height)
+    indices = range(len(recording))
+    try:
+        if processes == 1:
+            _initRender(job)
+            for index in indices:
+                _renderFrame(index)
+        else:
+            with multiprocessing.Pool(processes , initializer=_initRender , initargs=(job ,)) as pool:
+                for _ in pool.imap_unordered(_renderFrame , indices , chunksize=8):
+                    pass
+        if video:
+            subprocess.run(["ffmpeg" , "-y" , "-loglevel" , "error" , "-framerate" , str(fps) , "-i" , os.path.join(directory , "frame_%07d.png"),
+                            "-vf" , "pad=ceil(iw/2)*2:ceil(ih/2)*2" , "-pix_fmt" , "yuv420p" , output] , check=True)
+    finally:
+        if video:
+            shutil.rmtree(directory , ignore_errors=True)
+    return len(recording)
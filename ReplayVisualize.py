@@ -0,0 +1,53 @@
+import sys
+from mesa.visualization.UserParam import UserSettableParameter
+from mesa.visualization.modules.CanvasContinuousVisualization import DensityCanvasContinuous
+from mesa.visualization.modules.TextVisualization import TextPanel
+from Replay import Recording, ReplayModel
+from ThreadedServer import ViewerModularServer
+import Constants
+
+
+class ReplayCanvas(DensityCanvasContinuous):
+    """Creation of a DensityCanvasContinuous that Draws a ReplayModel
+
+        The agents come from the recorded arrays instead of a ContinuousSpace, so the browser side (the same
+        CanvasContinuous JS modules, binary frames and heatmaps) is unchanged.
+        """
+
+    def gather(self, model):
+        return model.ids , model.xs , model.ys , model.codes
+
+
+
+def recorded_field(model):
+    return model.field
+
+
+def buildServer(path):
+    '''ViewerModularServer replaying the recording in path. Moving the sliders and pressing Reset seeks (start_tick) or
+        changes the playback speed (stride)'''
+    recording = Recording(path)
+    x_min , x_max , y_min , y_max = recording.space
+    space = ReplayCanvas(None , recording.palette , x_max , y_max , 500 , 500 , field_method=recorded_field,
+                         molecule_codes=recording.molecule_codes , molecule_threshold=Constants.MOLECULE_THRESHOLD)
+    displayStats = TextPanel(["tick" , "num_agents" , "num_stem_cells" , "num_molecules"])
+    first , last = int(recording.ticks[0]) , int(recording.ticks[-1])
+    model_params = {
+        "path" : path,
+        "start_tick" : UserSettableParameter("slider" , "Seek to tick" , first , first , last , recording.every),
+        "stride" : UserSettableParameter("slider" , "Recorded frames per step" , 1 , 1 , 50 , 1)
+    }
+    return ViewerModularServer(ReplayModel , [space , displayStats] , "Stem Cell ABM Replay" , model_params)
+
+
+def serve(path, port=8521):
+    server = buildServer(path)
+    server.port = port
+    server.launch()
+
+
+
+
+if __name__ == "__main__":
+    #python ReplayVisualize.py runs/a/frames
+    serve(sys.argv[1])
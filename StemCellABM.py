@@ -1,15 +1,42 @@
-
-from typing import DefaultDict
-from matplotlib.pyplot import sca
 from mesa import Model, Agent
-from mesa.time import BaseScheduler, StagedActivation
-from mesa.datacollection import DataCollector
+from mesa.time import BaseScheduler
 from mesa.space import ContinuousSpace
-from mesa.visualization.TextVisualization import TextData
 import math
+import numpy as np
 import Brandon
-import copy
 import Constants
+from Profiling import TickProfiler
+from Convergence import ConvergenceMonitor
+from Lifecycle import MoleculePool
+from Precision import PRECISIONS, TypedContinuousSpace
+
+
+def morphogenSpecies(binding_rate):
+    '''Constants.SPECIES, plus Constants.BINDING_SPECIES when binding_rate is above 0'''
+    if binding_rate:
+        return dict(Constants.SPECIES , **Constants.BINDING_SPECIES)
+    return Constants.SPECIES
+
+
+#Stages of a tick that draw random numbers. Each gets its own numpy Generator spawned from the model's SeedSequence
+RNG_STAGES = ("params" , "cells" , "molecules" , "release")
+
+#Stages of ABM.step() in the order they run, as named by the profiler and the data collector
+TICK_STAGES = ("calcAvgs" , "updateParams" , "updateTouchingDict" , "updateBMP4" , "cascade" , "drawTickRandoms" , "schedule" , "lifecycle")
+
+#Model-level values the data collector records every tick
+MODEL_REPORTERS = {
+    "num_stem_cells" : "num_stem_cells",
+    "avg_x" : "avg_x",
+    "avg_y" : "avg_y",
+    "avg_radius" : "avg_radius",
+    "start_diff" : "start_diff",
+    "running" : "running",
+    "field_iterations" : "field_iterations",
+    "stop_reason" : "stop_reason",
+    "live_molecules" : "live_molecules",
+    "pooled_molecules" : "pooled_molecules"
+}
 
 class ABM(Model):
     '''Creation of Agent-Based-Model Class
@@ -30,10 +57,32 @@ class ABM(Model):
             avg_x : Float : Indicates the Average X Value of all Stem Cells
             avg_y : Float : Indicates the Average Y Value of all Stem Cells
             avg_radius : Float : Indicates the Average Distance of all Stem Cells to the Centroid
-            schedule : StagedActivation : Staged Activation Schedule that Follows the Stages listed above
-            running : True : Batch will continually run this model's steps indefinitely'''
-
-    def __init__(self, num_stem_cells: int , sauce: bool , num_BMP4: int , num_NOG: int , spawn_freq: int , diff_timer: int , endo_min: int , ecto_max: int , max_x:int=20 , max_y:int=20) -> None:
+            differentiated_counts : Dict[str, Int] : Number of Stem Cells per differentiation state, counted with the averages
+            schedule : BaseScheduler : Steps every agent once per tick, in the order they were added
+            running : True : Batch will continually run this model's steps indefinitely
+            seedSequence : SeedSequence : Root of every random stream in the model, spawned again for forked runs
+            rng : Generator : Model-level numpy Generator (used by setup)
+            rngs : Dict[str, Generator] : One independent Generator per stage in RNG_STAGES
+            cellDraws , bmp4Draws , nogDraws : Dict[str, ndarray] : Random numbers drawn in bulk for the current tick, indexed by agent slot
+            precision : Str : "float64", or "float32" for single-precision positions (a TypedContinuousSpace), fields and field operators
+            grid : DiffusionGrid : BMP4 field grid covering the space, field_nx x field_ny nodes (by default spaced like Brandon's default grid)
+            morphogens : MorphogenFields : Every species in morphogenSpecies(binding_rate) on grid, advanced together one step per
+                tick (solved by field_solver to field_tol, NOG binding BMP4 at binding_rate)
+            BMP4vector , NOGvector : ndarray : The BMP4 and NOG rows of morphogens (NOGvector is None without binding)
+            field_iterations : Int : Iterations the field solver took this tick, summed over species (0 for the direct solver)
+            monitor : ConvergenceMonitor : Ends the run at a steady state when any of stop_field_change, stop_drift, stop_plateau
+                or max_agents is set (held for stop_window ticks), otherwise None
+            lifecycle : MoleculePool : Removes retired molecules at the end of every tick and recycles them for new ones
+            retire_inactive_bmp4 : Boolean : Also retire a BMP4 deactivated with no timer left. Such a BMP4 stays inactive until
+                a NOG touches it again, so this is an approximation that changes the dynamics (off by default)
+            live_molecules , pooled_molecules : Int : BMP4 and NOG in the model, and retired ones waiting in the pool
+            stop_reason : Str : Why running became False: "differentiation" (the diff_timer countdown) or the monitor's criterion
+            profiler : TickProfiler : Per-stage timing of each tick when the model is built with profile=True (or profile="allocations",
+                which also records the bytes each stage allocates, or a TickProfiler of your own), otherwise None
+            datacollector : DataCollector : Records MODEL_REPORTERS (plus the profiler's stage timings) after every tick (None for
+                a Decomposition.TileABM, whose coordinator collects them)'''
+
+    def __init__(self, num_stem_cells: int , sauce: bool , num_BMP4: int , num_NOG: int , spawn_freq: int , diff_timer: int , endo_min: int , ecto_max: int , max_x:int=20 , max_y:int=20 , seed:int=None , profile=False , field_nx:int=None , field_ny:int=None , field_solver:str="auto" , field_tol:float=1e-8 , binding_rate:float=0.0 , stop_field_change:float=None , stop_drift:float=None , stop_plateau:float=None , max_agents:int=None , stop_window:int=20 , precision:str="float64" , retire_inactive_bmp4:bool=False) -> None:
         self.num_stem_cells = num_stem_cells
         self.sauce = sauce
         self.num_BMP4 = num_BMP4
@@ -49,14 +98,24 @@ class ABM(Model):
         self.avg_x = 0
         self.avg_y = 0
         self.avg_radius = 0
+        self.differentiated_counts = {}
         self.schedule = BaseScheduler(self)
         self.running = True
-        self.space = ContinuousSpace(max_x , max_y , False , 0 , 0)
+        self.stop_reason = None
+        self.monitor = None
+        if any(value is not None for value in (stop_field_change , stop_drift , stop_plateau , max_agents)):
+            self.monitor = ConvergenceMonitor(stop_field_change , stop_drift , stop_plateau , max_agents , stop_window)
+        self.precision = precision
+        self.retire_inactive_bmp4 = retire_inactive_bmp4
+        if precision == "float64":
+            self.space = ContinuousSpace(max_x , max_y , False , 0 , 0)
+        else:
+            self.space = TypedContinuousSpace(max_x , max_y , False , 0 , 0 , dtype=PRECISIONS[precision])
         self.center_pos = self.space.center
         self.currentIDNum = 0
         self.hasCells = True
         self.cellTouchingDict = {}
-        for i in range(1 , Constants.NUM_STEM_CELLS + 1):
+        for i in range(1 , self.num_stem_cells + 1):
             self.cellTouchingDict[i] = []
         self.end_time = 0
         self.mConcX = 0
@@ -65,51 +124,94 @@ class ABM(Model):
         self.cells = []
         self.NOG = []
         self.BMP4 = []
-        self.BMP4vector = Brandon.unot
+        self.grid = Brandon.DiffusionGrid.fromSpace(self.space , field_nx , field_ny , solver=field_solver , tol=field_tol , dtype=PRECISIONS[precision])
+        self.buildFields(binding_rate)
+        self.field_iterations = 0
+        self.cellDraws = {}
+        self.bmp4Draws = {}
+        self.nogDraws = {}
+        self.reseed(np.random.SeedSequence(seed))
+        self.profiler = None
+        reporters = dict(MODEL_REPORTERS)
+        if isinstance(profile , TickProfiler):
+            self.profiler = profile
+        elif profile:
+            self.profiler = TickProfiler(trackAllocations=profile == "allocations")
+        if self.profiler is not None:
+            reporters.update(self.profiler.reporters(TICK_STAGES))
+        self.datacollector = self.buildCollector(reporters)
+        self.lifecycle = MoleculePool(self)
         self.setup()
+        self.live_molecules = len(self.BMP4) + len(self.NOG)
+        self.pooled_molecules = 0
         
         
 
+    def buildFields(self, binding_rate):
+        '''Sets morphogens on grid and its BMP4vector/NOGvector rows'''
+        self.morphogens = Brandon.MorphogenFields(self.grid , morphogenSpecies(binding_rate) , binding_rate)
+        self.BMP4vector = self.morphogens.field("BMP4")
+        self.NOGvector = self.morphogens.field("NOG") if "NOG" in self.morphogens.names else None
+
+
+    def buildCollector(self, reporters):
+        #mesa.datacollection imports pandas, so it is only loaded once a model is actually built
+        from mesa.datacollection import DataCollector
+        return DataCollector(model_reporters=reporters)
+
+
+    def reseed(self, seedSequence):
+        '''Rebuilds every random stream of the model from seedSequence
+
+            The stage streams are spawned children of seedSequence, so a given seed always yields the same stream per stage.
+            Batch.forkRuns calls this with a child of the parent's seedSequence for each branch.'''
+        self.seedSequence = seedSequence
+        self.rng = np.random.default_rng(seedSequence)
+        self.rngs = dict(zip(RNG_STAGES , [np.random.default_rng(s) for s in seedSequence.spawn(len(RNG_STAGES))]))
+
+
+
     def setup(self):
         #Add StemCells to the Space
         if self.hasCells == True:
+            r = self.rng.random(self.num_stem_cells)
+            theta = self.rng.random(self.num_stem_cells) * 2 * math.pi
+            timers = self.rng.integers(Constants.TIME_FOR_DIFF_UPPER - 10 , Constants.TIME_FOR_DIFF_UPPER + 1 , self.num_stem_cells)
             for i in range(self.num_stem_cells):
                 self.currentIDNum += 1
-                c = StemCell(self.currentIDNum , self)
+                c = StemCell(self.currentIDNum , self , int(timers[i]))
                 self.schedule.add(c)
-                r = self.random.random() * 1
-                theta = self.random.random() * 2 * math.pi
-                x = r * math.cos(theta) + self.center_pos[0]
-                y = r * math.sin(theta) + self.center_pos[1]
+                x = r[i] * math.cos(theta[i]) + self.center_pos[0]
+                y = r[i] * math.sin(theta[i]) + self.center_pos[1]
                 self.space.place_agent(c , (x , y))
                 self.cells.append(c)
-            self.stem_cell_ex = self.space._index_to_agent[self.random.randrange(0 , len(self.space._agent_points))]
+            self.stem_cell_ex = self.space._index_to_agent[int(self.rng.integers(0 , len(self.space._agent_points)))]
             self.stem_cell_ex_diff = self.stem_cell_ex.differentiated
 
 
 
         #Add BMP4 to the Space
+        r = self.rng.random(self.num_BMP4)
+        theta = self.rng.random(self.num_BMP4) * 2 * math.pi
         for i in range(self.num_BMP4):
             self.currentIDNum += 1
             n = BMP4(self.currentIDNum, self)
             self.schedule.add(n)
-            r = self.random.random()
-            theta = self.random.random() * 2 * math.pi
-            x = r * math.cos(theta) + self.center_pos[0]
-            y = r * math.sin(theta) + self.center_pos[1]
+            x = r[i] * math.cos(theta[i]) + self.center_pos[0]
+            y = r[i] * math.sin(theta[i]) + self.center_pos[1]
             self.space.place_agent(n , (x , y))
 
             self.BMP4.append(n)
 
         #Add NOG to the Space
+        r = self.rng.random(self.num_NOG)
+        theta = self.rng.random(self.num_NOG) * 2 * math.pi
         for i in range(self.num_NOG):
             self.currentIDNum += 1
             l = NOG(self.currentIDNum, self)
             self.schedule.add(l)
-            r = self.random.random()
-            theta = self.random.random() * 2 * math.pi
-            x = r * math.cos(theta) + self.center_pos[0]
-            y = r * math.sin(theta) + self.center_pos[1]
+            x = r[i] * math.cos(theta[i]) + self.center_pos[0]
+            y = r[i] * math.sin(theta[i]) + self.center_pos[1]
             self.space.place_agent(l , (x , y))
 
             self.NOG.append(l)
@@ -125,10 +227,12 @@ class ABM(Model):
         x = 0
         y = 0
         r = 0
+        counts = {}
         for agent in self.space._agent_to_index:
             if type(agent) == StemCell:
                 x += agent.pos[0]
                 y += agent.pos[1]
+                counts[agent.differentiated] = counts.get(agent.differentiated , 0) + 1
            
 
         x = x / self.num_stem_cells
@@ -141,6 +245,7 @@ class ABM(Model):
         self.avg_x = x
         self.avg_y = y
         self.avg_radius = r
+        self.differentiated_counts = counts
 
 
 
@@ -161,7 +266,7 @@ class ABM(Model):
     def updateParams(self):
         agents = self.space._agent_to_index.keys()
         StemCells = [x for x in agents if type(x) == StemCell]
-        c = StemCells[self.random.randrange(0 , len(StemCells))]
+        c = StemCells[int(self.rngs["params"].integers(0 , len(StemCells)))]
         self.one_cells_contact = c.chemical_contact
         self.stem_cell_ex_diff = self.stem_cell_ex.differentiated
 
@@ -186,23 +291,114 @@ class ABM(Model):
                       
 
     def updateBMP4(self):
-        self.BMP4vector = Brandon.reaction(self.BMP4)
+        self.morphogens.step()
+        self.BMP4vector = self.morphogens.field("BMP4")
+        if self.NOGvector is not None:
+            self.NOGvector = self.morphogens.field("NOG")
+        self.field_iterations = self.morphogens.iterations
+
+
+    def drawTickRandoms(self):
+        '''Draws every random number the agents need this tick as one array per quantity and stream
+
+            Each agent reads its values at index self.slot, so results only depend on the seed and the agent order,
+            never on how the draws are interleaved between agents. Agents created during the tick are first
+            stepped next tick, after they have been given a slot.'''
+        for slot , agent in enumerate(self.cells):
+            agent.slot = slot
+        n = len(self.cells)
+        cellStream = self.rngs["cells"]
+        self.cellDraws = {
+            "energy" : cellStream.integers(0 , 3 , n),
+            "jitter" : cellStream.random(n),
+            "birth_timer" : cellStream.integers(Constants.TIME_FOR_DIFF_UPPER - 10 , Constants.TIME_FOR_DIFF_UPPER + 1 , n)
+        }
+
+        for slot , agent in enumerate(self.BMP4):
+            agent.slot = slot
+        m = len(self.BMP4)
+        moleculeStream = self.rngs["molecules"]
+        self.bmp4Draws = {
+            "shift" : moleculeStream.integers(0 , 2 , m),
+            "uniform" : moleculeStream.random(m),
+            "immobilize" : moleculeStream.integers(0 , 100 , m),
+            "immobilized_timer" : moleculeStream.integers(0 , 11 , m),
+            "active_timer" : moleculeStream.integers(0 , 11 , m)
+        }
+
+        for slot , agent in enumerate(self.NOG):
+            agent.slot = slot
+        k = len(self.NOG)
+        self.nogDraws = {
+            "shift" : moleculeStream.integers(0 , 2 , k),
+            "uniform" : moleculeStream.random(k)
+        }
+
+
+    def setMoleculeCount(self, cls, count):
+        '''Releases or retires cls molecules (BMP4 or NOG) until the model holds count of them
+
+            New molecules are placed as setup places them, from the "release" stream, and the most recently added
+            ones are retired first. Batch.runBranch uses this to change a dose after a fork.'''
+        molecules = self.BMP4 if cls is BMP4 else self.NOG
+        if count < len(molecules):
+            for agent in molecules[count:]:
+                self.lifecycle.retire(agent)
+            self.lifecycle.flush()
+        else:
+            n = count - len(molecules)
+            r = self.rngs["release"].random(n)
+            theta = self.rngs["release"].random(n) * 2 * math.pi
+            for i in range(n):
+                x = r[i] * math.cos(theta[i]) + self.center_pos[0]
+                y = r[i] * math.sin(theta[i]) + self.center_pos[1]
+                molecules.append(self.lifecycle.acquire(cls , (x , y)))
+        if cls is BMP4:
+            self.num_BMP4 = count
+        else:
+            self.num_NOG = count
+        self.live_molecules = len(self.BMP4) + len(self.NOG)
+        self.pooled_molecules = self.lifecycle.pooled
+
+
+    def runStage(self, name, method):
+        if self.profiler is None:
+            method()
+        else:
+            self.profiler.runStage(name , method)
 
 
     def step(self):
-        self.calcAvgs()
+        if self.profiler is not None:
+            self.profiler.beginTick(self.schedule.steps)
+        self.runStage("calcAvgs" , self.calcAvgs)
         if self.hasCells:
-            self.updateParams()
-            self.updateTouchingDict()
-            self.updateBMP4()
+            self.runStage("updateParams" , self.updateParams)
+            self.runStage("updateTouchingDict" , self.updateTouchingDict)
+            self.runStage("updateBMP4" , self.updateBMP4)
         if self.start_diff == True:
-            self.cascade()
+            self.runStage("cascade" , self.cascade)
             if self.end_time == -2:
                 self.end_time = 3
             self.end_time -= 1
-        self.schedule.step()
+        self.runStage("drawTickRandoms" , self.drawTickRandoms)
+        if self.profiler is None:
+            self.schedule.step()
+        else:
+            self.profiler.stepSchedule(self.schedule)
+        self.runStage("lifecycle" , self.lifecycle.flush)
+        self.live_molecules = len(self.BMP4) + len(self.NOG)
+        self.pooled_molecules = self.lifecycle.pooled
         if self.end_time == -1 and self.start_diff == True:
             self.running = False
+            self.stop_reason = "differentiation"
+        elif self.monitor is not None and self.monitor.check(self) is not None:
+            self.running = False
+            self.stop_reason = self.monitor.reason
+        if self.profiler is not None:
+            self.profiler.endTick()
+        if self.datacollector is not None:
+            self.datacollector.collect(self)
 
     
 
@@ -217,14 +413,18 @@ class StemCell(Agent):
                 Differentiated: Boolean
                 Chemical Contact: Int
                 Energy: Int
-                Time For Diff: Int'''
+                Time For Diff: Int : Drawn from the model's "cells" stream when not given
+                Slot: Int : Index of this cell's values in model.cellDraws for the current tick'''
 
-    def __init__(self, unique_id: int, model: Model) -> None:
+    def __init__(self, unique_id: int, model: Model, time_for_diff: int=None) -> None:
         super().__init__(unique_id , model)
         self.differentiated = "virgin"
         self.chemical_contact = 0
         self.energy = 0
-        self.time_for_diff = self.random.randrange(Constants.TIME_FOR_DIFF_UPPER - 10 , Constants.TIME_FOR_DIFF_UPPER + 1)
+        if time_for_diff is None:
+            time_for_diff = int(model.rngs["cells"].integers(Constants.TIME_FOR_DIFF_UPPER - 10 , Constants.TIME_FOR_DIFF_UPPER + 1))
+        self.time_for_diff = time_for_diff
+        self.slot = 0
         self.internalR = Constants.STEMCELL_R
         self.absorbedNOG = []
 
@@ -237,7 +437,7 @@ class StemCell(Agent):
 
     def movement2(self):
         scaleFactor = 5
-        self.energy += self.random.randrange(0 , 3)
+        self.energy += int(self.model.cellDraws["energy"][self.slot])
         if self.differentiated == "virgin":
             neighbors = self.model.cellTouchingDict[self.unique_id]
             neighborPoints = []
@@ -268,7 +468,7 @@ class StemCell(Agent):
                 zpAngle += math.pi
             if centerDir[0] > 0 and centerDir[1] < 0:
                 zpAngle += 2*math.pi
-            zpAngle += self.random.random()*(math.pi)/magCenterDir
+            zpAngle += self.model.cellDraws["jitter"][self.slot]*(math.pi)/magCenterDir
             while zpAngle > math.pi * 2:
                 zpAngle -= math.pi*2
             if zpAngle < (math.pi / 2) or zpAngle > (3 * math.pi / 2):
@@ -301,7 +501,7 @@ class StemCell(Agent):
     def spawnCells(self):
         if self.energy >= self.model.spawn_freq:
             self.model.currentIDNum += 1
-            newCell = StemCell(self.model.currentIDNum , self.model)
+            newCell = StemCell(self.model.currentIDNum , self.model , int(self.model.cellDraws["birth_timer"][self.slot]))
             self.model.schedule.add(newCell)
             self.model.space.place_agent(newCell , self.pos)
             self.energy = self.energy // 2
@@ -392,15 +592,12 @@ class StemCell(Agent):
         return
 
     def spawnBMP4(self, num):
+        thetas = self.model.rngs["release"].random(num) * 2 * math.pi
+        r = self.internalR + 0.001
         for i in range(num):
-            self.model.currentIDNum += 1
-            n = NOG(self.model.currentIDNum, self.model)
-            self.model.schedule.add(n)
-            r = self.internalR + 0.001
-            theta = self.model.random.random() * 2 * math.pi
-            x = r * math.cos(theta) + self.pos[0]
-            y = r * math.sin(theta) + self.pos[1]
-            self.model.space.place_agent(n , (x , y))
+            x = r * math.cos(thetas[i]) + self.pos[0]
+            y = r * math.sin(thetas[i]) + self.pos[1]
+            self.model.NOG.append(self.model.lifecycle.acquire(NOG , (x , y)))
         self.absorbedNOG = []
 
 
@@ -408,19 +605,17 @@ class StemCell(Agent):
         if self.time_for_diff > 0:
             self.time_for_diff -= 1
         else:
-            matrixIndex = (self.pos[0] // Brandon.dx, self.pos[1] // Brandon.dx)
-            vectorIndex = points * matrixIndex[0] + matrixIndex[1]
-            BMP4conc = self.model.BMP4vector[vectorIndex]
+            BMP4conc = self.model.grid.concentrationAt(self.model.BMP4vector , self.pos)
 
 
             if self.differentiated == "virgin":
                 if self.model.start_diff == False:
                     self.model.start_diff = True
-                if self.BMP4conc >= self.model.endo_min:
+                if BMP4conc >= self.model.endo_min:
                     self.differentiated = "endo"
-                if self.BMP4conc < self.model.endo_min and self.chemical_contact >= self.model.ecto_max:
+                if BMP4conc < self.model.endo_min and self.chemical_contact >= self.model.ecto_max:
                     self.differentiated = "meso"
-                if self.BMP4conc < self.model.ecto_max:
+                if BMP4conc < self.model.ecto_max:
                     self.differentiated = "ecto"
                 
 
@@ -445,10 +640,14 @@ class StemCell(Agent):
                 return [(self.pos[0] , self.pos[1])]
             E = (r**2 - (D/2)**2)**0.5
             M = (c-a)/(b-d)
-            B = (b**2 - d**2)/(c**2 - a**2)
             theta = math.atan2(c-a , b-d)
             midX = (a+c)/2
             midY = (b+d)/2
+            if c == a:
+                #Cells stacked vertically (common once positions are rounded to float32): the chord is horizontal through the midpoint
+                B = midY
+            else:
+                B = (b**2 - d**2)/(c**2 - a**2)
             dist = E * math.cos(theta)
             x2 = midX + dist
             y2 = M*x2 + B
@@ -620,6 +819,7 @@ class BMP4(Agent):
         self.active = True
         self.active_timer = 0
         self.internalR = Constants.BMP4_R
+        self.slot = 0
 
     def step(self):
         self.movement()
@@ -630,50 +830,50 @@ class BMP4(Agent):
         if self.immobilized == False:
             heading = self.model.space.get_heading(self.pos , self.model.center_pos)
             if heading[0] > 0 and heading[1] > 0:
-                if self.random.randrange(0 , 2) < 1: #Vertical Shift
+                if self.model.bmp4Draws["shift"][self.slot] < 1: #Vertical Shift
 
                     x = heading[0]
-                    y = self.random.uniform(-heading[0] , heading[1])
+                    y = self.uniform(-heading[0] , heading[1])
 
                 else: #Horizontal Shift
 
-                    x = self.random.uniform(-heading[1] , heading[0])
+                    x = self.uniform(-heading[1] , heading[0])
                     y = heading[1]
 
             elif heading[0] < 0 and heading[1] < 0:
 
-                if self.random.randrange(0 , 2) < 1: #Vertical Shift
+                if self.model.bmp4Draws["shift"][self.slot] < 1: #Vertical Shift
 
                     x = heading[0]
-                    y = self.random.uniform(heading[1] , -heading[0])
+                    y = self.uniform(heading[1] , -heading[0])
 
                 else: #Horizontal Shift
 
-                    x = self.random.uniform(heading[0] , -heading[1])
+                    x = self.uniform(heading[0] , -heading[1])
                     y = heading[1]
 
             elif heading[0] < 0 and heading[1] > 0:
 
-                if self.random.randrange(0 , 2) < 1: #Vertical Shift
+                if self.model.bmp4Draws["shift"][self.slot] < 1: #Vertical Shift
 
                     x = heading[0]
-                    y = self.random.uniform(heading[0] , heading[1])
+                    y = self.uniform(heading[0] , heading[1])
 
                 else: #Horizontal Shift
 
-                    x = self.random.uniform(heading[0] , heading[1])
+                    x = self.uniform(heading[0] , heading[1])
                     y = heading[1]
 
             elif heading[0] > 0 and heading[1] < 0:
 
-                if self.random.randrange(0 , 2) < 1: #Vertical Shift
+                if self.model.bmp4Draws["shift"][self.slot] < 1: #Vertical Shift
 
                     x = heading[0]
-                    y = self.random.uniform(heading[1] , heading[0])
+                    y = self.uniform(heading[1] , heading[0])
 
                 else: #Horizontal Shift
 
-                    x = self.random.uniform(heading[1] , heading[0])
+                    x = self.uniform(heading[1] , heading[0])
                     y = heading[1]
 
             elif heading == (0,0):
@@ -693,9 +893,9 @@ class BMP4(Agent):
                         xDisplacement = -xDisplacement / 2
                         yDisplacement = -yDisplacement / 2
             self.model.space.move_agent(self , (self.pos[0] + xDisplacement , self.pos[1] + yDisplacement))
-            if self.random.randrange(0 , 100) < 49:
+            if self.model.bmp4Draws["immobilize"][self.slot] < 49:
                 self.immobilized = True
-                self.immobilized_timer = self.random.randrange(0 , 11)
+                self.immobilized_timer = int(self.model.bmp4Draws["immobilized_timer"][self.slot])
         else:
             self.immobilized_timer -= 1
             if self.immobilized_timer == 0:
@@ -710,7 +910,11 @@ class BMP4(Agent):
                 if type(agent) == NOG:
                     if self.isTouching(agent):
                         self.active = False
-                        self.active_timer = self.random.randrange(0 , 11)
+                        self.active_timer = int(self.model.bmp4Draws["active_timer"][self.slot])
+            #Deactivated with no timer left, it stays inactive until a NOG touches it again and draws a new timer:
+            #retiring it then is an approximation, only made when the model opts in
+            if self.model.retire_inactive_bmp4 and not self.active and self.active_timer == 0:
+                self.model.lifecycle.retire(self)
         else:
             self.active_timer -= 1
             if self.active_timer == 0:
@@ -719,6 +923,11 @@ class BMP4(Agent):
 
  
 
+    def uniform(self, a, b):
+        #Same mapping as random.uniform, fed from this tick's bulk draws
+        return a + (b - a) * self.model.bmp4Draws["uniform"][self.slot]
+
+
     def isTouching(self , other:Agent):
         d = self.model.space.get_distance(self.pos , other.pos)
         l = d - self.internalR - other.internalR
@@ -729,92 +938,93 @@ class BMP4(Agent):
 
 
 
-#class NOG(Agent):
- #   '''Creation of NOG Agent'''
+class NOG(Agent):
+    '''Creation of NOG Agent'''
 
-  #  def __init__(self, unique_id: int, model: Model) -> None:
-   #     super().__init__(unique_id, model)
-    #    self.internalR = Constants.NOG_R
-     #   self.absorbed = False
+    def __init__(self, unique_id: int, model: Model) -> None:
+        super().__init__(unique_id, model)
+        self.internalR = Constants.NOG_R
+        self.absorbed = False
+        self.slot = 0
 
 
-    #def step(self):
-     #   if not self.absorbed:
-      #      self.movement()
+    def step(self):
+        if self.absorbed:
+            self.model.lifecycle.retire(self)
+        else:
+            self.movement()
 
 
-    #def movement(self):
-     #       heading = self.model.space.get_heading(self.pos , self.model.center_pos)
-      #      if heading[0] > 0 and heading[1] > 0:
-       #         if self.random.randrange(0 , 2) < 1: #Vertical Shift
+    def movement(self):
+            heading = self.model.space.get_heading(self.pos , self.model.center_pos)
+            if heading[0] > 0 and heading[1] > 0:
+                if self.model.nogDraws["shift"][self.slot] < 1: #Vertical Shift
 
-        #            x = heading[0]
-         #           y = self.random.uniform(-heading[0] , heading[1])
+                    x = heading[0]
+                    y = self.uniform(-heading[0] , heading[1])
 
-          #      else: #Horizontal Shift
+                else: #Horizontal Shift
 
-                    #x = self.random.uniform(-heading[1] , heading[0])
-           #         y = heading[1]
+                    x = self.uniform(-heading[1] , heading[0])
+                    y = heading[1]
 
-         #   elif heading[0] < 0 and heading[1] < 0:
+            elif heading[0] < 0 and heading[1] < 0:
 
-          #      if self.random.randrange(0 , 2) < 1: #Vertical Shift
+                if self.model.nogDraws["shift"][self.slot] < 1: #Vertical Shift
 
-           #         x = heading[0]
-            #        y = self.random.uniform(heading[1] , -heading[0])
+                    x = heading[0]
+                    y = self.uniform(heading[1] , -heading[0])
 
-             #   else: #Horizontal Shift
+                else: #Horizontal Shift
 
-              #      x = self.random.uniform(heading[0] , -heading[1])
-               #     y = heading[1]
+                    x = self.uniform(heading[0] , -heading[1])
+                    y = heading[1]
 
-            #elif heading[0] < 0 and heading[1] > 0:
+            elif heading[0] < 0 and heading[1] > 0:
 
-             #   if self.random.randrange(0 , 2) < 1: #Vertical Shift
+                if self.model.nogDraws["shift"][self.slot] < 1: #Vertical Shift
 
-              #      x = heading[0]
-               #     y = self.random.uniform(heading[0] , heading[1])
+                    x = heading[0]
+                    y = self.uniform(heading[0] , heading[1])
 
-                #else: #Horizontal Shift
+                else: #Horizontal Shift
 
-                 #   x = self.random.uniform(heading[0] , heading[1])
-                  #  y = heading[1]
+                    x = self.uniform(heading[0] , heading[1])
+                    y = heading[1]
 
-           # elif heading[0] > 0 and heading[1] < 0:
+            elif heading[0] > 0 and heading[1] < 0:
 
-            #    if self.random.randrange(0 , 2) < 1: #Vertical Shift
+                if self.model.nogDraws["shift"][self.slot] < 1: #Vertical Shift
 
-             #       x = heading[0]
-              #      y = self.random.uniform(heading[1] , heading[0])
+                    x = heading[0]
+                    y = self.uniform(heading[1] , heading[0])
 
-               # else: #Horizontal Shift
+                else: #Horizontal Shift
 
-                #    x = self.random.uniform(heading[1] , heading[0])
-                 #   y = heading[1]
+                    x = self.uniform(heading[1] , heading[0])
+                    y = heading[1]
 
-            #elif heading == (0,0):
+            else:
 
-              #  x = 1
-             #   y = 1
+                x = 1
+                y = 1
 
 
-            #norm = (x ** 2 + y ** 2) ** 0.5
-           # xDisplacement = x / (norm * 0.5)
-          #  yDisplacement = y / (norm * 0.5)
+            norm = (x ** 2 + y ** 2) ** 0.5
+            xDisplacement = x / (norm * 0.5)
+            yDisplacement = y / (norm * 0.5)
             
-            #self.model.space.move_agent(self , (self.pos[0] + xDisplacement , self.pos[1] + yDisplacement))
-
-
-   # def isTouching(self , other:Agent):
-    #    d = self.model.space.get_distance(self.pos , other.pos)
-     #   l = d - self.internalR - other.internalR
-      #  if l <= 0:
-       #     return True 
-        #return False
-
+            self.model.space.move_agent(self , (self.pos[0] + xDisplacement , self.pos[1] + yDisplacement))
 
 
+    def uniform(self, a, b):
+        #Same mapping as random.uniform, fed from this tick's bulk draws
+        return a + (b - a) * self.model.nogDraws["uniform"][self.slot]
 
 
-    
-
+    def isTouching(self , other:Agent):
+        d = self.model.space.get_distance(self.pos , other.pos)
+        l = d - self.internalR - other.internalR
+        if l <= 0:
+            return True 
+        return False
@@ -23,10 +23,19 @@ class TextElement(VisualizationElement):
         return TextData(model , self.attribute).render()
 
 
-        
-        
 
+class TextPanel(VisualizationElement):
+    """One TextModule showing many model attributes
 
+        Renders every attribute as "name: value" in a single HTML payload, instead of one TextElement (and one
+        TextData(...).render() call and JSON entry) per attribute.
+        """
+    package_includes = ["TextModule.js"]
+    js_code = "elements.push(new TextModule());"
 
 
+    def __init__(self , attributes):
+        self.attributes = list(attributes)
 
+    def render(self, model):
+        return "<br>".join("{}: {}".format(attribute , getattr(model , attribute)) for attribute in self.attributes)
@@ -0,0 +1,191 @@
+import threading
+import time
+import tornado.escape
+import tornado.ioloop
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
+
+
+class ViewerSocketHandler(SocketHandler):
+    """Websocket handler that encodes every frame for its own connection
+
+        Delta-encoded elements (BinaryCanvasContinuous) keep one baseline per connection, so a second browser tab, or
+        a reload, gets a keyframe first and then deltas against the frames it was actually sent.
+        """
+
+    @property
+    def viz_state_message(self):
+        return {"type": "viz_state", "data": self.application.renderFor(self)}
+
+
+    def on_close(self):
+        self.application.forgetViewer(self)
+
+
+
+class ViewerModularServer(ModularServer):
+    """Creation of a ModularServer that Encodes Frames per Connection
+
+        Elements with a capture(model) method (BinaryCanvasContinuous) are captured once per frame and then encoded
+        for each connection by their encodeFrame(captured, viewer); every other element is rendered as usual.
+        """
+
+    socket_handler = (r"/ws", ViewerSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler]
+
+    def captureModel(self):
+        '''One state per element of the current model, left unencoded for elements that encode per viewer'''
+        return [element.capture(self.model) if hasattr(element , "capture") else element.render(self.model) for element in self.visualization_elements]
+
+
+    def encodeFor(self, captured, viewer):
+        '''The viz_state data of a captureModel() result for one viewer'''
+        return [element.encodeFrame(state , viewer) if hasattr(element , "capture") else state
+                for element , state in zip(self.visualization_elements , captured)]
+
+
+    def renderFor(self, viewer):
+        return self.encodeFor(self.captureModel() , viewer)
+
+
+    def forgetViewer(self, viewer):
+        for element in self.visualization_elements:
+            if hasattr(element , "forget"):
+                element.forget(viewer)
+
+
+
+class ThreadedSocketHandler(ViewerSocketHandler):
+    """Websocket handler for ThreadedModularServer
+
+        get_step no longer steps the model. It asks the simulation thread for its next snapshot, which is sent as soon
+        as it is rendered (immediately if one is already waiting).
+        """
+
+    def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        application = self.application
+        application.io_loop = tornado.ioloop.IOLoop.current()
+
+        if msg["type"] == "get_step":
+            if application.finished and application.snapshot is None:
+                self.write_message({"type": "end"})
+            else:
+                application.requestFrame(self)
+
+        elif msg["type"] == "reset":
+            application.reset_model()
+            self.write_message({"type": "viz_state", "data": application.encodeFor(application.takeSnapshot() , self)})
+
+        else:
+            super().on_message(message)
+
+
+
+class ThreadedModularServer(ViewerModularServer):
+    """Creation of a ModularServer that Runs the Model in a Background Thread
+
+        ModularServer steps the model and renders every element inside the websocket request, so the browser's frame
+        rate is capped by the slowest tick and the model waits while the browser draws. Here a simulation thread steps
+        the model continuously and, whenever the browser has asked for a frame and at most target_fps times per second,
+        captures a snapshot between two ticks. Ticks in between are never rendered (dropped frames). A snapshot is
+        encoded for each connection it is sent to, against the frames that connection has seen, so delta-encoded
+        elements (BinaryCanvasContinuous) stay in sync in every tab.
+
+        The thread only runs while the browser keeps requesting frames; after idle_timeout seconds without a request
+        (Stop pressed, tab closed) it waits. A single Step click therefore advances the model for up to idle_timeout
+        seconds.
+        """
+
+    socket_handler = (r"/ws", ThreadedSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler]
+
+    def __init__(self, model_cls, visualization_elements, name="Mesa Model", model_params={}, target_fps=10, idle_timeout=2.0):
+        self.target_fps = target_fps
+        self.idle_timeout = idle_timeout
+        self.io_loop = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.frame_requested = threading.Event()
+        self.waiting = set()
+        self.snapshot = None
+        self.finished = False
+        self.last_request = 0.0
+        self.ticks_per_frame = 0
+        self.model = None
+        super().__init__(model_cls , visualization_elements , name , model_params)
+
+
+    def reset_model(self):
+        '''Stops the simulation thread, builds a fresh model with its first snapshot and starts a new thread'''
+        if self.thread is not None:
+            self.stopping.set()
+            self.frame_requested.set()
+            self.thread.join()
+        self.stopping = threading.Event()
+        self.frame_requested = threading.Event()
+        self.waiting = set()
+        super().reset_model()
+        self.finished = False
+        self.snapshot = self.captureModel()
+        self.thread = threading.Thread(target=self.simulate , args=(self.model , self.stopping , self.frame_requested) , daemon=True)
+        self.thread.start()
+
+
+    def takeSnapshot(self):
+        state = self.snapshot
+        self.snapshot = None
+        return state
+
+
+    def requestFrame(self, handler):
+        '''Called from the websocket for get_step: reply now if a snapshot is ready, otherwise when the thread renders one'''
+        self.last_request = time.perf_counter()
+        if self.snapshot is not None:
+            handler.write_message({"type": "viz_state", "data": self.encodeFor(self.takeSnapshot() , handler)})
+        else:
+            self.waiting.add(handler)
+        self.frame_requested.set()
+
+
+    def publish(self, model, state):
+        '''Runs on the IO loop: hands a freshly rendered snapshot to the requests waiting for one'''
+        if model is not self.model:
+            return  #rendered by a thread that was stopped by a reset
+        if not self.waiting:
+            self.snapshot = state
+            return
+        for handler in self.waiting:
+            handler.write_message({"type": "viz_state", "data": self.encodeFor(state , handler)})
+        self.waiting = set()
+
+
+    def simulate(self, model, stopping, frame_requested):
+        '''Simulation thread: steps model until it stops running, rendering a snapshot whenever one is requested'''
+        last_render = time.perf_counter()
+        ticks = 0
+        while not stopping.is_set() and model.running:
+            if time.perf_counter() - self.last_request > self.idle_timeout and not frame_requested.is_set():
+                frame_requested.wait(0.1)
+                continue
+            model.step()
+            ticks += 1
+            now = time.perf_counter()
+            if frame_requested.is_set() and now - last_render >= 1 / self.target_fps:
+                frame_requested.clear()
+                self.ticks_per_frame = ticks
+                self.sendSnapshot(model , self.captureModel())
+                ticks = 0
+                last_render = now
+        if not stopping.is_set():
+            #The model stopped itself: its final state is the last frame
+            frame_requested.wait()
+            if not stopping.is_set():
+                self.finished = True
+                self.sendSnapshot(model , self.captureModel())
+
+
+    def sendSnapshot(self, model, state):
+        if self.io_loop is None:
+            self.snapshot = state
+        else:
+            self.io_loop.add_callback(self.publish , model , state)
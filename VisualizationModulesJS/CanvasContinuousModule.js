@@ -24,7 +24,74 @@ var ContinuousCanvasModule = function(canvas_width, canvas_height, space_width,
 
         
 
+	// Agents decoded from BinaryCanvasContinuous frames, kept between frames (unique_id -> {x, y, code})
+	var agents = new Map();
+	var palette = [];
+
+	// Turns a base64 string of little-endian bytes into a typed array of the given type
+	var decode = function(text, ArrayType) {
+		var raw = atob(text);
+		var bytes = new Uint8Array(raw.length);
+		for (var i = 0; i < raw.length; i++) {
+			bytes[i] = raw.charCodeAt(i);
+		}
+		return new ArrayType(bytes.buffer);
+	};
+
+	var renderBinary = function(frame) {
+		if (frame.keyframe) {
+			agents.clear();
+			palette = frame.palette;
+		}
+		var ids = decode(frame.ids, Uint32Array);
+		var xs = decode(frame.x, Float32Array);
+		var ys = decode(frame.y, Float32Array);
+		var codes = decode(frame.code, Uint8Array);
+		var removed = decode(frame.removed, Uint32Array);
+		for (var i = 0; i < ids.length; i++) {
+			agents.set(ids[i], {x: xs[i], y: ys[i], code: codes[i]});
+		}
+		for (var i = 0; i < removed.length; i++) {
+			agents.delete(removed[i]);
+		}
+
+		// Group positions by code, then draw codes from the lowest Layer up with one path each
+		var groups = palette.map(function() { return {x: [], y: []}; });
+		agents.forEach(function(agent) {
+			var group = groups[agent.code];
+			if (group) {
+				group.x.push(agent.x);
+				group.y.push(agent.y);
+			}
+		});
+		var order = palette.map(function(p, code) { return code; });
+		order.sort(function(a, b) { return palette[a].Layer - palette[b].Layer; });
+
+		canvasDraw.resetCanvas();
+
+		// Background layers from DensityCanvasContinuous: the field first, then binned molecule counts
+		if (frame.field) {
+			var field = frame.field;
+			canvasDraw.drawHeatmap(decode(field.data, Uint8Array), field.w, field.h, field.extent, field.color, 0.6);
+		}
+		if (frame.density) {
+			var density = frame.density;
+			for (var code in density.grids) {
+				canvasDraw.drawHeatmap(decode(density.grids[code], Uint8Array), density.w, density.h, density.extent, palette[code].Color, 1.0);
+			}
+		}
+
+		order.forEach(function(code) {
+			var p = palette[code];
+			canvasDraw.drawCircles(groups[code].x, groups[code].y, p.r, p.Color, p.Filled == "true" || p.Filled === true);
+		});
+	};
+
 	this.render = function(data) {
+		if (data.binary) {
+			renderBinary(data);
+			return;
+		}
                 
 		canvasDraw.resetCanvas();
 		for (var layer in data){
@@ -34,6 +101,7 @@ var ContinuousCanvasModule = function(canvas_width, canvas_height, space_width,
 	};
 
 	this.reset = function() {
+		agents.clear();
 		canvasDraw.resetCanvas();
 	};
 
@@ -95,6 +95,78 @@ var SpaceVisualization = function(width, height, spaceWidth, spaceHeight, contex
 
     };
 
+    /**
+    Draw many circles of the same radius and color as a single path.
+    xs, ys: Arrays of space coords (y is inverted here, like drawLayer does)
+    radius: Radius, as a multiple of cell size
+    color: Fill and stroke color
+    fill: Boolean for whether or not to fill the circles.
+    */
+    this.drawCircles = function(xs, ys, radius, color, fill) {
+            if (xs.length == 0)
+                    return;
+            var r = radius * scaledHeight;
+
+            context.beginPath();
+            for (var i = 0; i < xs.length; i++) {
+                    var cx = xs[i] * scaledWidth;
+                    var cy = (spaceHeight - ys[i] - 1) * scaledHeight;
+                    context.moveTo(cx + r, cy);
+                    context.arc(cx, cy, r, 0, Math.PI * 2, false);
+            }
+
+            context.strokeStyle = color;
+            context.stroke();
+            if (fill) {
+                    context.fillStyle = color;
+                    context.fill();
+            }
+    };
+
+    /**
+    Draw a grid of uint8 levels as a translucent heatmap stretched over part of the space.
+    levels: Uint8Array of w*h values, row 0 is the top (largest y) of the grid
+    w, h: Grid size
+    extent: [x_min, x_max, y_min, y_max] in space coords
+    color: CSS color; each cell gets this color with alpha level/255 * maxAlpha
+    maxAlpha: Opacity of the highest level, [0, 1]
+    */
+    this.drawHeatmap = function(levels, w, h, extent, color, maxAlpha) {
+            if (heatmapCanvas.width != w || heatmapCanvas.height != h) {
+                    heatmapCanvas.width = w;
+                    heatmapCanvas.height = h;
+            }
+            var rgb = parseColor(color);
+            var image = heatmapContext.createImageData(w, h);
+            for (var i = 0; i < levels.length; i++) {
+                    image.data[4*i] = rgb[0];
+                    image.data[4*i + 1] = rgb[1];
+                    image.data[4*i + 2] = rgb[2];
+                    image.data[4*i + 3] = levels[i] * maxAlpha;
+            }
+            heatmapContext.putImageData(image, 0, 0);
+
+            // Same y inversion as the agents: space y maps to (spaceHeight - y - 1) cells from the top
+            var x0 = extent[0] * scaledWidth;
+            var y0 = (spaceHeight - extent[3] - 1) * scaledHeight;
+            var dw = (extent[1] - extent[0]) * scaledWidth;
+            var dh = (extent[3] - extent[2]) * scaledHeight;
+            context.imageSmoothingEnabled = true;
+            context.drawImage(heatmapCanvas, x0, y0, dw, dh);
+    };
+
+    // Offscreen canvas the heatmap levels are written to before being scaled onto the main canvas
+    var heatmapCanvas = document.createElement("canvas");
+    var heatmapContext = heatmapCanvas.getContext("2d");
+
+    // Turns any CSS color into [r, g, b] by letting the canvas normalize it to #rrggbb
+    var parseColor = function(color) {
+            heatmapContext.fillStyle = "#000000";
+            heatmapContext.fillStyle = color;
+            var hex = heatmapContext.fillStyle;
+            return [parseInt(hex.substr(1, 2), 16), parseInt(hex.substr(3, 2), 16), parseInt(hex.substr(5, 2), 16)];
+    };
+
     /**
     Draw a rectangle in the specified grid cell.
     x, y: Grid coords
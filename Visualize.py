@@ -1,110 +1,36 @@
-from mesa.agent import Agent
-from mesa.visualization.modules.CanvasContinuousVisualization import CanvasContinuous
-from mesa.visualization.ModularVisualization import ModularServer
-from mesa.visualization.modules.TextVisualization import TextElement
-from StemCellABM import StemCell, BMP4 , NOG , ABM
+from mesa.visualization.modules.CanvasContinuousVisualization import CanvasContinuous, DensityCanvasContinuous
+from mesa.visualization.modules.TextVisualization import TextPanel
+from StemCellABM import ABM
+from ThreadedServer import ThreadedModularServer, ViewerModularServer
+from Replay import PALETTE , MOLECULE_CODES , agent_portrayal , agent_code , bmp4_field
 import Constants
 
 
-def agent_portrayal(agent : Agent):
-    """Definition of Agent Portrayals
-
-        Can be adjusted to make images of agents appear differently in the visualization. 
-        Currently, I am using small circles for all with different colors to distinguish between agents
-
-        Colors:
-            StemCell = Black* 
-            BMP4 = Blue
-            NOG = Purple
-            
-            *Differentiated StemCells have color dependent on their classification:
-                endo: Blue
-                meso: Green
-                ecto: Red 
-            """
-
-    if agent.__class__ == StemCell:
-        dumb = 1
-        if agent.differentiated == "virgin":
-            color = "black"
-        elif agent.differentiated == "endo":
-            color = "blue"
-        elif agent.differentiated == "meso":
-            color = "green"
-        elif agent.differentiated == "ecto":
-            color = "red"
-        elif agent.differentiated == "dumb":
-            dumb = 0
-            color = "white"
-        portrayal = {
-            "Shape" : "circle",
-            "Filled" : "true",
-            "r" : Constants.STEMCELL_R,
-            "Color" : color,
-            "Layer" : dumb
-        }
-        
-    elif agent.__class__ == BMP4:
-        portrayal = {
-            "Shape" : "circle",
-            "Filled" : "true",
-            "r" : Constants.BMP4_R,
-            "Color" : "blue",
-            "Layer" : 2
-        }
-    elif agent.__class__ == NOG:
-        if agent.absorbed:
-                portrayal = {
-                "Shape" : "circle",
-                "Filled" : "true",
-                "r" : Constants.NOG_R,
-                "Color" : "white",
-                "Layer" : 0
-            }
-        else:
-            portrayal = {
-                "Shape" : "circle",
-                "Filled" : "true",
-                "r" : Constants.NOG_R,
-                "Color" : "purple",
-                "Layer" : 3
-            }
-    return portrayal
-
 #Create the ContinuousSpace
-space = CanvasContinuous(agent_portrayal , Constants.MAX_X , Constants.MAX_Y , 500 , 500)
-
-#Create TextElements for Model Paramaters
-displayNumStemCells = TextElement("num_stem_cells")
-displaySauce = TextElement("sauce")
-displayNumBMP4 = TextElement("num_BMP4")
-displayNumNOG = TextElement("num_NOG")
-displaySpawFreq = TextElement("spawn_freq")
-displayDiffTimer = TextElement("diff_timer")
-displayEndoMin = TextElement("endo_min")
-displayEctoMax = TextElement("ecto_max")
-displayOneCellsContact = TextElement("one_cells_contact")
-displayStartDiff = TextElement("start_diff")
-displayStemCellEx = TextElement("stem_cell_ex")
-displayStemCellExDiff = TextElement("stem_cell_ex_diff")
-displayAvgX = TextElement("avg_x")
-displayAvgY = TextElement("avg_y")
-displayAvgRadius = TextElement("avg_radius")
-displayMConcX = TextElement("mConcX")
-displayMConcY = TextElement("mConcY")
-displayMR = TextElement("mR")
-
-
-
-
-#Create the ModularServer
-server = ModularServer( ABM , 
-                        [space , displayAvgX , displayAvgY , displayAvgRadius , displayEndoMin , displayEctoMax , displayNumStemCells , displaySauce , displayNumBMP4 , displayNumNOG , displaySpawFreq , 
-                        displayDiffTimer ,  displayOneCellsContact , displayStartDiff , displayStemCellEx , 
-                        displayStemCellExDiff , displayMConcX , displayMConcY , displayMR] ,
-                         "Stem Cell ABM" , {"num_stem_cells": Constants.NUM_STEM_CELLS , "sauce": Constants.SAUCE , 
-                         "num_BMP4": Constants.NUM_BMP4 , "num_NOG": Constants.NUM_NOG , "spawn_freq": Constants.SPAWN_FREQ , "diff_timer": Constants.DIFF_TIMER , 
-                         "endo_min": Constants.ENDO_MIN , "ecto_max": Constants.ECTO_MAX , "max_x": Constants.MAX_X , "max_y": Constants.MAX_Y})
-server.port = 8521
-#Start Server
-server.launch()
\ No newline at end of file
+if Constants.BINARY_FRAMES:
+    space = DensityCanvasContinuous(agent_code , PALETTE , Constants.MAX_X , Constants.MAX_Y , 500 , 500 , field_method=bmp4_field,
+                                    molecule_codes=MOLECULE_CODES , molecule_threshold=Constants.MOLECULE_THRESHOLD)
+else:
+    space = CanvasContinuous(agent_portrayal , Constants.MAX_X , Constants.MAX_Y , 500 , 500)
+
+#Create one TextPanel for all Model Paramaters and Statistics (sent as a single payload per frame)
+displayStats = TextPanel(["avg_x" , "avg_y" , "avg_radius" , "endo_min" , "ecto_max" , "num_stem_cells" , "sauce" , "num_BMP4" , "num_NOG" , "spawn_freq" ,
+                          "diff_timer" , "one_cells_contact" , "start_diff" , "stem_cell_ex" , "stem_cell_ex_diff" , "mConcX" , "mConcY" , "mR"])
+
+
+
+
+if __name__ == "__main__":
+    #Create the ModularServer, encoding binary frames per browser tab (ThreadedModularServer also steps the model in a background thread and drops frames the browser cannot keep up with)
+    model_params = {"num_stem_cells": Constants.NUM_STEM_CELLS , "sauce": Constants.SAUCE , 
+                    "num_BMP4": Constants.NUM_BMP4 , "num_NOG": Constants.NUM_NOG , "spawn_freq": Constants.SPAWN_FREQ , "diff_timer": Constants.DIFF_TIMER , 
+                    "endo_min": Constants.ENDO_MIN , "ecto_max": Constants.ECTO_MAX , "max_x": Constants.MAX_X , "max_y": Constants.MAX_Y,
+                    "field_nx": Constants.FIELD_NX , "field_ny": Constants.FIELD_NY , "field_solver": Constants.FIELD_SOLVER , "field_tol": Constants.FIELD_TOL,
+                    "binding_rate": Constants.BINDING_RATE}
+    if Constants.THREADED_SERVER:
+        server = ThreadedModularServer(ABM , [space , displayStats] , "Stem Cell ABM" , model_params , target_fps=Constants.TARGET_FPS)
+    else:
+        server = ViewerModularServer(ABM , [space , displayStats] , "Stem Cell ABM" , model_params)
+    server.port = 8521
+    #Start Server
+    server.launch()
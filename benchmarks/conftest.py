@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import pytest
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+if ROOT not in sys.path:
+    sys.path.insert(0 , ROOT)
+
+
+#Defaults used when the benchmarks are collected from the repository root, where this conftest's options are not registered
+DEFAULTS = {"--baseline" : os.path.join(HERE , "baselines" , "baseline.json") , "--save-baseline" : False , "--regression-threshold" : 0.25 , "--max-cells" : 2000 , "--max-grid" : 500 , "--import-budget" : 0.5}
+
+
+def option(config, name):
+    return config.getoption(name , DEFAULTS[name])
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("stemcellabm" , "StemCellABM benchmark baselines")
+    group.addoption("--baseline" , default=DEFAULTS["--baseline"],
+                    help="JSON file holding the mean time (seconds) of every benchmark")
+    group.addoption("--save-baseline" , action="store_true",
+                    help="Write this run's results to --baseline instead of comparing against it")
+    group.addoption("--regression-threshold" , type=float , default=DEFAULTS["--regression-threshold"],
+                    help="Fail a benchmark whose mean is slower than baseline by more than this fraction (default 0.25)")
+    group.addoption("--max-cells" , type=int , default=DEFAULTS["--max-cells"],
+                    help="Skip population sizes above this many stem cells (default 2000)")
+    group.addoption("--max-grid" , type=int , default=DEFAULTS["--max-grid"],
+                    help="Skip BMP4 field grids with more than this many nodes per side (default 500)")
+    group.addoption("--import-budget" , type=float , default=DEFAULTS["--import-budget"],
+                    help="Maximum cold-start import time (seconds) of the model modules (default 0.5)")
+
+
+def pytest_configure(config):
+    config.stageResults = {}
+    config.stageBaseline = {}
+    path = option(config , "--baseline")
+    if os.path.exists(path) and not option(config , "--save-baseline"):
+        with open(path) as f:
+            config.stageBaseline = json.load(f)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    if option(config , "--save-baseline") and config.stageResults:
+        path = option(config , "--baseline")
+        os.makedirs(os.path.dirname(path) , exist_ok=True)
+        baseline = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                baseline = json.load(f)
+        baseline.update(config.stageResults)
+        with open(path , "w") as f:
+            json.dump(baseline , f , indent=2 , sort_keys=True)
+
+
+
+@pytest.fixture
+def bench(benchmark, request):
+    '''Times target with pytest-benchmark and checks the mean against the stored baseline
+
+        setup (optional) is called before every round and returns the arguments tuple for target, so stages that
+        mutate the model can run on a fresh copy each round without timing the copy.'''
+    config = request.config
+
+    def run(target, setup=None, rounds=5):
+        if setup is None:
+            benchmark.pedantic(target , rounds=rounds , iterations=1 , warmup_rounds=1)
+        else:
+            benchmark.pedantic(target , setup=lambda: (setup() , {}) , rounds=rounds , warmup_rounds=0)
+        if benchmark.stats is None:
+            return  #--benchmark-disable runs the target once without timing it
+        mean = benchmark.stats.stats.mean
+        name = request.node.name
+        config.stageResults[name] = mean
+        baseline = config.stageBaseline.get(name)
+        threshold = option(config , "--regression-threshold")
+        if baseline is not None and mean > baseline * (1 + threshold):
+            pytest.fail("{} regressed: mean {:.6f}s vs baseline {:.6f}s (threshold {:.0%})".format(name , mean , baseline , threshold))
+
+    return run
+
+
+
+@pytest.fixture
+def max_cells(request):
+    return option(request.config , "--max-cells")
+
+
+
+@pytest.fixture
+def max_grid(request):
+    return option(request.config , "--max-grid")
+
+
+
+@pytest.fixture
+def import_budget(request):
+    return option(request.config , "--import-budget")
@@ -0,0 +1,28 @@
+import os
+import pytest
+import Constants
+from Decomposition import DecomposedABM
+
+
+#Worker processes per run; counts above the machine's cores are skipped, since they cannot scale there
+TILES = [1 , 2 , 4 , 8]
+
+#Stem cells of the decomposed colony (skipped when above --max-cells)
+NUM_CELLS = 2000
+
+
+@pytest.fixture(params=TILES , ids=lambda n: "{}tiles".format(n))
+def decomposed(request, max_cells):
+    if request.param > (os.cpu_count() or 1):
+        pytest.skip("more tiles than cores")
+    if NUM_CELLS > max_cells:
+        pytest.skip("population above --max-cells")
+    model = DecomposedABM(NUM_CELLS , Constants.SAUCE , Constants.NUM_BMP4 , Constants.NUM_NOG , Constants.SPAWN_FREQ , Constants.DIFF_TIMER,
+                          Constants.ENDO_MIN , Constants.ECTO_MAX , Constants.MAX_X , Constants.MAX_Y , seed=NUM_CELLS , tiles=request.param)
+    yield model
+    model.close()
+
+
+
+def test_decomposed_step(bench, decomposed):
+    bench(decomposed.step , rounds=3)
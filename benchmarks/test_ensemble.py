@@ -0,0 +1,35 @@
+import pytest
+import Constants
+from Ensemble import EnsembleABM
+from StemCellABM import ABM
+
+
+#Replicates stepped per benchmark round, by one EnsembleABM or by as many separate ABMs
+REPLICATES = [1 , 8 , 32]
+
+#Stem cells per replicate (skipped when replicates x cells is above --max-cells)
+NUM_CELLS = 100
+
+PARAMS = (NUM_CELLS , False , Constants.NUM_BMP4 , Constants.NUM_NOG , Constants.SPAWN_FREQ , Constants.DIFF_TIMER , Constants.ENDO_MIN , Constants.ECTO_MAX)
+
+
+@pytest.fixture(params=REPLICATES , ids=lambda n: "{}replicates".format(n))
+def replicates(request, max_cells):
+    if request.param * NUM_CELLS > max_cells:
+        pytest.skip("population above --max-cells")
+    return request.param
+
+
+
+def test_ensemble_step(bench, replicates):
+    model = EnsembleABM(*PARAMS , seed=1 , replicates=replicates)
+    bench(model.step , rounds=3)
+
+
+def test_separate_steps(bench, replicates):
+    models = [ABM(*PARAMS , seed=seed) for seed in range(replicates)]
+    def step():
+        for model in models:
+            model.step()
+    bench(step , rounds=3)
+
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Modules the core simulation must not pull in at import time (GUI, plotting, pandas via mesa.datacollection, scipy.sparse via Brandon's operators)
+HEAVY_MODULES = ("matplotlib" , "tornado" , "mesa.visualization" , "pandas" , "scipy.sparse")
+
+
+def importTime(module):
+    '''Cold-start cumulative import time of module in seconds, from a fresh interpreter's -X importtime report'''
+    result = subprocess.run([sys.executable , "-X" , "importtime" , "-c" , "import " + module] , cwd=ROOT , capture_output=True , text=True , check=True)
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise AssertionError("no import time reported for " + module)
+
+
+def loadedModules(module):
+    code = "import sys , {}; print('\\n'.join(sys.modules))".format(module)
+    result = subprocess.run([sys.executable , "-c" , code] , cwd=ROOT , capture_output=True , text=True , check=True)
+    return result.stdout.split()
+
+
+
+@pytest.mark.parametrize("module" , ["StemCellABM" , "Batch" , "Headless"])
+def test_import_time(module, import_budget):
+    seconds = min(importTime(module) for i in range(3))
+    assert seconds <= import_budget , "import {} took {:.3f}s (budget {:.3f}s)".format(module , seconds , import_budget)
+
+
+@pytest.mark.parametrize("module" , ["StemCellABM" , "Batch" , "Headless"])
+def test_no_heavy_imports(module):
+    loaded = loadedModules(module)
+    heavy = [name for name in loaded if name.startswith(HEAVY_MODULES)]
+    assert heavy == [] , "import {} loaded {}".format(module , ", ".join(heavy))
@@ -0,0 +1,136 @@
+import copy
+import pytest
+import Constants
+from StemCellABM import ABM
+from CanvasContinuousVisualization import CanvasContinuous , BinaryCanvasContinuous , DensityCanvasContinuous
+from Replay import PALETTE , MOLECULE_CODES , agent_portrayal , agent_code , bmp4_field
+
+
+#Population sizes
+SIZES = [100 , 500 , 2000 , 10000]
+
+#BMP4 field grid nodes per side for updateBMP4 (with a 100 cell colony), timed with every field solver
+GRIDS = [50 , 100 , 250 , 500 , 1000]
+SOLVERS = ["direct" , "cg" , "multigrid"]
+
+_models = {}
+_gridModels = {}
+
+
+def grownModel(numCells):
+    '''Builds (once per session) a model with numCells stem cells and the default molecule counts'''
+    if numCells not in _models:
+        _models[numCells] = ABM(numCells , Constants.SAUCE , Constants.NUM_BMP4 , Constants.NUM_NOG , Constants.SPAWN_FREQ , Constants.DIFF_TIMER,
+                                Constants.ENDO_MIN , Constants.ECTO_MAX , Constants.MAX_X , Constants.MAX_Y , seed=numCells)
+    return _models[numCells]
+
+
+@pytest.fixture(params=SIZES , ids=lambda n: "{}cells".format(n))
+def model(request, max_cells):
+    if request.param > max_cells:
+        pytest.skip("population above --max-cells")
+    return grownModel(request.param)
+
+
+@pytest.fixture(params=[(n , solver) for n in GRIDS for solver in SOLVERS] , ids=lambda p: "{}grid-{}".format(*p))
+def gridModel(request, max_grid):
+    n , solver = request.param
+    if n > max_grid:
+        pytest.skip("grid above --max-grid")
+    if request.param not in _gridModels:
+        _gridModels[request.param] = ABM(100 , Constants.SAUCE , Constants.NUM_BMP4 , Constants.NUM_NOG , Constants.SPAWN_FREQ , Constants.DIFF_TIMER,
+                                         Constants.ENDO_MIN , Constants.ECTO_MAX , Constants.MAX_X , Constants.MAX_Y , seed=100,
+                                         field_nx=n , field_ny=n , field_solver=solver)
+    return _gridModels[request.param]
+
+
+def freshCopy(model):
+    def setup():
+        m = copy.deepcopy(model)
+        m.calcAvgs()
+        m.updateTouchingDict()
+        return (m ,)
+    return setup
+
+
+
+def test_step(bench, model):
+    bench(lambda m: m.step() , setup=freshCopy(model) , rounds=3)
+
+
+def test_calcAvgs(bench, model):
+    bench(model.calcAvgs)
+
+
+def test_updateParams(bench, model):
+    bench(model.updateParams)
+
+
+def test_updateTouchingDict(bench, model):
+    bench(model.updateTouchingDict , rounds=3)
+
+
+def test_updateBMP4(bench, gridModel):
+    #The warmup round builds and factorizes the grid's operators
+    bench(gridModel.updateBMP4)
+
+
+def test_cascade(bench, model):
+    bench(model.cascade , rounds=3)
+
+
+def test_schedule_step(bench, model):
+    def setup():
+        m = freshCopy(model)()[0]
+        m.drawTickRandoms()
+        return (m ,)
+    bench(lambda m: m.schedule.step() , setup=setup , rounds=3)
+
+
+def test_lifecycle_flush(bench, model):
+    #Retires every BMP4 of a fresh copy and removes them in one batch
+    def setup():
+        m = freshCopy(model)()[0]
+        for agent in m.BMP4:
+            m.lifecycle.retire(agent)
+        return (m ,)
+    bench(lambda m: m.lifecycle.flush() , setup=setup , rounds=3)
+
+
+def test_render(bench, model):
+    #One portrayal dict per agent (BINARY_FRAMES = False)
+    canvas = CanvasContinuous(agent_portrayal , model.space.x_max , model.space.y_max , 500 , 500)
+    bench(lambda: canvas.render(model))
+
+
+@pytest.mark.parametrize("frame" , ["keyframe" , "delta"])
+def test_render_binary(bench, model, frame):
+    #A keyframe holds every agent; a delta frame holds the agents that changed over one step
+    def setup():
+        m = freshCopy(model)()[0]
+        canvas = BinaryCanvasContinuous(agent_code , PALETTE , m.space.x_max , m.space.y_max , 500 , 500)
+        if frame == "delta":
+            canvas.render(m)
+            m.step()
+        return (canvas , m)
+    bench(lambda canvas , m: canvas.render(m) , setup=setup , rounds=3)
+
+
+@pytest.mark.parametrize("threshold" , [0 , 10**9] , ids=["density" , "circles"])
+def test_render_density(bench, model, threshold):
+    #Keyframe with the BMP4 field heatmap; molecules binned into density heatmaps (threshold 0) or sent as circles
+    def setup():
+        canvas = DensityCanvasContinuous(agent_code , PALETTE , model.space.x_max , model.space.y_max , 500 , 500 , field_method=bmp4_field,
+                                         molecule_codes=MOLECULE_CODES , molecule_threshold=threshold)
+        return (canvas ,)
+    bench(lambda canvas: canvas.render(model) , setup=setup , rounds=3)
+
+
+@pytest.mark.parametrize("precision" , ["float64" , "float32"])
+def test_updateBMP4_precision(bench, precision, max_grid):
+    #The default solver on a 500 x 500 grid in double and single precision
+    if 500 > max_grid:
+        pytest.skip("grid above --max-grid")
+    model = ABM(100 , Constants.SAUCE , Constants.NUM_BMP4 , Constants.NUM_NOG , Constants.SPAWN_FREQ , Constants.DIFF_TIMER,
+                Constants.ENDO_MIN , Constants.ECTO_MAX , Constants.MAX_X , Constants.MAX_Y , seed=100 , field_nx=500 , field_ny=500 , precision=precision)
+    bench(model.updateBMP4)
@@ -0,0 +1 @@
+"""Command-line entry point: python -m stemcellabm run --help (see Headless.py)"""
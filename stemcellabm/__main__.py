@@ -0,0 +1,13 @@
+"""Command-line entry point: python -m stemcellabm run --help (see Headless.py)
+
+    Only a launcher for the modules of the repository, which are not installed as a package: run it from the directory
+    containing them, or with that directory on PYTHONPATH."""
+try:
+    from Headless import main
+except ModuleNotFoundError as error:
+    if error.name != "Headless":
+        raise
+    raise SystemExit("python -m stemcellabm must be run from the directory containing Headless.py and the model files (or with it on PYTHONPATH)")
+
+
+main()
@@ -0,0 +1,31 @@
+import inspect
+import os
+import sys
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0 , ROOT)
+
+
+#Overrides of Headless.MODEL_PARAMS shared by the tests: a small seeded colony
+SMALL_PARAMS = {"num_stem_cells" : 100 , "seed" : 0}
+
+
+
+@pytest.fixture
+def smallModel():
+    '''Builds a model (ABM unless cls is given) from Headless.MODEL_PARAMS, SMALL_PARAMS and then overrides
+
+        Defaults that cls does not take (e.g. profile for an EnsembleABM) are left out; overrides are always passed.'''
+    import Headless
+    from StemCellABM import ABM
+
+    def build(cls=ABM, **overrides):
+        accepted = inspect.signature(cls).parameters
+        params = {name : value for name , value in dict(Headless.MODEL_PARAMS , **SMALL_PARAMS).items() if name in accepted}
+        params.update(overrides)
+        return cls(**params)
+
+    return build
@@ -0,0 +1,49 @@
+import pytest
+from Batch import forkRuns , branchSeeds
+
+
+def test_fork_default_seeds_repeat(smallModel):
+    #Default branch seeds are derived from the parent without modifying it, so a second fork repeats the first
+    model = smallModel(seed=7)
+    for i in range(3):
+        model.step()
+    paramSets = [{} , {"endo_min" : 0.6}]
+    first = forkRuns(model , paramSets , 5 , processes=1)
+    second = forkRuns(model , paramSets , 5 , processes=1)
+    assert first == second
+    assert first[0] != forkRuns(model , [{} , {}] , 5 , processes=1)[1]
+
+
+def doseSummary(model):
+    inactive = sum(not agent.active for agent in model.BMP4) / len(model.BMP4)
+    return {"NOG" : len(model.NOG) , "inactive_BMP4" : inactive , "binding_rate" : model.morphogens.binding_rate,
+            "BMP4_total" : float(model.BMP4vector.sum()) , "live_molecules" : model.live_molecules}
+
+
+def test_fork_doses_diverge(smallModel):
+    #Both branches share a seed, so only the dose tells them apart
+    model = smallModel(seed=4)
+    for i in range(3):
+        model.step()
+    seed = branchSeeds(model.seedSequence , 1)[0]
+    low , high = forkRuns(model , [{"num_NOG" : 0} , {"num_NOG" : 400 , "num_BMP4" : 50}] , 5 , seeds=[seed , seed] , collect=doseSummary , processes=1)
+    assert (low["NOG"] , high["NOG"]) == (0 , 400)
+    assert low["live_molecules"] == model.num_BMP4 and high["live_molecules"] == 450
+    assert high["inactive_BMP4"] > low["inactive_BMP4"]
+    assert len(model.NOG) == model.num_NOG
+    with pytest.raises(ValueError):
+        forkRuns(model , [{"binding_rate" : 5.0}] , 5 , processes=1)
+    #Binding needs the NOG field, which is solved only when the parent binds at all
+    model = smallModel(seed=4 , binding_rate=0.1)
+    for i in range(3):
+        model.step()
+    unbound , bound = forkRuns(model , [{"binding_rate" : 0.0} , {"binding_rate" : 5.0}] , 5 , seeds=[seed , seed] , collect=doseSummary , processes=1)
+    assert bound["binding_rate"] == 5.0
+    assert bound["BMP4_total"] < unbound["BMP4_total"]
+
+
+@pytest.mark.parametrize("name" , ["num_stem_cells" , "max_x" , "field_nx" , "diff_timer" , "no_such_param"])
+def test_fork_rejects_setup_params(smallModel, name):
+    model = smallModel()
+    with pytest.raises(ValueError):
+        forkRuns(model , [{name : 1}] , 1 , processes=1)
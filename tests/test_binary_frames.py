@@ -0,0 +1,123 @@
+import base64
+import numpy as np
+from CanvasContinuousVisualization import BinaryCanvasContinuous , DensityCanvasContinuous
+from Replay import PALETTE , MOLECULE_CODES , agent_code , bmp4_field
+from StemCellABM import ABM
+
+
+def decode(text, dtype):
+    return np.frombuffer(base64.b64decode(text) , dtype=dtype)
+
+
+def apply(frame, agents):
+    '''What ContinuousCanvasModule's renderBinary does to its agent map'''
+    assert frame["binary"] == 1
+    if frame["keyframe"]:
+        agents.clear()
+    ids , xs , ys , codes = (decode(frame["ids"] , "<u4") , decode(frame["x"] , "<f4") , decode(frame["y"] , "<f4"),
+                             decode(frame["code"] , np.uint8))
+    for i in range(len(ids)):
+        agents[int(ids[i])] = (xs[i] , ys[i] , int(codes[i]))
+    for unique_id in decode(frame["removed"] , "<u4"):
+        agents.pop(int(unique_id) , None)
+    return agents
+
+
+def inSpace(model):
+    return {agent.unique_id : (np.float32(agent.pos[0]) , np.float32(agent.pos[1]) , agent_code(agent)) for agent in model.space._agent_to_index}
+
+
+def canvas(model, **kwargs):
+    return BinaryCanvasContinuous(agent_code , PALETTE , model.space.x_max , model.space.y_max , **kwargs)
+
+
+def test_round_trip_with_removed_and_readded_agents(smallModel):
+    model = smallModel(num_stem_cells=50 , seed=2)
+    view = canvas(model)
+    agents = apply(view.render(model) , {})
+    assert agents == inSpace(model)
+    cell = model.cells[0]
+    absorbed = model.NOG[:5]
+    def absorb():
+        for agent in absorbed:
+            agent.absorbed = True
+        model.step()
+    changes = [
+        model.step,
+        #Taken out of the space for a frame, then placed back elsewhere under the same id
+        lambda: model.space.remove_agent(cell),
+        lambda: model.space.place_agent(cell , (model.center_pos[0] + 1 , model.center_pos[1])),
+        model.step,
+        absorb,
+        #The pooled NOG objects come back under new ids
+        lambda: model.cells[1].spawnBMP4(3),
+        model.step
+    ]
+    for change in changes:
+        change()
+        frame = view.render(model)
+        assert not frame["keyframe"]
+        assert apply(frame , agents) == inSpace(model)
+    assert cell.unique_id in agents
+    assert model.lifecycle.reused == 3
+
+
+def test_each_viewer_gets_its_own_baseline(smallModel):
+    #Two tabs sharing one model see alternate frames; each decodes from the frames it was sent
+    model = smallModel(num_stem_cells=50 , seed=3)
+    view = canvas(model)
+    seen = {"a" : {} , "b" : {}}
+    frames = {"a" : [] , "b" : []}
+    for tick in range(6):
+        viewer = "ab"[tick % 2]
+        frame = view.encodeFrame(view.capture(model) , viewer)
+        frames[viewer].append(frame["keyframe"])
+        assert apply(frame , seen[viewer]) == inSpace(model)
+        model.step()
+    assert frames == {"a" : [True , False , False] , "b" : [True , False , False]}
+    #A viewer that went away starts again from a keyframe, and so does every viewer of a new model
+    view.forget("a")
+    assert view.encodeFrame(view.capture(model) , "a")["keyframe"]
+    other = smallModel(num_stem_cells=50 , seed=4)
+    assert view.encodeFrame(view.capture(other) , "b")["keyframe"]
+
+
+def test_periodic_keyframes(smallModel):
+    model = smallModel(num_stem_cells=20 , seed=5)
+    view = canvas(model , keyframe_every=2)
+    keyframes = []
+    for tick in range(5):
+        keyframes.append(view.render(model)["keyframe"])
+        model.step()
+    assert keyframes == [True , False , False , True , False]
+
+
+def test_density_frames_round_trip(smallModel):
+    #Molecules above the threshold go to the density heatmaps, the rest round-trip as agents
+    model = smallModel(num_stem_cells=30 , seed=6)
+    view = DensityCanvasContinuous(agent_code , PALETTE , model.space.x_max , model.space.y_max , field_method=bmp4_field,
+                                   molecule_codes=MOLECULE_CODES , molecule_threshold=10)
+    agents = {}
+    for tick in range(3):
+        frame = view.render(model)
+        cells = {unique_id : value for unique_id , value in inSpace(model).items() if value[2] not in MOLECULE_CODES}
+        assert apply(frame , agents) == cells
+        present = {value[2] for value in inSpace(model).values()} & set(MOLECULE_CODES)
+        assert set(frame["density"]["grids"]) == present
+        assert frame["field"]["w"] * frame["field"]["h"] == len(decode(frame["field"]["data"] , np.uint8))
+        model.step()
+
+
+def test_viewer_server_encodes_per_connection(smallModel):
+    from ThreadedServer import ViewerModularServer
+    server = ViewerModularServer(ABM , [BinaryCanvasContinuous(agent_code , PALETTE , 20 , 20)] , "test",
+                                 {"num_stem_cells" : 20 , "sauce" : False , "num_BMP4" : 10 , "num_NOG" : 10 , "spawn_freq" : 20,
+                                  "diff_timer" : 10 , "endo_min" : 0.5 , "ecto_max" : 0.5 , "seed" : 1})
+    first = server.renderFor("tab1")[0]
+    server.model.step()
+    assert server.renderFor("tab2")[0]["keyframe"]
+    assert not server.renderFor("tab1")[0]["keyframe"]
+    captured = server.captureModel()
+    assert server.encodeFor(captured , "tab3")[0]["keyframe"] and first["keyframe"]
+    server.forgetViewer("tab1")
+    assert server.renderFor("tab1")[0]["keyframe"]
@@ -0,0 +1,70 @@
+import json
+import os
+import pytest
+import Headless
+from Batch import summarize
+
+
+def runToStop(model, limit=50):
+    while model.running and model.schedule.steps < limit:
+        model.step()
+    return model
+
+
+def assertStopped(model, reason, ticks):
+    assert model.running is False
+    assert model.stop_reason == reason
+    assert model.schedule.steps == ticks
+    assert model.datacollector.get_model_vars_dataframe()["stop_reason"].iloc[-1] == reason
+    assert summarize(model)["stop_reason"] == reason
+
+
+def test_no_stop_params_no_monitor(smallModel):
+    model = smallModel(sauce=False)
+    assert model.monitor is None
+    model.step()
+    assert model.running and model.stop_reason is None
+
+
+def test_stop_field_change(smallModel):
+    #The first check only stores the field; the next 3 relative changes (~5e-3) are all below 0.5
+    model = runToStop(smallModel(sauce=False , stop_field_change=0.5 , stop_window=3))
+    assertStopped(model , "field_change" , 4)
+    assert model.monitor.last["field_change"] < 0.5
+
+
+def test_stop_field_change_tight(smallModel):
+    #Below the field's per-tick change the criterion never holds
+    model = runToStop(smallModel(sauce=False , stop_field_change=1e-6 , stop_window=3) , limit=10)
+    assert model.running and model.stop_reason is None
+
+
+def test_stop_drift(smallModel):
+    #Drift is measured over window + 1 ticks of centroid and radius
+    model = runToStop(smallModel(sauce=False , stop_drift=10.0 , stop_window=3))
+    assertStopped(model , "drift" , 4)
+    assert model.monitor.last["drift"] < 10.0
+
+
+def test_stop_plateau(smallModel):
+    #With sauce off the colony only differentiates by hand, so the fraction moves only as virgin cells divide
+    model = smallModel(sauce=False , stop_plateau=0.5 , stop_window=2)
+    for cell in model.cells[:30]:
+        cell.differentiated = "endo"
+    assertStopped(runToStop(model) , "plateau" , 3)
+    assert 0 <= model.monitor.last["plateau"] < 0.5
+
+
+def test_stop_max_agents(smallModel):
+    #300 agents at the start; cells begin dividing after a few ticks
+    model = runToStop(smallModel(sauce=False , max_agents=305))
+    assertStopped(model , "max_agents" , 5)
+    assert model.monitor.last["max_agents"] > 305
+
+
+def test_headless_stop_reason(tmp_path, capsys):
+    Headless.main(["run" , "--num-stem-cells" , "100" , "--seed" , "0" , "--no-sauce" , "--max-agents" , "305" , "--ticks" , "50",
+                   "--report-every" , "0" , "--output" , str(tmp_path)])
+    assert "running=False, stop_reason=max_agents" in capsys.readouterr().out
+    with open(os.path.join(tmp_path , "summary.json")) as f:
+        assert json.load(f)["stop_reason"] == "max_agents"
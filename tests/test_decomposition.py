@@ -0,0 +1,54 @@
+import inspect
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+import Headless
+from Decomposition import DecomposedABM , TileABM , packAgent
+from StemCellABM import ABM
+from tests.conftest import SMALL_PARAMS
+
+
+TICKS = 8
+PARAMS = {"num_stem_cells" : 200 , "sauce" : False , "seed" : 1}
+
+
+@pytest.mark.parametrize("tiles" , [1 , 2])
+def test_decomposed_tracks_abm(smallModel, tiles):
+    #Tiles draw from their own streams, so the colony only matches ABM statistically
+    single = smallModel(**PARAMS)
+    molecules = single.num_BMP4 + single.num_NOG
+    with smallModel(DecomposedABM , tiles=tiles , **PARAMS) as decomposed:
+        for tick in range(TICKS):
+            single.step()
+            decomposed.step()
+            #No agent is lost or duplicated by the handovers between tiles
+            assert decomposed.schedule.get_agent_count() == decomposed.num_stem_cells + molecules
+        agents = decomposed.gather()
+        assert len(np.unique(agents["ids"])) == decomposed.schedule.get_agent_count()
+        assert np.count_nonzero(agents["type"] == "StemCell") == decomposed.num_stem_cells
+        assert decomposed.num_stem_cells > PARAMS["num_stem_cells"]
+        assert decomposed.num_stem_cells == pytest.approx(single.num_stem_cells , rel=0.1)
+        assert decomposed.avg_radius == pytest.approx(single.avg_radius , rel=0.1)
+
+
+def test_tile_builds_no_fields_or_collector(smallModel):
+    model = smallModel()
+    #The parameters DecomposedABM hands its tiles: ABM's, without the seed and the stop criteria
+    accepted = inspect.signature(ABM).parameters
+    params = {name : value for name , value in dict(Headless.MODEL_PARAMS , **SMALL_PARAMS).items()
+              if name in accepted and name != "seed" and not name.startswith("stop") and name != "max_agents"}
+    memory = shared_memory.SharedMemory(create=True , size=2 * model.grid.size * model.grid.dtype.itemsize)
+    try:
+        edges = np.array([model.space.x_min , model.space.x_max])
+        tile = TileABM(0 , edges , params , [packAgent(agent) for agent in model.schedule.agents] , np.random.SeedSequence(1),
+                       memory.name , model.grid.size , model.currentIDNum , model.stem_cell_ex.unique_id)
+        assert tile.morphogens is None and tile.datacollector is None
+        tile.fields[0] = model.BMP4vector
+        tile.step()
+        assert tile.schedule.steps == 1
+        assert tile.schedule.get_agent_count() == model.schedule.get_agent_count()
+        del tile.fields , tile.BMP4vector
+        tile.fieldMemory.close()
+    finally:
+        memory.close()
+        memory.unlink()
@@ -0,0 +1,27 @@
+import pytest
+from Ensemble import EnsembleABM , STATES
+from Batch import summarize
+
+
+def test_ensemble_matches_separate_runs(smallModel):
+    #Each replicate against the ABM run it stands for, to the end of differentiation. Rounding differences between
+    #numpy and math can flip a few cells late in a run, so the statistics are compared as means over the replicates
+    model = smallModel(EnsembleABM , sauce=True , seed=3 , replicates=8)
+    while model.running:
+        model.step()
+    ensemble = model.summaries()
+    separate = []
+    for seed in model.replicateSeeds:
+        run = smallModel(sauce=True , seed=seed)
+        while run.running:
+            run.step()
+        separate.append(summarize(run))
+    for mine , theirs in zip(ensemble , separate):
+        assert mine["ticks"] == theirs["ticks"]
+        assert mine["num_stem_cells"] == theirs["num_stem_cells"]
+    mean = lambda summaries , f: sum(f(s) for s in summaries) / len(summaries)
+    for state in STATES:
+        fraction = lambda s: s[state] / s["num_stem_cells"]
+        assert mean(ensemble , fraction) == pytest.approx(mean(separate , fraction) , abs=0.01)
+    for name in ("avg_x" , "avg_y" , "avg_radius"):
+        assert mean(ensemble , lambda s: s[name]) == pytest.approx(mean(separate , lambda s: s[name]) , abs=0.01)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import Brandon
+from StemCellABM import morphogenSpecies
+
+
+def smallGrid(solver="direct", nx=40, ny=30, **kwargs):
+    #Not square, so a swapped nx/ny shows up as a wrong shape or a wrong field
+    return Brandon.DiffusionGrid(0 , 20 , 0 , 15 , nx , ny , solver=solver , **kwargs)
+
+
+def test_default_species_skip_nog():
+    assert "NOG" not in morphogenSpecies(0.0)
+    assert "NOG" in morphogenSpecies(0.5)
+
+
+def test_kinetics_conserve_bmp4_and_complex():
+    names = ["BMP4" , "NOG" , "BMP4_NOG"]
+    rng = np.random.default_rng(0)
+    values = rng.random((3 , 50))
+    rates = Brandon.apply_kinetics(values , names , 2.0)
+    bound = 2.0 * values[0] * values[1]
+    np.testing.assert_allclose(rates[0] , -bound)
+    np.testing.assert_allclose(rates[1] , -bound)
+    np.testing.assert_allclose(rates[0] + rates[2] , 0 , atol=1e-15)
+    assert not Brandon.apply_kinetics(values , names , 0.0).any()
+
+
+def test_binding_conserves_bmp4_and_complex_through_steps():
+    #Species sharing kappa diffuse linearly and identically, so BMP4 + complex evolves as unbound BMP4 would
+    species = {"BMP4" : {"kappa" : 1} , "NOG" : {"kappa" : 1} , "BMP4_NOG" : {"kappa" : 1 , "amplitude" : 0}}
+    bound = Brandon.MorphogenFields(smallGrid() , species , binding_rate=3.0)
+    free = Brandon.MorphogenFields(smallGrid() , {"BMP4" : {"kappa" : 1}})
+    for i in range(5):
+        bound.step()
+        free.step()
+    assert bound.field("BMP4_NOG").sum() > 0
+    np.testing.assert_allclose(bound.field("BMP4") + bound.field("BMP4_NOG") , free.field("BMP4") , rtol=1e-10 , atol=1e-14)
+
+
+@pytest.mark.parametrize("solver" , ["direct" , "cg"])
+def test_multi_column_solve_matches_single_columns(solver):
+    grid = smallGrid(solver , tol=1e-12)
+    rng = np.random.default_rng(1)
+    heat = np.stack([grid.initial() , rng.random(grid.size) , 0.5 * grid.initial()] , axis=1)
+    reaction = rng.random(heat.shape) * 0.1
+    together = grid.step(heat , reaction)
+    for column in range(heat.shape[1]):
+        np.testing.assert_allclose(together[: , column] , grid.step(heat[: , column] , reaction[: , column]) , rtol=1e-10 , atol=1e-12)
+
+
+@pytest.mark.parametrize("dt" , [Brandon.dt , 1.0] , ids=["default_dt" , "stiff"])
+def test_solvers_agree(dt):
+    fields = {}
+    for solver in Brandon.SOLVERS:
+        grid = smallGrid(solver , tol=1e-10 , dt=dt)
+        field = grid.initial()
+        for i in range(5):
+            field = grid.step(field)
+        fields[solver] = field
+    np.testing.assert_allclose(fields["cg"] , fields["direct"] , rtol=0 , atol=1e-9)
+    np.testing.assert_allclose(fields["multigrid"] , fields["direct"] , rtol=0 , atol=1e-9)
+
+
+def stepIterations(solver, nx, ny, dt=Brandon.dt):
+    grid = smallGrid(solver , nx , ny , dt=dt)
+    field = grid.initial()
+    iterations = []
+    for i in range(3):
+        field = grid.step(field)
+        iterations.append(grid.iterations)
+    return max(iterations)
+
+
+def test_multigrid_iterations_bounded():
+    #A large dt makes the system stiff: plain CG then needs about twice the iterations per doubling of the grid,
+    #while the V-cycle keeps multigrid nearly flat. A V-cycle that stops working falls back to CG's growth
+    sizes = [(40 , 30) , (80 , 60) , (160 , 120)]
+    multigrid = [stepIterations("multigrid" , nx , ny , dt=1.0) for nx , ny in sizes]
+    cg = stepIterations("cg" , *sizes[-1] , dt=1.0)
+    assert max(multigrid) <= 20
+    assert all(finer - coarser <= 3 for coarser , finer in zip(multigrid , multigrid[1:]))
+    assert cg > 5 * multigrid[-1]
+    #At the model's time step a 100 x 100 grid takes a couple of iterations per tick
+    assert stepIterations("multigrid" , 100 , 100) <= 3
+
+
+def test_auto_solver_picks_multigrid_for_large_grids():
+    from mesa.space import ContinuousSpace
+    assert smallGrid("auto").solver == "direct"
+    assert smallGrid("auto" , 500 , 500).solver == "multigrid"
+    space = ContinuousSpace(20 , 20 , False)
+    assert Brandon.DiffusionGrid.fromSpace(space).solver == "direct"
+    assert Brandon.DiffusionGrid.fromSpace(space , 1000 , 1000).solver == "multigrid"
+    assert Brandon.DiffusionGrid.fromSpace(space , 1000 , 1000 , solver="cg").solver == "cg"
@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from Headless import main
+from tests.conftest import ROOT
+
+
+CONFIG = {"num_stem_cells" : 60 , "seed" : 2 , "sauce" : False , "ticks" : 3 , "report_every" : 0}
+
+
+def runCLI(tmp_path, config, *flags, name="config.json"):
+    path = tmp_path / name
+    if name.endswith(".json"):
+        path.write_text(json.dumps(config))
+    else:
+        yaml = pytest.importorskip("yaml")
+        path.write_text(yaml.safe_dump(config))
+    output = tmp_path / "out"
+    main(["run" , "--config" , str(path) , "--output" , str(output) , *flags])
+    return output
+
+
+def readOutput(output):
+    with open(output / "summary.json") as f:
+        summary = json.load(f)
+    with open(output / "params.json") as f:
+        params = json.load(f)
+    return summary , params
+
+
+@pytest.mark.parametrize("name" , ["config.json" , "config.yaml"])
+def test_run_from_config(tmp_path, name):
+    #Flags override the config file
+    output = runCLI(tmp_path , CONFIG , "--endo-min" , "0.7" , name=name)
+    assert sorted(os.listdir(output)) == ["model_vars.csv" , "params.json" , "summary.json"]
+    summary , params = readOutput(output)
+    assert params["num_stem_cells"] == 60 and params["seed"] == 2 and params["endo_min"] == 0.7
+    assert summary["ticks"] == 3
+    with open(output / "model_vars.csv") as f:
+        assert len(f.read().splitlines()) == 1 + 3
+
+
+@pytest.mark.parametrize("name" , ["config.json" , "config.yaml"])
+def test_run_rejects_unknown_keys(tmp_path, name):
+    with pytest.raises(SystemExit , match="Unknown parameter.*num_cells"):
+        runCLI(tmp_path , dict(CONFIG , num_cells=10) , name=name)
+    assert not (tmp_path / "out").exists()
+
+
+def test_run_tiles(tmp_path):
+    output = runCLI(tmp_path , CONFIG , "--tiles" , "2")
+    assert sorted(os.listdir(output)) == ["model_vars.csv" , "params.json" , "summary.json"]
+    summary , params = readOutput(output)
+    assert summary["ticks"] == 3 and "tiles" not in params
+
+
+def test_run_replicates(tmp_path):
+    output = runCLI(tmp_path , CONFIG , "--replicates" , "3")
+    assert sorted(os.listdir(output)) == ["params.json" , "replicates.csv" , "summary.json"]
+    summary , _ = readOutput(output)
+    assert len(summary) == 3 and all(replicate["ticks"] == 3 for replicate in summary)
+    with open(output / "replicates.csv") as f:
+        assert len(f.read().splitlines()) == 1 + 3 * 3
+
+
+def test_module_entry_point_outside_root(tmp_path):
+    #python -m stemcellabm works from any directory once the repository is on PYTHONPATH, and says so in its usage
+    env = dict(os.environ , PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable , "-m" , "stemcellabm" , "--help"] , cwd=tmp_path , env=env , capture_output=True , text=True)
+    assert result.returncode == 0
+    assert "PYTHONPATH" in result.stdout
@@ -0,0 +1,60 @@
+import Constants
+from StemCellABM import BMP4 , NOG
+
+
+def inModel(model, agent):
+    return agent in model.space._agent_to_index and agent in model.schedule.agents
+
+
+def test_absorbed_nog_pooled_and_reused(smallModel):
+    model = smallModel(num_stem_cells=50 , seed=5)
+    absorbed = model.NOG[:3]
+    for agent in absorbed:
+        agent.absorbed = True
+    model.step()
+    assert model.lifecycle.retired == 3
+    assert model.pooled_molecules == 3
+    for agent in absorbed:
+        assert not inModel(model , agent)
+        assert agent not in model.NOG
+    assert model.live_molecules == Constants.NUM_BMP4 + Constants.NUM_NOG - 3
+
+    cell = model.cells[0]
+    before = model.currentIDNum
+    cell.spawnBMP4(2)
+    released = model.NOG[-2:]
+    assert model.lifecycle.reused == 2
+    assert all(any(agent is old for old in absorbed) for agent in released)
+    assert [agent.unique_id for agent in released] == [before + 1 , before + 2]
+    for agent in released:
+        assert inModel(model , agent)
+        assert not agent.absorbed
+        assert model.space.get_distance(agent.pos , cell.pos) < cell.internalR + 0.01
+    assert model.lifecycle.pooled == 1
+
+    #Released NOG step like any other, and the next flush finds nothing to retire
+    model.step()
+    assert model.lifecycle.retired == 3
+    assert all(inModel(model , agent) for agent in released)
+
+
+def test_inactive_bmp4_kept_by_default(smallModel):
+    model = smallModel(num_stem_cells=50 , seed=5)
+    agent = model.BMP4[0]
+    agent.active = False
+    agent.active_timer = 0
+    model.step()
+    assert inModel(model , agent)
+    assert model.lifecycle.retired == 0
+
+
+def test_inactive_bmp4_retired_when_opted_in(smallModel):
+    model = smallModel(num_stem_cells=50 , seed=5 , retire_inactive_bmp4=True)
+    agent = model.BMP4[0]
+    agent.active = False
+    agent.active_timer = 0
+    model.step()
+    assert not inModel(model , agent)
+    assert agent not in model.BMP4
+    assert any(pooled is agent for pooled in model.lifecycle.free[BMP4])
+    assert NOG not in model.lifecycle.free
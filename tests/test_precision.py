@@ -0,0 +1,90 @@
+import inspect
+import numpy as np
+from mesa import Agent
+from mesa.space import ContinuousSpace
+import Constants
+import Headless
+from Precision import STATISTICS , TypedContinuousSpace , validate
+from StemCellABM import ABM , StemCell
+from tests.conftest import SMALL_PARAMS
+
+
+def spaces(points):
+    '''A float32 space and a float64 ContinuousSpace holding the same (float32-representable) points'''
+    single = TypedContinuousSpace(20 , 20 , False , -20 , -20 , dtype=np.float32)
+    double = ContinuousSpace(20 , 20 , False , -20 , -20)
+    agents = [Agent(i , None) for i in range(len(points))]
+    for agent , pos in zip(agents , points):
+        single.place_agent(agent , tuple(pos))
+        double.place_agent(Agent(agent.unique_id , None) , single.rounded(pos))
+    return single , double , agents
+
+
+def test_float32_points_survive_place_move_remove():
+    rng = np.random.default_rng(0)
+    single , _ , agents = spaces(rng.uniform(-19 , 19 , (50 , 2)))
+    assert single._agent_points.dtype == np.float32
+    for agent in agents[:20]:
+        single.move_agent(agent , (agent.pos[0] + 0.1 , agent.pos[1] - 0.3))
+        assert np.float32(agent.pos[0]) == agent.pos[0]
+    assert single._agent_points.dtype == np.float32
+    for agent in agents[::3]:
+        single.remove_agent(agent)
+    assert single._agent_points.dtype == np.float32
+    single.place_agent(Agent(99 , None) , (0.1 , 0.2))
+    assert single._agent_points.dtype == np.float32
+    for agent , index in single._agent_to_index.items():
+        assert tuple(single._agent_points[index]) == agent.pos
+
+
+def test_float32_model_keeps_its_points(smallModel):
+    model = smallModel(precision="float32")
+    for tick in range(3):
+        model.step()
+        assert model.space._agent_points.dtype == np.float32
+        assert model.BMP4vector.dtype == np.float32
+
+
+def test_float32_neighbors_match_float64():
+    rng = np.random.default_rng(1)
+    single , double , _ = spaces(rng.uniform(-19 , 19 , (400 , 2)))
+    total = 0
+    for pos , radius in zip(rng.uniform(-19 , 19 , (30 , 2)) , rng.uniform(0.1 , 3 , 30)):
+        pos = single.rounded(pos)
+        found = {agent.unique_id for agent in single.get_neighbors(pos , radius)}
+        assert found == {agent.unique_id for agent in double.get_neighbors(pos , radius)}
+        total += len(found)
+    assert total > 30
+
+
+def test_validate_differences_stay_bounded():
+    params = {name : value for name , value in dict(Headless.MODEL_PARAMS , **SMALL_PARAMS).items() if name in inspect.signature(ABM).parameters}
+    result = validate(params , ticks=5 , seed=0)
+    assert result["ticks"] == 5 and len(result["history"]) == 5
+    #Only rounding separates the runs: the field stays within float32 accuracy and the colony statistics within 0.1% of the space
+    for row in result["history"]:
+        assert row["field"] < 1e-5
+        assert row["num_stem_cells"] == 0
+        for name in STATISTICS[1:]:
+            assert row[name] < 1e-3 * params["max_x"]
+    assert result["history"][0]["position"] < 1e-4
+    for double , single in result["states"].values():
+        assert double == single
+    assert result["mismatch"] <= 0.05
+
+
+def test_intersecting_points_of_vertically_stacked_cells(smallModel):
+    #Cells sharing an x (c == a) used to divide by zero; the chord between them is horizontal through their midpoint
+    model = smallModel()
+    cells = []
+    for y in (0.25 , 0.25 + Constants.STEMCELL_R):
+        model.currentIDNum += 1
+        cell = StemCell(model.currentIDNum , model)
+        model.space.place_agent(cell , (1.0 , y))
+        cells.append(cell)
+    (x1 , y1) , (x2 , y2) , _ = cells[0].intersectingPoints(cells[1])
+    assert y1 == y2 == (cells[0].pos[1] + cells[1].pos[1]) / 2
+    assert min(x1 , x2) < 1.0 < max(x1 , x2)
+    for x , y in ((x1 , y1) , (x2 , y2)):
+        for cell in cells:
+            assert abs(np.hypot(x - cell.pos[0] , y - cell.pos[1]) - cell.internalR) < 1e-12
@@ -0,0 +1,41 @@
+import csv
+import os
+import tracemalloc
+import pytest
+from StemCellABM import TICK_STAGES
+from Profiling import TickProfiler
+import Headless
+
+
+@pytest.fixture(autouse=True)
+def stopTracing():
+    #TickProfiler starts tracemalloc; stop it so the tests collected after these are not slowed down
+    tracing = tracemalloc.is_tracing()
+    yield
+    if not tracing:
+        tracemalloc.stop()
+
+
+def test_profile_allocations(smallModel):
+    model = smallModel(seed=3 , profile="allocations")
+    assert model.profiler.trackAllocations
+    model.step()
+    stages = model.profiler.last["stages"]
+    assert sum(entry["bytes"] for entry in stages.values()) > 0
+    row = model.datacollector.get_model_vars_dataframe().iloc[-1]
+    assert sum(row[name + "_bytes"] for name in TICK_STAGES) > 0
+
+
+def test_profile_instance(smallModel):
+    profiler = TickProfiler(capacity=5 , trackAllocations=True)
+    model = smallModel(seed=3 , profile=profiler)
+    assert model.profiler is profiler
+    model.step()
+    assert profiler.summary()["stages"]["updateBMP4"]["bytes"] > 0
+
+
+def test_headless_profile_allocations(tmp_path):
+    Headless.main(["run" , "--num-stem-cells" , "50" , "--ticks" , "2" , "--seed" , "1" , "--profile-allocations" , "--report-every" , "0" , "--output" , str(tmp_path)])
+    with open(os.path.join(tmp_path , "model_vars.csv")) as f:
+        rows = list(csv.DictReader(f))
+    assert sum(float(row["updateBMP4_bytes"]) for row in rows) > 0
@@ -0,0 +1,100 @@
+import os
+import zlib
+import numpy as np
+from Replay import PALETTE , Recorder , Recording , ReplayModel , agent_code , bmp4_field , rasterize , renderFrames , writePNG
+
+
+TICKS = 4
+
+
+def snapshot(model):
+    '''The model's agents sorted by unique_id and its field, as a Recorder frame should hold them'''
+    agents = sorted(model.space._agent_to_index , key=lambda agent: agent.unique_id)
+    return {
+        "ids" : np.array([agent.unique_id for agent in agents]),
+        "x" : np.array([agent.pos[0] for agent in agents]),
+        "y" : np.array([agent.pos[1] for agent in agents]),
+        "code" : np.array([agent_code(agent) for agent in agents]),
+        "field" : np.array(bmp4_field(model)[0])
+    }
+
+
+def record(model, path, **kwargs):
+    recorder = Recorder(str(path) , **kwargs)
+    expected = []
+    recorder.capture(model)
+    expected.append(snapshot(model))
+    for tick in range(TICKS):
+        model.step()
+        recorder.capture(model)
+        expected.append(snapshot(model))
+    return expected
+
+
+def readPNG(path):
+    '''Pixels of a PNG written by writePNG (one IDAT chunk, filter type 0 on every row)'''
+    with open(path , "rb") as f:
+        data = f.read()
+    width , height = np.frombuffer(data[16:24] , dtype=">u4")
+    length = int(np.frombuffer(data[33:37] , dtype=">u4")[0])
+    assert data[37:41] == b"IDAT"
+    rows = np.frombuffer(zlib.decompress(data[41:41 + length]) , dtype=np.uint8).reshape(height , width * 3 + 1)
+    assert not rows[: , 0].any()
+    return rows[: , 1:].reshape(height , width , 3)
+
+
+def test_recording_round_trip(smallModel, tmp_path):
+    model = smallModel(seed=4)
+    expected = record(model , tmp_path)
+    recording = Recording(str(tmp_path))
+    assert list(recording.ticks) == list(range(TICKS + 1))
+    assert recording.space == [model.space.x_min , model.space.x_max , model.space.y_min , model.space.y_max]
+    for index , state in enumerate(expected):
+        frame = recording.frame(index)
+        np.testing.assert_array_equal(frame["ids"] , state["ids"])
+        np.testing.assert_array_equal(frame["code"] , state["code"])
+        assert frame["x"].dtype == np.float32 and frame["y"].dtype == np.float32
+        np.testing.assert_allclose(frame["x"] , state["x"] , rtol=1e-6 , atol=1e-6)
+        np.testing.assert_allclose(frame["y"] , state["y"] , rtol=1e-6 , atol=1e-6)
+        #Stored as float32, so values below its range flush to zero
+        np.testing.assert_array_equal(frame["field"] , state["field"].astype(np.float32))
+
+
+def test_recorder_every_and_replay(smallModel, tmp_path):
+    expected = record(smallModel(seed=4) , tmp_path , every=2 , field=False)
+    replay = ReplayModel(str(tmp_path))
+    assert list(replay.recording.ticks) == [0 , 2 , 4]
+    assert replay.field is None
+    shown = []
+    while replay.running:
+        shown.append(replay.tick)
+        np.testing.assert_array_equal(replay.ids , expected[replay.tick]["ids"])
+        assert replay.num_agents == replay.num_stem_cells + replay.num_molecules
+        replay.step()
+    assert shown == [0 , 2 , 4]
+    assert ReplayModel(str(tmp_path) , start_tick=1).tick == 2
+
+
+def test_rasterize_and_write_png(smallModel, tmp_path):
+    record(smallModel(seed=4) , tmp_path)
+    recording = Recording(str(tmp_path))
+    image = rasterize(recording.frame(0) , recording.space , PALETTE , width=120 , height=80)
+    assert image.shape == (80 , 120 , 3) and image.dtype == np.uint8
+    #Something was drawn over the white background
+    assert (image != 255).any()
+    path = str(tmp_path / "frame.png")
+    writePNG(path , image)
+    with open(path , "rb") as f:
+        assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+    np.testing.assert_array_equal(readPNG(path) , image)
+
+
+def test_parallel_render_matches_serial(smallModel, tmp_path):
+    record(smallModel(seed=4) , tmp_path / "run")
+    serial , parallel = tmp_path / "serial" , tmp_path / "parallel"
+    assert renderFrames(str(tmp_path / "run") , str(serial) , width=64 , height=64 , processes=1) == TICKS + 1
+    assert renderFrames(str(tmp_path / "run") , str(parallel) , width=64 , height=64 , processes=2) == TICKS + 1
+    names = sorted(os.listdir(serial))
+    assert names == sorted(os.listdir(parallel)) and len(names) == TICKS + 1
+    for name in names:
+        assert (serial / name).read_bytes() == (parallel / name).read_bytes()
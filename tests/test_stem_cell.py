@@ -0,0 +1,18 @@
+import Constants
+from StemCellABM import StemCell
+
+
+def test_time_for_diff_defaults_to_cells_stream(smallModel):
+    #StemCell(id , model) still works, drawing its timer from the "cells" stream only
+    first , second = smallModel(seed=11) , smallModel(seed=11)
+    before = {name : rng.bit_generator.state for name , rng in first.rngs.items()}
+    timers = []
+    for model in (first , second):
+        model.currentIDNum += 1
+        cell = StemCell(model.currentIDNum , model)
+        assert Constants.TIME_FOR_DIFF_UPPER - 10 <= cell.time_for_diff <= Constants.TIME_FOR_DIFF_UPPER
+        timers.append(cell.time_for_diff)
+    assert timers[0] == timers[1]
+    for name , rng in first.rngs.items():
+        assert (rng.bit_generator.state == before[name]) == (name != "cells")
+    assert StemCell(first.currentIDNum + 1 , first , 4).time_for_diff == 4